@@ -4,8 +4,10 @@ from flask import Flask, render_template, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 import tempfile
 import shutil
+from document_context import DocumentContext
 from factura_processor import FacturaProcessor
 from main import detect_factura_type
+from ubl_ingest import ingest_file, document_type
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
@@ -15,7 +17,8 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-ALLOWED_EXTENSIONS = {'pdf'}
+# PDF, DIAN UBL XML, or the vendor's ZIP bundle (PDF + XML)
+ALLOWED_EXTENSIONS = {'pdf', 'xml', 'zip'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -35,25 +38,44 @@ def upload_file():
             return jsonify({'success': False, 'error': 'No file selected'}), 400
         
         if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': 'Only PDF files are allowed'}), 400
+            return jsonify({'success': False, 'error': 'Only PDF, XML or ZIP files are allowed'}), 400
         
         # Save uploaded file
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
         
-        # Detect invoice type
-        factura_type = detect_factura_type(file_path)
-        
-        if factura_type == "desconocido":
+        # Electronic invoice: UBL XML (alone, in the ZIP or attached to the PDF), no OCR
+        xml_data, pdf_path, temp_dir = ingest_file(file_path)
+        if xml_data:
+            factura_type, success, data, text_source = document_type(xml_data), True, xml_data, "xml_ubl"
+            field_confidence, review_fields = {}, []
+        elif pdf_path is None:
             return jsonify({
-                'success': False, 
-                'error': 'Could not detect invoice type. Please try again or select manually.',
+                'success': False,
+                'error': 'The file contains neither a DIAN XML nor a PDF.',
                 'file_path': file_path
             }), 400
-        
-        # Process invoice
-        success, data = FacturaProcessor.process_factura(file_path, factura_type)
+        else:
+            # Shared context: detection OCR is reused by extraction
+            with DocumentContext(pdf_path) as context:
+                if temp_dir:
+                    context.add_temp_dir(temp_dir)
+                # Detect invoice type
+                factura_type = detect_factura_type(pdf_path, context=context)
+                
+                if factura_type == "desconocido":
+                    return jsonify({
+                        'success': False, 
+                        'error': 'Could not detect invoice type. Please try again or select manually.',
+                        'file_path': file_path
+                    }), 400
+                
+                # Process invoice
+                success, data = FacturaProcessor.process_factura(pdf_path, factura_type, context=context)
+                text_source = context.text_source
+                # Per-field OCR confidence; low-confidence or missing fields need human review
+                field_confidence, review_fields = context.field_confidence, context.review_fields
         
         if not success:
             return jsonify({
@@ -75,7 +97,10 @@ def upload_file():
             'invoice_type': factura_type,
             'filename': filename,
             'csv_content': csv_content,
-            'file_path': file_path
+            'file_path': file_path,
+            'text_source': text_source,
+            'field_confidence': field_confidence,
+            'review_fields': review_fields
         })
     
     except Exception as e:
@@ -101,7 +126,7 @@ def process_batch():
             if not allowed_file(file.filename):
                 errors.append({
                     'filename': file.filename,
-                    'error': 'Only PDF files are allowed'
+                    'error': 'Only PDF, XML or ZIP files are allowed'
                 })
                 continue
             
@@ -110,24 +135,45 @@ def process_batch():
                 file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                 file.save(file_path)
                 
-                # Detect invoice type
-                factura_type = detect_factura_type(file_path)
-                
-                if factura_type == "desconocido":
+                # Electronic invoice: UBL XML (alone, in the ZIP or attached to the PDF), no OCR
+                xml_data, pdf_path, temp_dir = ingest_file(file_path)
+                if xml_data:
+                    factura_type, success, data, text_source = document_type(xml_data), True, xml_data, "xml_ubl"
+                    field_confidence, review_fields = {}, []
+                elif pdf_path is None:
                     errors.append({
                         'filename': filename,
-                        'error': 'Could not detect invoice type'
+                        'error': 'The file contains neither a DIAN XML nor a PDF'
                     })
                     continue
-                
-                # Process invoice
-                success, data = FacturaProcessor.process_factura(file_path, factura_type)
+                else:
+                    # Shared context: detection OCR is reused by extraction
+                    with DocumentContext(pdf_path) as context:
+                        if temp_dir:
+                            context.add_temp_dir(temp_dir)
+                        # Detect invoice type
+                        factura_type = detect_factura_type(pdf_path, context=context)
+                        
+                        if factura_type == "desconocido":
+                            errors.append({
+                                'filename': filename,
+                                'error': 'Could not detect invoice type'
+                            })
+                            continue
+                        
+                        # Process invoice
+                        success, data = FacturaProcessor.process_factura(pdf_path, factura_type, context=context)
+                        text_source = context.text_source
+                        field_confidence, review_fields = context.field_confidence, context.review_fields
                 
                 if success:
                     results.append({
                         'filename': filename,
                         'invoice_type': factura_type,
-                        'data': data
+                        'data': data,
+                        'text_source': text_source,
+                        'field_confidence': field_confidence,
+                        'review_fields': review_fields
                     })
                 else:
                     errors.append({
@@ -0,0 +1,125 @@
+import re
+import cv2
+import numpy as np
+from field_spec import monto_mixto
+from preprocessing import to_gray
+
+
+# Resoluciones para buscar el código, de menor a mayor: casi siempre basta la primera
+QR_DPIS = (100, 150)
+
+# Claves del contenido del QR de la factura electrónica (anexo técnico DIAN,
+# versiones 1.7 y 1.8) → nombres de campo estándar de los extractores
+QR_FIELDS = {
+    "numfac": "numero_factura",
+    "nrofactura": "numero_factura",
+    "fecfac": "fecha_emision",
+    "fechafactura": "fecha_emision",
+    "nitfac": "nit_emisor",
+    "nitfacturador": "nit_emisor",
+    "docadq": "nit_cliente",
+    "nitadquiriente": "nit_cliente",
+    "valfac": "subtotal",
+    "valorfactura": "subtotal",
+    "valiva": "iva",
+    "valoriva": "iva",
+    "valtolfac": "valor_total",
+    "valortotalfactura": "valor_total",
+    "cufe": "cufe",
+}
+AMOUNT_FIELDS = ("subtotal", "iva", "valor_total")
+NIT_FIELDS = ("nit_emisor", "nit_cliente")
+
+PAYLOAD_ITEM = re.compile(r"([A-Za-z]+)\s*[:=]\s*(\S+)")
+# Algunos emisores solo codifican la URL de consulta con el CUFE
+DOCUMENT_KEY = re.compile(r"documentkey=([0-9a-fA-F]{64,})")
+COMPACT_DATE = re.compile(r"^(\d{4})(\d{2})(\d{2})$")
+
+
+def parse_payload(payload):
+    """
+    Campos estándar a partir del texto del QR DIAN ("NumFac: ...", "ValTolFac: ...").
+    Los montos quedan en el formato de los extractores ("1.234,56"), los NIT solo
+    con dígitos (sin DV) y las fechas como "AAAA-MM-DD"; cada formato los lleva a
+    su forma con el bloque "qr" de su spec (FieldMatcher.from_qr).
+    {} si el texto no es el de una factura electrónica.
+    """
+    fields = {}
+    for key, value in PAYLOAD_ITEM.findall(payload or ""):
+        name = QR_FIELDS.get(key.lower())
+        if name and name not in fields:
+            fields[name] = value.strip()
+    if "cufe" not in fields:
+        m = DOCUMENT_KEY.search(payload or "")
+        if m:
+            fields["cufe"] = m.group(1)
+    if "numero_factura" not in fields and "cufe" not in fields:
+        return {}
+    for name in AMOUNT_FIELDS:
+        if name in fields:
+            fields[name] = monto_mixto(fields[name])
+    for name in NIT_FIELDS:
+        if name in fields:
+            fields[name] = re.sub(r"\D", "", fields[name].partition("-")[0])
+    if "fecha_emision" in fields:
+        fields["fecha_emision"] = COMPACT_DATE.sub(r"\1-\2-\3", fields["fecha_emision"])
+    return {name: value for name, value in fields.items() if value}
+
+
+def decode_qr(image):
+    """
+    Texto del primer código QR de la imagen (escala de grises), o None.
+    Si el código se ubica pero no se lee (módulos de 1-2 px a baja resolución),
+    se reintenta con el recorte ampliado.
+    """
+    detector = cv2.QRCodeDetector()
+    payload, points, _ = detector.detectAndDecode(image)
+    if payload:
+        return payload
+    if points is None:
+        return None
+    x, y, w, h = cv2.boundingRect(points.reshape(-1, 2).astype(np.float32))
+    pad = max(w, h) // 4
+    crop = image[max(0, y - pad):y + h + pad, max(0, x - pad):x + w + pad]
+    if crop.size == 0:
+        return None
+    crop = cv2.resize(crop, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    payload, _, _ = detector.detectAndDecode(crop)
+    return payload or None
+
+
+def read_document_qr(extractor):
+    """
+    Campos del código QR DIAN del documento ({} si no tiene). Se busca en la
+    primera y la última página rasterizadas a baja resolución, sin OCR.
+    El resultado queda en el contexto del documento y en la caché OCR.
+    """
+    context = extractor.context
+    if context.qr_fields is not None:
+        return context.qr_fields
+    base_key = extractor._cache_key(quick=True, use_text_layer=False)
+    cache_key = f"{base_key}|qr" if base_key else None
+    cached = extractor.ocr_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        context.qr_fields = cached["fields"]
+        return context.qr_fields
+    fields = {}
+    try:
+        page_count = extractor._page_count()
+        pages = [1] if page_count == 1 else [1, page_count]
+        for dpi in QR_DPIS:
+            for page in pages:
+                fields = parse_payload(decode_qr(to_gray(extractor._get_page_image(dpi, page))))
+                if fields:
+                    print(f"Código QR DIAN en la página {page} ({dpi} dpi): {', '.join(fields)}")
+                    break
+            if fields:
+                break
+    except Exception as e:
+        # Sin guardar en caché: el error puede ser pasajero (Poppler, archivo bloqueado)
+        print(f"Error leyendo el código QR: {e}")
+        return {}
+    context.qr_fields = fields
+    if cache_key:
+        extractor.ocr_cache.put(cache_key, {"fields": fields})
+    return fields
@@ -0,0 +1,143 @@
+import os
+import shutil
+import hashlib
+
+
+class DocumentContext:
+    """
+    Contexto compartido de un documento durante detección y extracción.
+    Guarda las páginas rasterizadas y el texto OCR por página y resolución,
+    para que cada página se procese con OCR como máximo una vez por dpi.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # dpi -> {número de página: imagen}
+        self.page_images = {}
+        # dpi -> True si las imágenes cubren todas las páginas del documento
+        self.complete_images = {}
+        # (dpi, número de página) o (dpi, página, zona) -> texto OCR limpio
+        self.page_texts = {}
+        # (dpi, número de página) o (dpi, página, zona) -> PageWords (palabras con caja y confianza)
+        self.page_words = {}
+        # Número de páginas del documento (None si aún no se conoce)
+        self.page_count = None
+        # número de página -> (ancho, alto) en puntos, ya rotada
+        self.page_sizes = {}
+        # dpi elegido por el modo adaptativo (None si aún no se calculó)
+        self.adaptive_dpi = None
+        # quick (bool) -> lista de páginas de la capa de texto, o None si no es utilizable
+        self.text_layer = {}
+        # quick (bool) -> páginas de pdftotext sin limpiar (conservan los saltos de línea)
+        self.text_layer_raw = {}
+        # Ruta usada en la última extracción: "capa_texto" u "ocr"
+        self.text_source = None
+        # Tipo de factura detectado (si ya se detectó)
+        self.factura_type = None
+        # Candidatos de la detección: [(tipo, puntaje, [claves])]
+        self.detection_candidates = []
+        # Campos del código QR DIAN ({} si no tiene; None si aún no se buscó)
+        self.qr_fields = None
+        # Confianza por campo (0-100; None si no se pudo ubicar) y campos para revisión humana
+        self.field_confidence = {}
+        self.review_fields = []
+        self._pdf_bytes = None
+        self._digest = None
+        self._temp_dirs = []
+
+    def get_pdf_bytes(self):
+        """Contenido del archivo, leído una sola vez por documento."""
+        if self._pdf_bytes is None:
+            with open(self.file_path, "rb") as f:
+                self._pdf_bytes = f.read()
+        return self._pdf_bytes
+
+    def get_digest(self):
+        """SHA-256 (hex) del archivo, calculado una sola vez (claves de la caché OCR)."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.get_pdf_bytes()).hexdigest()
+        return self._digest
+
+    # Imágenes rasterizadas
+    def get_page_images(self, dpi, first_only=False):
+        """Devuelve las imágenes en caché para un dpi, o None si no cubren lo pedido."""
+        pages = self.page_images.get(dpi)
+        if not pages:
+            return None
+        if first_only:
+            return [pages[1]] if 1 in pages else None
+        if not self.complete_images.get(dpi):
+            return None
+        return [pages[page] for page in sorted(pages)]
+
+    def get_page_image(self, dpi, page):
+        """Imagen de una sola página (numerada desde 1), o None si no está en caché."""
+        return self.page_images.get(dpi, {}).get(page)
+
+    def add_page_images(self, dpi, images, temp_dir=None, complete=True, first_page=1):
+        """Registra las imágenes de un dpi y el directorio temporal que las contiene."""
+        pages = self.page_images.setdefault(dpi, {})
+        for page, image in enumerate(images, start=first_page):
+            pages[page] = image
+        if complete:
+            self.complete_images[dpi] = True
+            self.page_count = len(pages)
+        if temp_dir:
+            self._temp_dirs.append(temp_dir)
+
+    # Texto OCR por página (o por zona de una página)
+    def get_page_text(self, dpi, page, zone=None):
+        key = (dpi, page) if zone is None else (dpi, page, tuple(zone))
+        return self.page_texts.get(key)
+
+    def set_page_text(self, dpi, page, text, zone=None):
+        key = (dpi, page) if zone is None else (dpi, page, tuple(zone))
+        self.page_texts[key] = text
+
+    def add_temp_dir(self, temp_dir):
+        """Directorio temporal que se borra al cerrar el contexto (p. ej. el PDF extraído de un ZIP)."""
+        self._temp_dirs.append(temp_dir)
+
+    # Palabras con caja por página (modo espacial)
+    def get_page_words(self, dpi, page, zone=None):
+        key = (dpi, page) if zone is None else (dpi, page, tuple(zone))
+        return self.page_words.get(key)
+
+    def set_page_words(self, dpi, page, words, zone=None):
+        key = (dpi, page) if zone is None else (dpi, page, tuple(zone))
+        self.page_words[key] = words
+
+    # Capa de texto nativa
+    def get_text_layer(self, quick=False):
+        """
+        Devuelve (encontrado, páginas). Si ya se leyó el documento completo,
+        también sirve para el modo rápido (primera página).
+        """
+        if quick in self.text_layer:
+            return True, self.text_layer[quick]
+        if quick and False in self.text_layer:
+            pages = self.text_layer[False]
+            return True, pages[:1] if pages else None
+        if not quick and True in self.text_layer and self.text_layer[True] is None:
+            # Si la primera página no tiene texto utilizable, el documento tampoco
+            return True, None
+        return False, None
+
+    def set_text_layer(self, pages, quick=False):
+        self.text_layer[quick] = pages
+
+    def close(self):
+        """Elimina los temporales; el texto ya extraído se conserva."""
+        for temp_dir in self._temp_dirs:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                print(f"Directorio temporal eliminado: {temp_dir}")
+        self._temp_dirs = []
+        self.page_images = {}
+        self.complete_images = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
@@ -1,14 +1,7 @@
-from formats.factura_bbi import FacturaExtractorBBI
-from formats.factura_hellen import FacturaExtractorHellen
-from formats.factura_agro import FacturaExtractorAgro
-from formats.factura_taberna import FacturaExtractorTaberna
-from formats.factura_cuotas import FacturaExtractorCuotas
-from formats.factura_yardins import FacturaExtractorYardins
-from formats.factura_latam import FacturaExtractorLatam
-from formats.factura_avianca import FacturaExtractorAvianca
-from formats.factura_procafe import FacturaExtractorProcafe
-from formats.factura_d1 import FacturaExtractorD1
-from formats.factura_adidas import FacturaExtractoradidas
+import os
+from format_registry import FORMATS
+from field_spec import load_spec
+from vendor_registry import get_default_registry
 
 # CLASE PRINCIPAL: FACTURA PROCESSOR
 class FacturaProcessor:
@@ -17,44 +10,329 @@ class FacturaProcessor:
     Gestiona la instancia del extractor correcto según el tipo detectado.
     """
 
-    # Mapa centralizado de extractores disponibles
-    MAPA_EXTRACTORES = {
-        "bbi": FacturaExtractorBBI,
-        "hellen": FacturaExtractorHellen,
-        "agro": FacturaExtractorAgro,
-        "taberna": FacturaExtractorTaberna,
-        "cuotas": FacturaExtractorCuotas,
-        "latam": FacturaExtractorLatam,
-        "yardins": FacturaExtractorYardins,
-        "avianca": FacturaExtractorAvianca,
-        "procafe": FacturaExtractorProcafe,
-        "d1": FacturaExtractorD1,
-        "adidas": FacturaExtractoradidas,
-    }
+    # Mapa centralizado de extractores disponibles (registro de formatos, carga diferida)
+    MAPA_EXTRACTORES = FORMATS
+
+    # Campos que se esperan en el resultado de cualquier extractor
+    CAMPOS_REQUERIDOS = ["fecha_emision", "numero_factura", "valor_total", "subtotal", "iva", "razon_social", "nit_emisor", "nit_cliente"]
+
+    # OCR solo de las zonas declaradas por el formato (OCR_ZONES) antes de la página completa
+    USAR_ZONAS_OCR = True
+
+    # OCR página por página (orden PAGE_PRIORITY del formato) hasta tener todos los campos
+    USAR_OCR_INCREMENTAL = True
+
+    # Campos del código QR DIAN antes de cualquier OCR (factura electrónica)
+    USAR_QR_DIAN = True
+
+    # Cajas de palabras para los specs con reglas espaciales (etiqueta → valor por posición)
+    USAR_CAJAS_PALABRAS = True
+
+    # Confianza OCR por campo y segunda lectura (más dpi) solo de los campos dudosos
+    USAR_CONFIANZA_CAMPOS = True
+
+    # Campo del resultado con los campos que requieren revisión humana (separados por ";")
+    CAMPO_REVISION = "campos_revision"
+
+    # Invariantes aritméticas del formato (subtotal + iva ≈ valor_total, ...) sobre el resultado
+    USAR_VALIDACION = True
+
+    # Campo del resultado con la clasificación: consistente, reparable o fallida
+    CAMPO_VALIDACION = "validacion"
+
+    # Nivel costoso para los documentos fallidos: relectura a este dpi, solo de los campos afectados
+    DPI_REPROCESO = 600
+
+    # Texto de cada documento procesado en el almacén OCR (re-extracción masiva sin OCR)
+    USAR_ALMACEN_OCR = True
+
+    @staticmethod
+    def _usa_cajas_palabras(extractor):
+        """True si el spec de campos del extractor declara reglas espaciales."""
+        if not FacturaProcessor.USAR_CAJAS_PALABRAS or not hasattr(extractor, "extract_words"):
+            return False
+        name = getattr(extractor, "FIELD_SPEC", None)
+        if not name:
+            return False
+        try:
+            return load_spec(name).spatial
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer el spec de campos {name}: {e}")
+            return False
+
+    @staticmethod
+    def _campos_faltantes(data, requeridos=None):
+        """
+        Campos requeridos que el extractor devolvió vacíos. Los extractores devuelven
+        "0,00" cuando no encuentran un monto, así que también cuenta como faltante.
+        Si el formato declara campos requeridos en el registro, esos deben estar todos.
+        """
+        missing = [
+            field for field in FacturaProcessor.CAMPOS_REQUERIDOS
+            if field in data and (not data[field] or data[field] == "0,00")
+        ]
+        for field in requeridos or ():
+            if field not in missing and (not data.get(field) or data[field] == "0,00"):
+                missing.append(field)
+        return missing
+
+    @staticmethod
+    def _extraer_por_zonas(extractor, requeridos=None):
+        """
+        Aplica OCR solo a las zonas del formato. Si con ese texto se encuentran todos
+        los campos, lo deja como texto del extractor; si falta alguno, no deja nada
+        y el flujo normal procesa las páginas completas.
+        """
+        if not getattr(extractor, "OCR_ZONES", None) or extractor.text:
+            return False
+        context = extractor.context
+        found, pages = context.get_text_layer(quick=False)
+        if context.text_source == "capa_texto" or (found and pages):
+            # El PDF tiene texto nativo: no hace falta OCR de ningún tipo
+            return False
+
+        zone_text = extractor.extract_zones()
+        if not zone_text:
+            return False
+        extractor.text = zone_text
+        data = extractor.extract_data()
+        missing = FacturaProcessor._campos_faltantes(data, requeridos)
+        if missing:
+            print(f"OCR por zonas incompleto ({', '.join(missing)}). Se procesarán las páginas completas.")
+            extractor.text = ""
+            return False
+        extractor.text_source = context.text_source = "ocr_zonas"
+        # Las cajas de las zonas sirven para la confianza por campo (no se leen las páginas completas)
+        extractor.words = extractor.zone_words()
+        print("Todos los campos encontrados con OCR por zonas.")
+        return True
+
+    @staticmethod
+    def _extraer_por_qr(extractor, requeridos=None):
+        """
+        Lee el código QR DIAN y deja sus campos en extractor.known_fields, para que
+        el extractor solo busque en el texto los que el QR no trae. Los valores se
+        convierten a la forma del formato con su spec (FieldMatcher.from_qr). La
+        razón social sale del registro de proveedores por el NIT del emisor.
+        Retorna True si con eso están todos los campos requeridos (no hace falta OCR).
+        """
+        from dian_qr import read_document_qr
+        fields = read_document_qr(extractor)
+        if not fields:
+            return False
+        name = getattr(extractor, "FIELD_SPEC", None)
+        known = load_spec(name).from_qr(fields) if name else dict(fields)
+        vendor = get_default_registry().lookup(fields["nit_emisor"]) if fields.get("nit_emisor") else None
+        if vendor and vendor.get("name"):
+            known.setdefault("razon_social", vendor["name"])
+        extractor.known_fields = known
+        missing = [field for field in requeridos or FacturaProcessor.CAMPOS_REQUERIDOS if not known.get(field)]
+        if missing:
+            print(f"Código QR DIAN sin {', '.join(missing)}: se buscarán en el texto.")
+            return False
+        extractor.text_source = extractor.context.text_source = "qr_dian"
+        print("Todos los campos encontrados en el código QR DIAN; se omite el OCR.")
+        return True
+
+    @staticmethod
+    def _puntuar_campos(extractor, data):
+        """
+        Confianza de cada campo del spec a partir de las palabras del OCR. Los campos
+        con confianza baja se releen a mayor resolución solo en su caja (montos y NIT
+        con lista blanca de dígitos); los que siguen dudosos o faltan quedan en
+        data["campos_revision"]. La confianza por campo queda en el contexto.
+        """
+        from field_confidence import score_fields, refine_fields, needs_review
+        name = getattr(extractor, "FIELD_SPEC", None)
+        if not name:
+            return data
+        matcher = load_spec(name)
+        results = matcher.extract_detail(extractor.text, words=extractor.words, known=extractor.known_fields)
+        exact = extractor.text_source in ("capa_texto", "qr_dian")
+        scores = score_fields(results, data, extractor.words, exact=exact)
+        if not exact and extractor.words is not None:
+            for field, score in refine_fields(extractor, matcher, scores).items():
+                data[field] = score.value
+                scores[field] = score
+        extractor.field_scores = scores
+        revision = needs_review(scores)
+        context = extractor.context
+        context.field_confidence = {field: score.confidence for field, score in scores.items()}
+        context.review_fields = revision
+        data[FacturaProcessor.CAMPO_REVISION] = "; ".join(revision)
+        if revision:
+            detail = ", ".join(
+                f"{field} ({scores[field].confidence:.0f})" if scores[field].confidence is not None else field
+                for field in revision
+            )
+            print(f"Campos para revisión: {detail}")
+        return data
+
+    @staticmethod
+    def _campos_no_encontrados(extractor, matcher):
+        """
+        Campos que los patrones no encontraron (no los que se leyeron como "0,00"):
+        los únicos que la validación puede deducir de los demás montos.
+        """
+        scores = getattr(extractor, "field_scores", None)
+        if scores:
+            return [field for field, score in scores.items() if score.source == "faltante"]
+        results = matcher.extract_detail(
+            extractor.text, words=getattr(extractor, "words", None), known=getattr(extractor, "known_fields", None)
+        )
+        return [field for field, result in results.items() if result.source == "defecto"]
+
+    @staticmethod
+    def _validar(extractor, data):
+        """
+        Clasifica el resultado con las invariantes del formato: consistente,
+        reparable (los montos no encontrados o dudosos se deducen de los demás,
+        y quedan para revisión) o fallida. Solo los documentos fallidos pasan al nivel costoso, y solo con
+        los campos afectados: relectura a DPI_REPROCESO de sus cajas. Lo que
+        siga sin cuadrar se agrega a los campos para revisión.
+        """
+        from validation import validate, apply_repairs, FALLIDA
+        name = getattr(extractor, "FIELD_SPEC", None)
+        if not name:
+            return data
+        matcher = load_spec(name)
+        context = extractor.context
+        review = list(getattr(context, "review_fields", []))
+        missing = FacturaProcessor._campos_no_encontrados(extractor, matcher)
+        result = validate(data, matcher.invariants, doubtful=review, missing=missing)
+
+        scores = getattr(extractor, "field_scores", {})
+        words = getattr(extractor, "words", None)
+        if result.status == FALLIDA and words is not None and extractor.text_source not in ("capa_texto", "qr_dian"):
+            from field_confidence import refine_fields
+            affected = {field: scores[field] for field in result.affected if field in scores}
+            print(f"Validación fallida ({', '.join(result.affected)}): relectura a {FacturaProcessor.DPI_REPROCESO} dpi.")
+            reread = refine_fields(extractor, matcher, affected, dpi=FacturaProcessor.DPI_REPROCESO, force=True)
+            # Primero cada relectura por separado (casi siempre hay un solo monto mal leído), luego todas
+            options = [[field] for field in reread] + ([list(reread)] if len(reread) > 1 else [])
+            for fields in options:
+                candidate = dict(data, **{field: reread[field].value for field in fields})
+                retry = validate(
+                    candidate, matcher.invariants,
+                    doubtful=[f for f in review if f not in fields],
+                    missing=[f for f in missing if f not in fields],
+                )
+                if retry.status != FALLIDA:
+                    for field in fields:
+                        print(f"Campo {field} releído a {FacturaProcessor.DPI_REPROCESO} dpi: {data[field]!r} → {candidate[field]!r}")
+                        scores[field] = reread[field]
+                    data, result = candidate, retry
+                    review = [field for field in review if field not in fields]
+                    break
+
+        if result.repairs:
+            print(f"Montos reparados por las invariantes: {', '.join(result.repairs)}")
+            apply_repairs(data, result)
+            # Un monto deducido no se leyó del documento: siempre pasa por revisión
+            review += [field for field in result.repairs if field not in review]
+        if result.status == FALLIDA:
+            review += [field for field in result.affected if field not in review]
+            print(f"Validación fallida: revisar {', '.join(result.affected)}")
+        context.review_fields = review
+        if review or FacturaProcessor.CAMPO_REVISION in data:
+            data[FacturaProcessor.CAMPO_REVISION] = "; ".join(review)
+        data[FacturaProcessor.CAMPO_VALIDACION] = result.status
+        return data
+
+    @staticmethod
+    def _guardar_en_almacen(extractor, factura_type, data, extraido):
+        """
+        Guarda el texto, las palabras, los campos conocidos y el resultado en el
+        almacén OCR. Los campos que la relectura o la validación cambiaron respecto
+        a los patrones (`extraido`) se guardan como correcciones, para que la
+        re-extracción masiva no las pierda.
+        """
+        from ocr_store import get_default_store
+        store = get_default_store()
+        context = extractor.context
+        if store is None or context is None or not hasattr(extractor, "text"):
+            return
+        try:
+            digest = context.get_digest()
+        except OSError as e:
+            print(f"No se pudo leer el documento para el almacén OCR: {e}")
+            return
+        words = getattr(extractor, "words", None)
+        overrides = {
+            field: [value, data[field]]
+            for field, value in extraido.items() if field in data and data[field] != value
+        }
+        store.put(
+            digest, factura_type, extractor.text,
+            text_source=extractor.text_source,
+            words=words.to_dict() if words is not None else None,
+            known=getattr(extractor, "known_fields", {}),
+            overrides=overrides, data=data,
+            file_name=os.path.basename(extractor.file_path),
+        )
 
     @staticmethod
-    def process_factura(file_path, factura_type="desconocido"):
+    def process_factura(file_path, factura_type="desconocido", context=None):
+        """
+        Procesa la factura con el extractor del tipo indicado.
+        Si se recibe un DocumentContext (el mismo usado en la detección),
+        el extractor reutiliza sus páginas rasterizadas y su texto OCR.
+        """
         if not factura_type or factura_type.lower() == "desconocido":
             print("Tipo de factura no reconocido o vacío.")
             return False, {}
 
         tipo_normalizado = factura_type.strip().lower()       
+        FORMATS.refresh_json_formats()
         if tipo_normalizado not in FacturaProcessor.MAPA_EXTRACTORES:
             print(f"Tipo de factura no soportado: {factura_type}")
             print(f"Tipos válidos: {', '.join(FacturaProcessor.MAPA_EXTRACTORES.keys())}")
             return False, {}
-        extractor_class = FacturaProcessor.MAPA_EXTRACTORES[tipo_normalizado]
+        requeridos = FORMATS.required_fields(tipo_normalizado)
+        extractor = None
         
         try:
+            # El módulo del formato se importa aquí la primera vez que se usa
+            extractor_class = FacturaProcessor.MAPA_EXTRACTORES[tipo_normalizado]
             print(f"Iniciando procesamiento con extractor: {extractor_class.__name__}")
-            extractor = extractor_class(file_path)
+            extractor = extractor_class(file_path, context=context)
+            # El OCR de páginas completas devuelve también las cajas de palabras
+            cajas_palabras = FacturaProcessor._usa_cajas_palabras(extractor)
+            confianza = FacturaProcessor.USAR_CONFIANZA_CAMPOS and hasattr(extractor, "extract_words")
+            extractor.word_boxes = cajas_palabras or confianza
 
-            # Paso 1: Extraer texto si es necesario
-            if hasattr(extractor, "extract_text") and not extractor.text:
+            # Paso QR: factura electrónica con código QR DIAN, sin OCR
+            if FacturaProcessor.USAR_QR_DIAN and hasattr(extractor, "known_fields"):
+                if FacturaProcessor._extraer_por_qr(extractor, requeridos):
+                    data = extractor.extract_data()
+                    for field, value in extractor.known_fields.items():
+                        data.setdefault(field, value)
+                    extraido = dict(data)
+                    if confianza:
+                        data = FacturaProcessor._puntuar_campos(extractor, data)
+                    if FacturaProcessor.USAR_VALIDACION:
+                        data = FacturaProcessor._validar(extractor, data)
+                    if FacturaProcessor.USAR_ALMACEN_OCR:
+                        FacturaProcessor._guardar_en_almacen(extractor, tipo_normalizado, data, extraido)
+                    print(f"Extracción completada: {len(data)} campos encontrados.")
+                    return True, data
+
+            # Paso 0: OCR solo de las zonas del formato (si falta algún campo, página completa)
+            if FacturaProcessor.USAR_ZONAS_OCR and hasattr(extractor, "extract_zones"):
+                FacturaProcessor._extraer_por_zonas(extractor, requeridos)
+
+            # Paso 1: Extraer texto si es necesario (incremental: se detiene al completar los campos)
+            if FacturaProcessor.USAR_OCR_INCREMENTAL and hasattr(extractor, "extract_text_incremental") and not extractor.text:
+                print("Extrayendo texto del documento (OCR incremental)...")
+                extractor.extract_text_incremental(lambda data: not FacturaProcessor._campos_faltantes(data, requeridos))
+            elif hasattr(extractor, "extract_text") and not extractor.text:
                 print("Extrayendo texto del documento...")
                 extractor.extract_text()
             elif hasattr(extractor, "extract_text") and extractor.text:
                 print("Texto ya extraído, omitiendo paso de extracción.")
+            # Con OCR por zonas ya están todos los campos: no se leen las páginas completas
+            if extractor.word_boxes and extractor.text_source != "ocr_zonas":
+                extractor.extract_words()
 
             # Paso 2: Ejecutar el metodo principal
             if hasattr(extractor, "process"):
@@ -75,8 +353,19 @@ class FacturaProcessor:
                 print(f"El extractor {extractor_class.__name__} devolvió un diccionario vacío.")
                 return False, {}
 
-            required_fields = ["fecha_emision", "numero_factura", "valor_total", "subtotal", "iva", "razon_social", "nit_emisor", "nit_cliente"]
-            missing_fields = [field for field in required_fields if field not in data]
+            # Campos del QR que el spec del formato no declara (CUFE, NIT del adquiriente, ...)
+            for field, value in getattr(extractor, "known_fields", {}).items():
+                data.setdefault(field, value)
+
+            extraido = dict(data)
+            if confianza:
+                data = FacturaProcessor._puntuar_campos(extractor, data)
+            if FacturaProcessor.USAR_VALIDACION:
+                data = FacturaProcessor._validar(extractor, data)
+            if FacturaProcessor.USAR_ALMACEN_OCR:
+                FacturaProcessor._guardar_en_almacen(extractor, tipo_normalizado, data, extraido)
+
+            missing_fields = [field for field in FacturaProcessor.CAMPOS_REQUERIDOS if field not in data]
             if missing_fields:
                 print(f"Campos faltantes en {extractor_class.__name__}: {', '.join(missing_fields)}")
 
@@ -88,4 +377,8 @@ class FacturaProcessor:
             import traceback
             traceback.print_exc()
             return False, {}
+        finally:
+            # Un contexto propio del extractor se cierra una sola vez, al terminar el documento
+            if extractor is not None and hasattr(extractor, "close"):
+                extractor.close()
         
\ No newline at end of file
@@ -0,0 +1,198 @@
+import os
+import re
+from collections import namedtuple
+from word_boxes import GEOMETRY_MARGIN, PageWords, normalize_token, parse_tsv, get_default_geometry
+
+
+# Confianza de Tesseract (0-100) bajo la cual un campo se vuelve a leer y, si no
+# mejora, queda marcado para revisión
+MIN_CONFIDENCE = float(os.environ.get("FIELD_MIN_CONFIDENCE", "60"))
+# Resolución del segundo OCR, solo sobre la caja de cada campo
+REFINE_DPI = 400
+# Margen alrededor de la caja del valor, en altos de la caja
+REFINE_MARGIN = 0.6
+# Tokens más cortos no se buscan dentro de otras palabras ("0" aparece en todas partes)
+MIN_EMBEDDED_TOKEN = 4
+
+AMOUNT_FIELDS = ("subtotal", "iva", "valor_total")
+# Los montos y documentos se releen solo con dígitos y separadores
+DIGIT_WHITELIST = "0123456789.,-"
+DIGIT_VALUE = re.compile(r"\d[\d.,\-]*\d|\d")
+ANY_VALUE = re.compile(r"\S.*\S|\S")
+# Un recorte es un solo renglón
+LINE_CONFIG = "--psm 7"
+
+# Valor final del campo, confianza (0-100; None si no se pudo ubicar en las cajas),
+# origen ("conocido", "espacial", "texto", "refinado" o "faltante") y, si se conoce,
+# página (índice desde 0) y caja del valor en unidades de esa página
+FieldScore = namedtuple("FieldScore", "value confidence source page box")
+
+
+def is_digit_field(name):
+    """Montos, NIT y cédulas: campos que se releen con la lista blanca de dígitos."""
+    return name in AMOUNT_FIELDS or name.startswith(("nit", "cc_"))
+
+
+def is_missing(value):
+    return not value or value == "0,00"
+
+
+def locate(raw, words):
+    """
+    (índice de página, caja, confianza) de las palabras del texto capturado `raw`.
+    Si el mismo texto aparece varias veces se toma la lectura más confiable: otra
+    aparición legible confirma el valor. None si no se encuentra.
+    """
+    tokens = [token for token in (normalize_token(part) for part in raw.split()) if token]
+    if not tokens:
+        return None
+    best = None
+    for p in words.page_numbers():
+        page = words.pages[p]
+        runs = page.find_runs(tokens)
+        if not runs and len(tokens) == 1 and len(tokens[0]) >= MIN_EMBEDDED_TOKEN:
+            # Valor pegado a su etiqueta en una misma palabra ("NIT:900123456")
+            runs = [[i] for i, token in enumerate(page.tokens) if tokens[0] in token]
+        for run in runs:
+            confidence = min(page.words[i].conf for i in run)
+            if best is None or confidence > best[2]:
+                best = (p, page.box(run), confidence)
+    if best is None and len(tokens) > 1:
+        # Valor partido en varios renglones: la confianza es la del token más dudoso
+        found = [locate(token, words) for token in tokens]
+        if all(found):
+            return None, None, min(hit[2] for hit in found)
+    return best
+
+
+def score_fields(results, data, words=None, exact=False):
+    """
+    Confianza de cada campo a partir de los FieldResult del spec (ver
+    FieldMatcher.extract_detail) y las cajas de palabras. `data` es el
+    resultado final del extractor: si cambió un valor, se ubica ese valor.
+    Con `exact` (capa de texto del PDF) todo lo encontrado vale 100.
+    """
+    scores = {}
+    for name, result in results.items():
+        value = data.get(name, result.value)
+        # Un "0,00" leído del documento (IVA exento) es un valor; faltante es lo que los patrones no encontraron
+        if not value or result.source == "defecto":
+            scores[name] = FieldScore(value, None, "faltante", None, None)
+        elif exact or result.source == "conocido":
+            scores[name] = FieldScore(value, 100.0, result.source, result.page, result.box)
+        elif words is None:
+            scores[name] = FieldScore(value, None, result.source, None, None)
+        elif value == result.value and result.box is not None:
+            page = words.pages[result.page]
+            inside = page.within(result.box)
+            confidence = min((page.words[i].conf for i in inside), default=None)
+            scores[name] = FieldScore(value, confidence, result.source, result.page, result.box)
+        else:
+            hit = locate(result.raw if value == result.value else str(value), words)
+            if hit:
+                scores[name] = FieldScore(value, hit[2], result.source, hit[0], hit[1])
+            else:
+                scores[name] = FieldScore(value, None, result.source, None, None)
+    return scores
+
+
+def needs_review(scores, threshold=MIN_CONFIDENCE):
+    """Campos faltantes o con confianza desconocida o menor que el umbral."""
+    return [name for name, score in scores.items() if score.confidence is None or score.confidence < threshold]
+
+
+def _target(words, vendor, name, score):
+    """(índice de página, caja normalizada) a releer: la del valor, o la aprendida para el proveedor."""
+    if score.box is not None and score.page is not None:
+        page = words.pages[score.page]
+        x0, y0, x1, y1 = score.box
+        pad = (y1 - y0) * REFINE_MARGIN
+        return score.page, (
+            (x0 - pad) / page.width, (y0 - pad) / page.height,
+            (x1 + pad) / page.width, (y1 + pad) / page.height,
+        )
+    geometry = get_default_geometry()
+    entry = geometry.entries.get(vendor, {}).get(name) if geometry else None
+    if not entry:
+        return None
+    pages = words.page_numbers(entry["page"])
+    if not pages:
+        return None
+    x0, y0, x1, y1 = entry["box"]
+    margin = max(GEOMETRY_MARGIN, (x1 - x0) / 2)
+    return pages[0], (x0 - margin, y0 - GEOMETRY_MARGIN, x1 + margin, y1 + GEOMETRY_MARGIN)
+
+
+def _read_box(extractor, page_index, box, digits, dpi):
+    """PageWords del recorte a `dpi`, con un OCR de un renglón; se guarda en la caché OCR."""
+    config = LINE_CONFIG + (f" -c tessedit_char_whitelist={DIGIT_WHITELIST}" if digits else "")
+    base_key = extractor._cache_key(quick=False, use_text_layer=False)
+    box_key = ",".join(f"{v:.3f}" for v in box)
+    crop_key = f"{base_key}|campo:{page_index}:{box_key}:{dpi}:{int(digits)}" if base_key else None
+    cached = extractor.ocr_cache.get(crop_key) if crop_key else None
+    if cached:
+        return PageWords.from_dict(cached["words"])
+    # Solo la caja a `dpi` (pdftoppm -x/-y/-W/-H), no la página completa
+    crop = extractor._get_zone_image(dpi, page_index + 1, box)
+    if crop.size == 0:
+        return None
+    processed = extractor.preprocess_image(crop)
+    page = parse_tsv(extractor.ocr_backend.image_to_data(processed, lang="spa", config=config))
+    if crop_key:
+        extractor.ocr_cache.put(crop_key, {"words": page.to_dict(), "source": "ocr_campo"})
+    return page
+
+
+def _parse_value(field, page, digits):
+    """(valor postprocesado, confianza de sus palabras) leído en el recorte, o None."""
+    if not len(page):
+        return None
+    indices = [i for line in sorted(page.lines) for i in page.lines[line]]
+    # Con la lista blanca no se leen etiquetas: los patrones espaciales solo para texto libre
+    patterns = [DIGIT_VALUE] if digits else [rule.pattern for rule in field.spatial] + [ANY_VALUE]
+    for pattern in patterns:
+        hit = page.match(indices, pattern)
+        if hit:
+            match, box = hit
+            confidence = min((page.words[i].conf for i in page.within(box)), default=0.0)
+            return field.value(match), confidence
+    return None
+
+
+def refine_fields(extractor, matcher, scores, threshold=MIN_CONFIDENCE, dpi=REFINE_DPI, force=False):
+    """
+    Segundo OCR, a `dpi` y con un renglón por recorte, solo de las cajas de los
+    campos con confianza menor que el umbral; los faltantes se releen en la caja
+    aprendida para el proveedor (FieldGeometry), si la hay. Los montos y NIT se
+    leen con la lista blanca de dígitos. Retorna {campo: FieldScore} con los
+    campos cuya nueva lectura es más confiable que la anterior; con `force`,
+    todos los recibidos y cualquier lectura nueva (quien llama decide si sirve).
+    """
+    words = extractor.words
+    if words is None:
+        return {}
+    improved = {}
+    for name, score in scores.items():
+        if not force and score.confidence is not None and score.confidence >= threshold:
+            continue
+        field = matcher.by_name.get(name)
+        target = _target(words, matcher.name, name, score) if field else None
+        if target is None:
+            continue
+        page_index, box = target
+        digits = is_digit_field(name)
+        try:
+            page = _read_box(extractor, page_index, box, digits, dpi)
+        except Exception as e:
+            print(f"Error releyendo el campo {name}: {e}")
+            continue
+        parsed = _parse_value(field, page, digits) if page is not None else None
+        if not parsed or is_missing(parsed[0]) or parsed[0] == field.default:
+            continue
+        value, confidence = parsed
+        if force:
+            improved[name] = FieldScore(value, confidence, "refinado", page_index, None)
+        elif score.confidence is None or confidence > score.confidence:
+            print(f"Campo {name} releído a {dpi} dpi: {score.value!r} → {value!r} (confianza {confidence:.0f})")
+            improved[name] = FieldScore(value, confidence, "refinado", page_index, None)
+    return improved
@@ -0,0 +1,666 @@
+import os
+import re
+import json
+import threading
+from collections import namedtuple
+
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from word_boxes import SpatialRule, get_default_geometry
+from validation import compile_invariants
+from vendor_registry import check_digit
+
+
+SPECS_DIR = os.environ.get(
+    "FIELD_SPECS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "formats", "specs"),
+)
+
+FLAGS = {
+    "IGNORECASE": re.IGNORECASE,
+    "DOTALL": re.DOTALL,
+    "MULTILINE": re.MULTILINE,
+}
+
+MESES = {
+    'ene': '01', 'feb': '02', 'mar': '03', 'abr': '04',
+    'may': '05', 'jun': '06', 'jul': '07', 'ago': '08',
+    'sep': '09', 'oct': '10', 'nov': '11', 'dic': '12'
+}
+
+
+def _format_amount(num):
+    """1234.5 → "1.234,50"."""
+    return f"{num:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# POSTPROCESADORES
+# Cada formato conserva su propia interpretación de los montos; aquí quedan
+# todas en un solo lugar, con nombre, para que los specs las referencien.
+
+def monto_coma_decimal(value):
+    """Punto = miles, coma = decimales (BBI, Cine Colombia)."""
+    if not value:
+        return "0,00"
+    clean = re.sub(r"[^\d,\.]", "", value)
+    clean = clean.replace(".", "").replace(",", ".")
+    try:
+        return _format_amount(float(clean))
+    except ValueError:
+        return "0,00"
+
+
+def monto_mixto(value):
+    """Con punto y coma: europeo; solo coma: decimal; solo punto: decimal (Agrocampo, Yardins)."""
+    if not value:
+        return "0,00"
+    value = re.sub(r'\s+', '', value)
+    clean = re.sub(r"[^\d,\.]", "", value)
+    if ',' in clean and '.' in clean:
+        clean = clean.replace('.', '').replace(',', '.')
+    elif ',' in clean:
+        clean = clean.replace(',', '.')
+    try:
+        return _format_amount(float(clean))
+    except ValueError:
+        return "0,00"
+
+
+def monto_entero(value):
+    """Pesos sin decimales: todos los puntos son de miles (LATAM)."""
+    if not value:
+        return "0,00"
+    value = re.sub(r'\s+', '', value)
+    value = value.replace('$', '').replace('S', '')
+    clean = re.sub(r"[^\d\.]", "", value).replace('.', '')
+    if not clean:
+        return "0,00"
+    try:
+        return f"{int(clean):,}".replace(",", ".") + ",00"
+    except (ValueError, OverflowError):
+        return "0,00"
+
+
+def monto_posicional(value):
+    """El último separador decide: 2 cifras = decimales, 3 cifras = miles (D1)."""
+    if not value:
+        return "0,00"
+    value = re.sub(r'\s+', '', value)
+    clean = re.sub(r"[^\d,\.]", "", value)
+    if not clean:
+        return "0,00"
+    last_comma_pos = clean.rfind(',')
+    last_dot_pos = clean.rfind('.')
+    if last_comma_pos != -1 and last_dot_pos != -1:
+        if last_comma_pos > last_dot_pos:
+            clean = clean.replace('.', '').replace(',', '.')
+        else:
+            clean = clean.replace(',', '')
+    elif last_comma_pos != -1:
+        last_part = clean.split(',')[-1]
+        if len(last_part) == 2:
+            clean = clean.replace('.', '').replace(',', '.')
+        elif len(last_part) == 3:
+            clean = clean.replace(',', '')
+        else:
+            clean = clean.replace(',', '.')
+    elif last_dot_pos != -1:
+        last_part = clean.split('.')[-1]
+        if len(last_part) == 3 or (len(last_part) != 2 and clean.count('.') > 1):
+            clean = clean.replace('.', '')
+    try:
+        return _format_amount(float(clean))
+    except ValueError:
+        return "0,00"
+
+
+def monto_miles_coma(value):
+    """Varias comas = miles; punto y coma = europeo; solo punto sin 2 decimales = miles (adidas)."""
+    if not value or not isinstance(value, str):
+        return "0,00"
+    value = re.sub(r'\s+', '', value.strip())
+    clean = re.sub(r"[^\d,.]", "", value)
+    if clean.count(',') > 1:
+        clean = clean.replace(',', '')
+    elif ',' in clean and '.' in clean:
+        clean = clean.replace('.', '').replace(',', '.')
+    elif ',' in clean:
+        clean = clean.replace(',', '.')
+    elif '.' in clean:
+        if len(clean.split('.')[-1]) != 2:
+            clean = clean.replace('.', '')
+    try:
+        return _format_amount(float(clean))
+    except ValueError:
+        return "0,00"
+
+
+def espacios(value):
+    """Colapsa espacios y saltos de línea internos."""
+    return re.sub(r'\s+', ' ', value).strip()
+
+
+def sin_espacios_puntos(value):
+    return re.sub(r'[\s\.]', '', value)
+
+
+def digitos_guion(value):
+    return re.sub(r'[^\d\-]', '', value)
+
+
+def primera_palabra(value):
+    words = value.split()
+    return words[0] if words else ""
+
+
+def fecha_mes_texto(value):
+    """"13-sep-2025" o "13 sept. 2025" → "13/09/2025"."""
+    m = re.match(r"(\d{1,2})[-\s]([a-z]{3})[a-z\.]*[-\s](\d{4})", value, re.IGNORECASE)
+    if not m:
+        return ""
+    dia, mes_texto, año = m.groups()
+    return f"{int(dia):02d}/{MESES.get(mes_texto.lower(), '01')}/{año}"
+
+
+# Conversiones desde los valores del código QR DIAN (ver dian_qr.parse_payload):
+# fechas "AAAA-MM-DD", NIT solo con dígitos y número de factura sin guion
+
+def fecha_dd_mm_aaaa(value):
+    """"2025-07-03" → "03/07/2025"."""
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})$", value)
+    return f"{m.group(3)}/{m.group(2)}/{m.group(1)}" if m else ""
+
+
+def fecha_dd_mm_aa(value):
+    """"2025-07-03" → "03/07/25"."""
+    m = re.match(r"\d{2}(\d{2})-(\d{2})-(\d{2})$", value)
+    return f"{m.group(3)}/{m.group(2)}/{m.group(1)}" if m else ""
+
+
+def nit_con_dv(value):
+    """"890900076" → "890900076-0" (dígito de verificación DIAN)."""
+    nit = re.sub(r"\D", "", value.partition("-")[0])
+    return f"{nit}-{check_digit(nit)}" if nit else ""
+
+
+def nit_sin_dv(value):
+    """"890.900.076-0" → "890900076"."""
+    return re.sub(r"\D", "", value.partition("-")[0])
+
+
+def guion_prefijo(value):
+    """"101B13272" → "101B-13272": prefijo de la resolución y consecutivo."""
+    return re.sub(r"^(\d*[A-Za-z]+)-?(\d+)$", r"\1-\2", value.strip())
+
+
+POSTPROCESSORS = {
+    "monto_coma_decimal": monto_coma_decimal,
+    "monto_mixto": monto_mixto,
+    "monto_entero": monto_entero,
+    "monto_posicional": monto_posicional,
+    "monto_miles_coma": monto_miles_coma,
+    "espacios": espacios,
+    "sin_espacios_puntos": sin_espacios_puntos,
+    "digitos_guion": digitos_guion,
+    "primera_palabra": primera_palabra,
+    "fecha_mes_texto": fecha_mes_texto,
+    "fecha_dd_mm_aaaa": fecha_dd_mm_aaaa,
+    "fecha_dd_mm_aa": fecha_dd_mm_aa,
+    "nit_con_dv": nit_con_dv,
+    "nit_sin_dv": nit_sin_dv,
+    "guion_prefijo": guion_prefijo,
+}
+
+
+def _flags(names):
+    value = 0
+    for name in names or ():
+        if name not in FLAGS:
+            raise ValueError(f"Flag de expresión regular desconocido: {name}")
+        value |= FLAGS[name]
+    return value
+
+
+def _post_chain(names):
+    unknown = [name for name in names if name not in POSTPROCESSORS]
+    if unknown:
+        raise ValueError(f"Postprocesadores desconocidos: {', '.join(unknown)}")
+    return [POSTPROCESSORS[name] for name in names]
+
+
+class FieldSpec:
+    """
+    Un campo: patrones en orden de prioridad (ya compilados), postprocesadores,
+    valor por defecto y si es requerido. Gana el primer patrón que coincide;
+    con "mode": "last" se toma su última coincidencia en el texto.
+    Las reglas "spatial" se aplican antes que los patrones cuando hay cajas de palabras.
+    "qr" son los postprocesadores que llevan el valor del código QR DIAN a la forma
+    que da el formato (null: el valor del QR no sirve y el campo se busca en el texto).
+    """
+    def __init__(self, name, patterns, flags=(), post=(), default="", required=False, spatial=(), qr=()):
+        self.name = name
+        self.default = default
+        self.required = required
+        self.post = _post_chain(list(post))
+        self.qr = _post_chain(list(qr)) if qr is not None else None
+        self.patterns = []
+        for pattern in patterns:
+            if isinstance(pattern, str):
+                pattern = {"regex": pattern}
+            regex = re.compile(pattern["regex"], _flags(pattern.get("flags", flags)))
+            self.patterns.append((regex, pattern.get("mode", "first")))
+        # Reglas por posición (etiqueta → valor a la derecha o debajo), ver word_boxes
+        self.spatial = [SpatialRule.from_spec(rule, _flags(rule.get("flags", flags))) for rule in spatial]
+
+    @staticmethod
+    def search(regex, mode, text):
+        if mode == "last":
+            match = None
+            for match in regex.finditer(text):
+                pass
+            return match
+        return regex.search(text)
+
+    @staticmethod
+    def raw(match):
+        """Texto capturado, antes de los postprocesadores."""
+        return (match.group(1) if match.re.groups else match.group(0)).strip()
+
+    def value(self, match):
+        return self.postprocess(self.raw(match))
+
+    def postprocess(self, value):
+        for post in self.post:
+            value = post(value)
+        return value
+
+    def from_qr(self, value):
+        """Valor del código QR DIAN en la forma del formato ("" si no sirve)."""
+        if self.qr is None:
+            return ""
+        for post in self.qr:
+            value = post(value)
+        return value
+
+    def extract(self, text):
+        for regex, mode in self.patterns:
+            match = self.search(regex, mode, text)
+            if match:
+                return self.value(match)
+        return self.default
+
+
+# ESCANEO EN UNA PASADA
+# Casi todos los patrones empiezan con una etiqueta literal ("NIT", "TOTAL:",
+# "Fecha de Emisión"). Una sola búsqueda de todas las etiquetas sobre el texto
+# en minúsculas (fold_case) da las posiciones candidatas, y solo ahí se prueba cada patrón
+# con match(). Los patrones sin etiqueta (p. ej. "(\d{10})") o con "mode": "last"
+# se buscan por separado, y solo si ningún patrón de mayor prioridad del campo
+# coincidió.
+
+# Etiquetas más cortas darían demasiadas posiciones candidatas
+MIN_ANCHOR_LENGTH = 2
+# Máximo de etiquetas alternativas por patrón, p. ej. (?:Identificación|Nit Cliente)
+MAX_ANCHORS = 8
+
+
+def _anchors(items):
+    """
+    Prefijos literales con los que debe empezar toda coincidencia de la secuencia
+    sre_parse `items`, y si la secuencia es completamente literal. Las aserciones
+    de ancho cero al inicio (^, \\b, (?<!SUB)) no consumen texto y se omiten.
+    """
+    prefixes = [""]
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT) and prefixes == [""]:
+            continue
+        if op is sre_parse.LITERAL:
+            prefixes = [prefix + chr(av) for prefix in prefixes]
+            continue
+        if op is sre_parse.SUBPATTERN:
+            alternatives = [av[-1]]
+        elif op is sre_parse.BRANCH:
+            alternatives = av[1]
+        else:
+            return prefixes, False
+        expanded, complete = [], True
+        for alternative in alternatives:
+            sub_prefixes, sub_complete = _anchors(alternative)
+            expanded += [prefix + sub for prefix in prefixes for sub in sub_prefixes]
+            complete = complete and sub_complete
+        if len(expanded) > MAX_ANCHORS:
+            return prefixes, False
+        prefixes = expanded
+        if not complete:
+            return prefixes, False
+    return prefixes, True
+
+
+def _long_reach(items):
+    """True si la secuencia tiene una repetición sin límite que puede cruzar todo el texto (.*? con DOTALL, \\D*, [^:]*)."""
+    for op, av in items:
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, item = av
+            if high == sre_parse.MAXREPEAT and len(item) == 1:
+                sub_op, sub_av = item[0]
+                if sub_op is sre_parse.ANY and item.state.flags & re.DOTALL:
+                    return True
+                # [^x]* sí, [^\\n]* no: se detiene al final de la línea
+                newline = (sre_parse.LITERAL, ord("\n"))
+                if sub_op is sre_parse.NOT_LITERAL and sub_av != ord("\n"):
+                    return True
+                if sub_op is sre_parse.IN and sub_av and sub_av[0][0] is sre_parse.NEGATE and newline not in sub_av:
+                    return True
+            if _long_reach(item):
+                return True
+        elif op is sre_parse.SUBPATTERN and _long_reach(av[-1]):
+            return True
+        elif op is sre_parse.BRANCH and any(_long_reach(alternative) for alternative in av[1]):
+            return True
+    return False
+
+
+def fold_case(text):
+    """
+    Minúsculas en las que coincide todo lo que IGNORECASE de re considera igual
+    ("ſ" y "s", "ς" y "σ" comparten mayúscula). None si cambia la longitud del
+    texto ("ß", "İ"), porque las posiciones ya no corresponderían.
+    """
+    folded = text.lower() if text.isascii() else text.upper().lower()
+    return folded if len(folded) == len(text) else None
+
+
+def pattern_anchors(regex):
+    """Etiquetas (en minúsculas) de un patrón compilado, o None si no sirve para el escaneo."""
+    try:
+        prefixes, _ = _anchors(sre_parse.parse(regex.pattern, regex.flags))
+    except Exception:
+        return None
+    if not prefixes or min(len(prefix) for prefix in prefixes) < MIN_ANCHOR_LENGTH:
+        return None
+    anchors = {fold_case(prefix) for prefix in prefixes}
+    if None in anchors:
+        return None
+    return sorted(anchors)
+
+
+class FieldScanner:
+    """
+    Escaneo en una pasada de todos los patrones con etiqueta de un spec.
+    scan() devuelve la primera coincidencia (la misma que daría search()) de
+    cada patrón (campo, prioridad) que aún puede decidir su campo.
+    Los patrones de largo alcance (p. ej. "USECHE.*?(\\d{10})" con DOTALL) no se
+    prueban en cada etiqueta, porque cada intento podría recorrer el resto del
+    texto: se buscan una sola vez con search() desde su primera etiqueta.
+    """
+    def __init__(self, fields):
+        self.by_anchor = {}
+        self.scannable = set()
+        self.long_reach = set()
+        for i, field in enumerate(fields):
+            for k, (regex, mode) in enumerate(field.patterns):
+                anchors = pattern_anchors(regex) if mode == "first" else None
+                if not anchors:
+                    continue
+                self.scannable.add((i, k))
+                if _long_reach(sre_parse.parse(regex.pattern, regex.flags)):
+                    self.long_reach.add((i, k))
+                for anchor in anchors:
+                    self.by_anchor.setdefault(anchor, []).append((i, k, regex))
+        # Por primer carácter, para saber qué etiquetas empiezan en una posición
+        self.by_first = {}
+        for anchor in self.by_anchor:
+            self.by_first.setdefault(anchor[0], []).append(anchor)
+        self.anchor_regex = {anchor: re.compile(re.escape(anchor), re.IGNORECASE) for anchor in self.by_anchor}
+        # Expresión de búsqueda de candidatos por conjunto de etiquetas aún útiles
+        self._candidates = {}
+
+    def candidates(self, anchors, lowered):
+        key = (anchors, lowered)
+        regex = self._candidates.get(key)
+        if regex is None:
+            alternation = "|".join(re.escape(anchor) for anchor in sorted(anchors, key=len, reverse=True))
+            # Si fold_case() no sirve para el texto, se busca sobre el original sin distinguir mayúsculas
+            regex = re.compile(alternation, 0 if lowered else re.IGNORECASE)
+            if len(self._candidates) > 256:
+                self._candidates.clear()
+            self._candidates[key] = regex
+        return regex
+
+    def _anchors_at(self, haystack, position, lowered, live):
+        if lowered:
+            return [a for a in self.by_first.get(haystack[position], ()) if a in live and haystack.startswith(a, position)]
+        return [a for a in live if self.anchor_regex[a].match(haystack, position)]
+
+    def scan(self, text, resolved=()):
+        """`resolved`: campos ya decididos por otra vía (reglas espaciales), que no se buscan."""
+        found = {}
+        if not self.by_anchor:
+            return found
+        haystack = fold_case(text)
+        lowered = haystack is not None
+        if not lowered:
+            haystack = text
+        pending = {(i, k) for i, k in self.scannable if i not in resolved}
+        live = frozenset(a for a in self.by_anchor if any((i, k) in pending for i, k, _ in self.by_anchor[a]))
+        if not live:
+            return found
+        candidates = self.candidates(live, lowered)
+        position = 0
+        while pending:
+            hit = candidates.search(haystack, position)
+            if hit is None:
+                break
+            position = hit.start()
+            changed = False
+            for anchor in self._anchors_at(haystack, position, lowered, live):
+                for i, k, regex in self.by_anchor[anchor]:
+                    if (i, k) not in pending:
+                        continue
+                    if (i, k) in self.long_reach:
+                        match = regex.search(text, position)
+                        pending.discard((i, k))
+                        changed = True
+                    else:
+                        match = regex.match(text, position)
+                    if match:
+                        found[(i, k)] = match
+                        # Los patrones de menor prioridad del campo ya no pueden ganar
+                        pending = {(fi, fk) for fi, fk in pending if fi != i or fk < k}
+                        changed = True
+            if changed:
+                # Las etiquetas sin patrones pendientes salen de la búsqueda
+                live = frozenset(a for a in live if any((i, k) in pending for i, k, _ in self.by_anchor[a]))
+                if not live:
+                    break
+                candidates = self.candidates(live, lowered)
+            position += 1
+        return found
+
+
+# Resultado detallado de un campo: valor final, origen ("conocido", "espacial",
+# "texto" o "defecto"), texto capturado antes de postprocesar y, si se conoce,
+# página (índice desde 0) y caja del valor en las cajas de palabras
+FieldResult = namedtuple("FieldResult", "value source raw page box")
+
+
+class FieldMatcher:
+    """Conjunto de campos compilado de un spec; extract() devuelve el diccionario de datos."""
+    # Una sola pasada sobre el texto para los patrones con etiqueta (ver FieldScanner)
+    SINGLE_PASS = True
+
+    def __init__(self, name, fields, invariants=None):
+        self.name = name
+        self.fields = fields
+        # Invariantes aritméticas entre campos (ver validation); por defecto las generales
+        self.invariants = invariants if invariants is not None else compile_invariants(None)
+        self.by_name = {field.name: field for field in fields}
+        self.required = [field.name for field in fields if field.required]
+        self.scanner = FieldScanner(fields)
+        # True si algún campo declara reglas espaciales (se piden cajas de palabras)
+        self.spatial = any(field.spatial for field in fields)
+
+    def extract_spatial(self, words, skip=()):
+        """
+        Campos con reglas espaciales: {índice del campo: FieldResult}.
+        Primero en la caja aprendida para este proveedor; si no, por etiqueta
+        (y la posición encontrada se aprende para los siguientes documentos).
+        """
+        geometry = get_default_geometry()
+        results = {}
+        for i, field in enumerate(self.fields):
+            if i in skip:
+                continue
+            for rule in field.spatial:
+                hit = geometry.lookup(self.name, field.name, words, rule) if geometry else None
+                if hit is None:
+                    hit = rule.find(words)
+                    if hit and geometry:
+                        geometry.learn(self.name, field.name, rule, words, hit[1], hit[2])
+                if hit:
+                    match, page, box = hit
+                    results[i] = FieldResult(field.value(match), "espacial", field.raw(match), page, box)
+                    break
+        return results
+
+    def from_qr(self, fields):
+        """
+        Campos del código QR DIAN (dian_qr.parse_payload) convertidos a la forma de
+        este formato, para usarlos como `known`. Los que el spec no declara pasan igual.
+        """
+        known = {}
+        for name, value in fields.items():
+            field = self.by_name.get(name)
+            value = field.from_qr(value) if field else value
+            if value:
+                known[name] = value
+        return known
+
+    def extract(self, text, words=None, known=None):
+        """
+        Datos del texto. `known` ({campo: valor}, p. ej. del código QR DIAN) fija
+        campos que ya no se buscan; con `words` (DocumentWords), las reglas
+        espaciales tienen prioridad sobre los patrones.
+        """
+        return {name: result.value for name, result in self.extract_detail(text, words, known).items()}
+
+    def extract_detail(self, text, words=None, known=None):
+        """Como extract(), pero con un FieldResult por campo (origen y texto capturado)."""
+        text = text or ""
+        resolved = {
+            i: FieldResult(known[field.name], "conocido", known[field.name], None, None)
+            for i, field in enumerate(self.fields) if known and known.get(field.name)
+        }
+        if words is not None and self.spatial:
+            resolved.update(self.extract_spatial(words, skip=resolved))
+        if not self.SINGLE_PASS:
+            found = {}
+        else:
+            found = self.scanner.scan(text, resolved=resolved)
+        data = {}
+        for i, field in enumerate(self.fields):
+            if i in resolved:
+                data[field.name] = resolved[i]
+                continue
+            data[field.name] = FieldResult(field.default, "defecto", "", None, None)
+            for k, (regex, mode) in enumerate(field.patterns):
+                if self.SINGLE_PASS and (i, k) in self.scanner.scannable:
+                    match = found.get((i, k))
+                else:
+                    match = field.search(regex, mode, text)
+                if match:
+                    data[field.name] = FieldResult(field.value(match), "texto", field.raw(match), None, None)
+                    break
+        return data
+
+
+def spec_path(name):
+    return os.path.join(SPECS_DIR, f"{name}.json")
+
+
+def _read_spec(name, seen=()):
+    """Lee el JSON del spec y resuelve "base" (herencia de otro spec, campo por campo)."""
+    path = spec_path(name)
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    paths = [path]
+    base = spec.get("base")
+    if base:
+        if base in seen:
+            raise ValueError(f"Herencia circular en los specs: {name} → {base}")
+        parent, parent_paths = _read_spec(base, seen + (name,))
+        parent = {k: v for k, v in parent.items() if k != "deteccion"}
+        fields = {field["name"]: field for field in parent.get("fields", [])}
+        for field in spec.get("fields", []):
+            fields[field["name"]] = field
+        spec = dict(parent, **{k: v for k, v in spec.items() if k not in ("base", "fields")})
+        spec["fields"] = list(fields.values())
+        paths += parent_paths
+    return spec, paths
+
+
+def compile_spec(name, spec):
+    flags = spec.get("flags", [])
+    common_post = spec.get("post", [])
+    try:
+        fields = [
+            FieldSpec(
+                field["name"],
+                field["patterns"],
+                flags=field.get("flags", flags),
+                post=common_post + field.get("post", []),
+                default=field.get("default", ""),
+                required=field.get("required", False),
+                spatial=field.get("spatial", []),
+                qr=field.get("qr", []),
+            )
+            for field in spec.get("fields", [])
+        ]
+        invariants = compile_invariants(spec.get("invariantes"))
+    except (KeyError, ValueError, re.error) as e:
+        raise ValueError(f"Spec de campos inválido ({name}): {e}")
+    return FieldMatcher(name, fields, invariants)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _mtimes(paths):
+    return tuple(os.path.getmtime(path) for path in paths)
+
+
+def load_spec(name):
+    """
+    FieldMatcher compilado del spec formats/specs/<name>.json. Se compila una vez
+    y se recompila solo si el archivo (o su base) cambió en disco.
+    """
+    entry = _cache.get(name)
+    if entry is not None:
+        paths, mtimes, matcher = entry
+        try:
+            if _mtimes(paths) == mtimes:
+                return matcher
+        except OSError:
+            pass
+    with _cache_lock:
+        spec, paths = _read_spec(name)
+        matcher = compile_spec(name, spec)
+        _cache[name] = (paths, _mtimes(paths), matcher)
+        if entry is not None:
+            print(f"Spec de campos recargado: {name}")
+        return matcher
+
+
+def read_raw_spec(name):
+    """JSON del spec (con la herencia resuelta), sin compilar."""
+    return _read_spec(name)[0]
+
+
+def available_specs():
+    if not os.path.isdir(SPECS_DIR):
+        return []
+    return sorted(name[:-5] for name in os.listdir(SPECS_DIR) if name.endswith(".json"))
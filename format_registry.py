@@ -0,0 +1,204 @@
+import os
+import json
+import importlib
+import threading
+from collections.abc import Mapping
+
+from field_spec import load_spec, available_specs, spec_path
+
+
+class FormatSpec:
+    """
+    Descripción liviana de un formato de factura: clave, módulo y clase del
+    extractor, palabras clave de detección y campos requeridos. El módulo del
+    extractor (y con él cv2, numpy, Tesseract) se importa solo al usarlo.
+
+    keywords: {palabra: peso}, en mayúsculas y sin espacios (ver vendor_detection).
+    patterns: {expresión regular: peso} sobre el mismo texto normalizado.
+    required_fields: campos propios del formato que deben encontrarse; si no se
+        declaran, los marcados como requeridos en el spec de campos.
+    field_spec: nombre del spec de campos (formats/specs/<nombre>.json). Si la
+        clase no lo fija, se crea una subclase con FIELD_SPEC = field_spec.
+    """
+    def __init__(self, key, module, class_name, keywords=None, patterns=None, required_fields=None, field_spec=None):
+        self.key = key
+        self.module = module
+        self.class_name = class_name
+        self.keywords = keywords or {}
+        self.patterns = patterns or {}
+        self.required_fields = list(required_fields or [])
+        self.field_spec = field_spec
+        self._class = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._class is not None
+
+    def load(self):
+        """Importa el módulo del extractor la primera vez y devuelve la clase."""
+        if self._class is None:
+            with self._lock:
+                if self._class is None:
+                    module = importlib.import_module(self.module)
+                    cls = getattr(module, self.class_name)
+                    if self.field_spec and getattr(cls, "FIELD_SPEC", None) != self.field_spec:
+                        cls = type(cls.__name__, (cls,), {"FIELD_SPEC": self.field_spec})
+                    self._class = cls
+                    print(f"Formato cargado: {self.key} ({self.class_name})")
+        return self._class
+
+
+class FormatRegistry(Mapping):
+    """
+    Registro único de formatos. Funciona como un diccionario clave → clase del
+    extractor (por compatibilidad con MAPA_EXTRACTORES), pero la clase solo se
+    importa al pedirla; `in`, keys() y specs() no importan nada.
+    """
+    def __init__(self, specs=()):
+        self._specs = {}
+        # Formatos definidos solo con un spec JSON: clave → mtime del archivo
+        self._json_formats = {}
+        self._lock = threading.Lock()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec):
+        self._specs[spec.key] = spec
+        return spec
+
+    def spec(self, key):
+        return self._specs[key]
+
+    def specs(self):
+        """Pares (clave, FormatSpec) en orden de registro, sin importar extractores."""
+        return list(self._specs.items())
+
+    def required_fields(self, key):
+        spec = self._specs.get(key)
+        if spec is None:
+            return []
+        if spec.required_fields or not spec.field_spec:
+            return spec.required_fields
+        try:
+            return load_spec(spec.field_spec).required
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer el spec de campos {spec.field_spec}: {e}")
+            return []
+
+    def refresh_json_formats(self):
+        """
+        Registra los formatos definidos solo con un spec JSON que trae un bloque
+        "deteccion" ({"keywords": {...}, "patterns": {...}}): agregar un proveedor
+        es agregar un archivo, sin reiniciar. Solo se vuelve a leer un spec si su
+        archivo cambió; los formatos con extractor propio no se reemplazan.
+        """
+        current = {}
+        for name in available_specs():
+            if name in self._specs and name not in self._json_formats:
+                continue
+            try:
+                current[name] = os.path.getmtime(spec_path(name))
+            except OSError:
+                pass
+        if current == self._json_formats:
+            return
+        with self._lock:
+            for name in set(self._json_formats) - set(current):
+                if self._specs.pop(name, None):
+                    print(f"Formato retirado: {name}")
+            for name, mtime in current.items():
+                if self._json_formats.get(name) == mtime:
+                    continue
+                try:
+                    with open(spec_path(name), "r", encoding="utf-8") as f:
+                        detection = json.load(f).get("deteccion")
+                except (OSError, ValueError) as e:
+                    print(f"Error leyendo el spec de campos {name}: {e}")
+                    detection = None
+                if not detection:
+                    self._specs.pop(name, None)
+                    continue
+                self.register(FormatSpec(
+                    name, "formats.factura_generica", "FacturaExtractorGenerica",
+                    keywords=detection.get("keywords"),
+                    patterns=detection.get("patterns"),
+                    field_spec=name,
+                ))
+                print(f"Formato registrado desde spec: {name}")
+            self._json_formats = current
+
+    def __getitem__(self, key):
+        return self._specs[key].load()
+
+    def __contains__(self, key):
+        return key in self._specs
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+
+# El orden de registro desempata la detección por palabras clave
+FORMATS = FormatRegistry([
+    FormatSpec(
+        "bbi", "formats.factura_bbi", "FacturaExtractorBBI",
+        # Las variantes OCR (B8ICOLOMBIA, ...) las genera vendor_detection
+        keywords={"BBICOLOMBIA": 3, "BBICOLOMBIAS": 1, "BBICOLOMBIASAS": 1},
+        patterns={
+            r"NOMBRECOMERCIAL:?B+[^A-Z0-9]*I*COLOMBIA": 2,
+            r"RAZ[ÓO]NSOCIAL:?B+I+COLOMBIA": 2,
+        },
+        field_spec="bbi",
+    ),
+    FormatSpec(
+        "hellen", "formats.factura_hellen", "FacturaExtractorHellen",
+        keywords={"HELLEN": 3, "CINECOLOMBIA": 2},
+        field_spec="hellen",
+    ),
+    FormatSpec(
+        "agro", "formats.factura_agro", "FacturaExtractorAgro",
+        keywords={"AGRO": 1, "AGROCAMPOSAS": 3, "WWW.AGROCAMPO.COM.CO": 3},
+        field_spec="agro",
+    ),
+    FormatSpec("taberna", "formats.factura_taberna", "FacturaExtractorTaberna", field_spec="taberna"),
+    FormatSpec(
+        "cuotas", "formats.factura_cuotas", "FacturaExtractorCuotas",
+        keywords={"CUOTAS": 1, "FACTURAPORCUOTAS": 3, "PAGOENCUOTAS": 3},
+        field_spec="cuotas",
+    ),
+    FormatSpec(
+        "latam", "formats.factura_latam", "FacturaExtractorLatam",
+        keywords={"LATAM": 2, "LATAMAIRLINES": 2, "AEROVIASDEINTEGRACIONREGIONAL": 3, "TIQUETEDETRANSPORTE": 2},
+        field_spec="latam",
+    ),
+    FormatSpec(
+        "yardins", "formats.factura_yardins", "FacturaExtractorYardins",
+        keywords={"YARDINS": 3, "BOGOTA": 0.2},
+        field_spec="yardins",
+    ),
+    FormatSpec(
+        "avianca", "formats.factura_avianca", "FacturaExtractorAvianca",
+        keywords={"AVIANCA": 3},
+        field_spec="avianca",
+    ),
+    FormatSpec(
+        "procafe", "formats.factura_procafe", "FacturaExtractorProcafe",
+        keywords={"PROCAFE": 3},
+        field_spec="procafe",
+    ),
+    FormatSpec(
+        "d1", "formats.factura_d1", "FacturaExtractorD1",
+        # "D1" aparece en muchos textos, así que pesa poco por sí solo
+        keywords={"D1": 0.5, "D1SAS": 1.5, "TIENDA-": 1},
+        field_spec="d1",
+    ),
+    FormatSpec(
+        "adidas", "formats.factura_adidas", "FacturaExtractoradidas",
+        keywords={"ADIDAS": 3, "ADIDASCOLOMBIALTDA": 2, "805.011.074-2": 3},
+        field_spec="adidas",
+    ),
+])
+FORMATS.refresh_json_formats()
@@ -1,5 +1,6 @@
 import re
 from text_extractor import TextExtractor
+from field_spec import load_spec, monto_coma_decimal
 
 class FacturaExtractorBBI(TextExtractor):
     """
@@ -7,18 +8,19 @@ class FacturaExtractorBBI(TextExtractor):
     Compatible con BBI, Tostao, Carulla, Éxito, etc., siempre que usen estructura similar.
     """
 
-    def __init__(self, file_path):
-        super().__init__(file_path)
-        self.fields = [
-            "fecha_emision",
-            "numero_factura",
-            "valor_total",
-            "subtotal",
-            "iva",
-            "razon_social",
-            "nit_emisor",
-            "nit_cliente"
-        ]
+    # Zonas de OCR: encabezado (emisor, número, fecha, adquiriente) y bloque de totales.
+    # Coordenadas normalizadas (x0, y0, x1, y1); page 0 = primera página, -1 = última.
+    OCR_ZONES = {
+        "encabezado": {"page": 0, "box": (0.0, 0.0, 1.0, 0.40)},
+        "totales": {"page": -1, "box": (0.0, 0.55, 1.0, 1.0)},
+    }
+
+    # Campos y patrones: formats/specs/bbi.json
+    FIELD_SPEC = "bbi"
+
+    def __init__(self, file_path, context=None):
+        super().__init__(file_path, context=context)
+        self.fields = [field.name for field in load_spec(self.FIELD_SPEC).fields]
 
     def process(self):
         print("🧩 Iniciando extracción estructural (formato Colombia)...")
@@ -39,102 +41,9 @@ class FacturaExtractorBBI(TextExtractor):
         return True, extracted
 
     def extract_data(self):
-        data = {field: "" for field in self.fields}
-        text = self.text
-
-        # --- FECHA DE EMISIÓN ---
-        m = re.search(r"Fecha de Emisi[oó]n:\s*(\d{2}[\/\-]\d{2}[\/\-]\d{4})", text, re.IGNORECASE)
-        if m:
-            data["fecha_emision"] = m.group(1)
+        return load_spec(self.FIELD_SPEC).extract(self.text, words=self.words, known=self.known_fields)
 
-        # --- NÚMERO DE FACTURA ---
-        m = re.search(r"Número de Factura[:\s]*([\w\-]+)", text, re.IGNORECASE)
-        if m:
-            data["numero_factura"] = m.group(1).strip()
-        else:
-            m = re.search(r"(\b\d{3,4}[A-Z\-]*\d{4,5}\b)", text)
-            if m:
-                data["numero_factura"] = m.group(1).replace(" ", "").strip()
-
-        # --- TOTAL FACTURA ---
-        valor_total = None
-        m = re.search(r'Total factura COP\s*([\d\.,]+)', text, re.IGNORECASE)
-        if m:
-            valor_total = self._normalize_amount(m.group(1))
-        else:
-            m = re.search(r'Total factura\s*\(\=\)[^\d]*([\d\.,]{5,})', text, re.IGNORECASE)
-            if m:
-                valor_total = self._normalize_amount(m.group(1))
-            else:
-                m = re.search(r'Total neto factura\s*\(\=\)\s*([\d\.,]+)', text, re.IGNORECASE)
-                if m:
-                    valor_total = self._normalize_amount(m.group(1))
-
-        data["valor_total"] = valor_total if valor_total else "0,00"
-
-        # --- SUBTOTAL ---
-        patterns_subtotal = [
-            r'Subtotal\s*([\d\.,]+)',
-            r'Subtota[l]*[\w\s]{0,10}?([\d\.,]{3,15})',
-        ]
-        subtotal = None
-        for pattern in patterns_subtotal:
-            m = re.search(pattern, text, re.IGNORECASE)
-            if m:
-                subtotal = self._normalize_amount(m.group(1))
-                break
-        data["subtotal"] = subtotal if subtotal else "0,00"
-
-        # --- IVA / TOTAL IMPUESTOS ---
-        patterns_iva = [
-            r'Total impuesto\s*([\d\.,]+)', 
-            r'IVA\s*[\d\.,%]*\s*([\d\.,]+)',
-            r'IMPUESTOS\s*([\d\.,]+)',
-        ]
-        iva_total = None
-        for pattern in patterns_iva:
-            m = re.search(pattern, text, re.IGNORECASE)
-            if m:
-                iva_total = self._normalize_amount(m.group(1))
-                break
-        data["iva"] = iva_total if iva_total else "0,00"
-
-        # --- RAZÓN SOCIAL ---
-        m = re.search(r'Raz[oó]n Social[:\s]*([A-Z0-9\s\.\-&]+?)(?=\s*(?:Nombre Comercial|Nit del Emisor|País|Tipo de Contribuyente|$))', text, re.IGNORECASE)
-        if m:
-            data["razon_social"] = m.group(1).strip()
-        else:
-            m2 = re.search(r'Nombre Comercial[:\s]*([A-Z0-9\s\.\-&]+?)(?=\s*(?:Nit del Emisor|País|$))', text, re.IGNORECASE)
-            if m2:
-                data["razon_social"] = m2.group(1).strip()
-
-        # --- NIT EMISOR ---
-        m = re.search(r'Nit del Emisor[:\s]*([\d\.\-\s]{8,15})', text, re.IGNORECASE)
-        if m:
-            nit = re.sub(r'[\s\.]', '', m.group(1))
-            data["nit_emisor"] = nit
-
-        # --- NIT CLIENTE ---
-        m = re.search(r"Número Documento[:\s]*(\d{8,12})", text, re.IGNORECASE)
-        if m:
-            data["nit_cliente"] = m.group(1)
-        else:
-            m = re.search(r"(?:Adquiriente|Comprador).*?NIT\D*(\d{8,12})", text, re.IGNORECASE | re.DOTALL)
-            if m:
-                data["nit_cliente"] = m.group(1)
-        return data
-
-    @staticmethod
-    def _normalize_amount(value):
-        if not value:
-            return "0,00"         
-        clean = re.sub(r"[^\d,\.]", "", value)
-        clean = clean.replace(".", "").replace(",", ".")
-        try:
-            num = float(clean)
-            return f"{num:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        except:
-            return "0,00"
+    _normalize_amount = staticmethod(monto_coma_decimal)
 
     @staticmethod
     def matches(text: str) -> bool:
@@ -1,60 +1,21 @@
-import re
 from text_extractor import TextExtractor
+from field_spec import load_spec
 
 class FacturaExtractorCuotas(TextExtractor):
     """
     Clase para extraer datos de facturas del formato CUOTAS.
     """
-    def extract_data(self):
-        extracted_data = {}
-        extracted_data['nit'] = self._search_patterns([
-            r'NIT[:\s]*([0-9.\-]+)',
-        ])
-
-        extracted_data['fecha'] = self._search_patterns([
-            r'FECHA DE EMISIÓN[:\s]*(\d{2}/\d{2}/\d{4})',
-            r'FECHA[:\s]*(\d{2}-\d{2}-\d{4})',
-        ])
-
-        extracted_data['razon_social'] = self._search_patterns([
-            r'CLIENTE[:\s]*([^\n]+)',
-            r'RAZÓN SOCIAL[:\s]*([^\n]+)',
-        ])
-
-        extracted_data['numero_factura'] = self._search_patterns([
-            r'FACTURA No\.[:\s]*([A-Z0-9\-]+)',
-        ])
+    # Campos y patrones: formats/specs/cuotas.json
+    FIELD_SPEC = "cuotas"
 
-        extracted_data['subtotal'] = self._search_patterns([
-            r'SUBTOTAL[:\s]*([0-9.,]+)',
-        ])
-
-        extracted_data['valor_impuestos'] = self._search_patterns([
-            r'IVA[:\s]*([0-9.,]+)',
-            r'IMPUESTO[:\s]*([0-9.,]+)',
-        ])
-
-        extracted_data['valor_total'] = self._search_patterns([
-            r'TOTAL A PAGAR[:\s]*([0-9.,]+)',
-            r'TOTAL[:\s]*([0-9.,]+)',
-        ])
-        return extracted_data
-
-    def _search_patterns(self, patterns):
-        for pattern in patterns:
-            match = re.search(pattern, self.text, re.IGNORECASE)
-            if match:
-                try:
-                    return match.group(1).strip()
-                except IndexError:
-                    return match.group(0).strip()
-        return ""
+    def extract_data(self):
+        return load_spec(self.FIELD_SPEC).extract(self.text, words=self.words, known=self.known_fields)
 
     def process(self):
         if not self.extract_text_tesseract():
             return False, []
         extracted_data = self.extract_data()
-        required_fields = ['nit', 'fecha', 'razon_social', 'numero_factura', 'valor_total']
+        required_fields = load_spec(self.FIELD_SPEC).required
         missing = [f for f in required_fields if not extracted_data.get(f)]
         if missing:
             return False, missing
@@ -1,93 +1,24 @@
 import re
 from text_extractor import TextExtractor
+from field_spec import load_spec, monto_posicional
 
 class FacturaExtractorD1(TextExtractor):
     """
     Clase para extraer datos específicos de facturas D1 S.A.S.
     """
 
-    def extract_data(self):
-        """
-        Extrae los datos requeridos de la factura D1 usando expresiones regulares.
-        """
-        extracted_data = {}
-        
-        # --- 1. Fecha de Emisión ---
-        fecha_emision_patterns = [
-            r'FECHA:\s*(\d{4}-\d{2}-\d{2})',
-            r'Fecha:\s*(\d{4}-\d{2}-\d{2})',
-        ]
-        extracted_data['fecha_emision'] = self._search_patterns(fecha_emision_patterns)
-
-        # --- 2. Número de Factura ---
-        numero_factura_patterns = [
-            r'FACTURA\s+ELECTR[OÓ]NICA\s+DE\s+VENTA\s+N:\s*([A-Z0-9]+)',
-            r'VENTA\s+N:\s*([A-Z0-9]+)',
-        ]
-        extracted_data['numero_factura'] = self._search_patterns(numero_factura_patterns)
-
-        # --- 3. Total ---
-        valor_total_patterns = [
-            r'AJUSTE\s+A\s+VUELTAS[^\n]*\n[^\n]*TOTAL:\s*([\d\.,]+)',
-            r'(?<!SUB)TOTAL:\s*([\d\.,]+)',
-            r'IVA:\s*[\d\.,]+[^\n]*\n[^\n]*TOTAL:\s*([\d\.,]+)',  
-        ]
-        total_str = self._search_patterns(valor_total_patterns)
-        extracted_data['valor_total'] = self._normalize_amount(total_str)
-
-        # --- 4. Subtotal ---
-        subtotal_patterns = [
-            r'SUBTOTAL:\s*([\d\.,]+)',
-        ]
-        subtotal_str = self._search_patterns(subtotal_patterns)
-        extracted_data['subtotal'] = self._normalize_amount(subtotal_str)
+    # Zonas de OCR: cabecera del tiquete y totales; se omite el cuerpo de productos.
+    # Coordenadas normalizadas (x0, y0, x1, y1); page 0 = primera página, -1 = última.
+    OCR_ZONES = {
+        "cabecera": {"page": 0, "box": (0.0, 0.0, 1.0, 0.25)},
+        "totales": {"page": -1, "box": (0.0, 0.45, 1.0, 1.0)},
+    }
 
-        # --- 5. IVA ---
-        iva_patterns = [
-            r'IVA:\s*([\d\.,]+)',
-            r'\[TOTALES\s+DE\s+FACTURA\].*?IVA:\s*([\d\.,]+)',
-        ]
-        iva_str = self._search_patterns(iva_patterns)
-        extracted_data['iva'] = self._normalize_amount(iva_str)
+    # Campos y patrones: formats/specs/d1.json
+    FIELD_SPEC = "d1"
 
-        # --- 6. Razón Social ---
-        razon_social_patterns = [
-            r'^(D1\s+S\s+A\s+S)',
-            r'(D1\s+S\s*A\s*S)',
-        ]
-        razon_social = self._search_patterns(razon_social_patterns)
-        if not razon_social:
-            razon_social = "D1 S A S"
-        extracted_data['razon_social'] = razon_social
-
-        # --- 7. NIT Emisor ---
-        nit_emisor_patterns = [
-            r'D1\s+S\s+A\s+S\s+NIT\s+([\d\-]+)',
-            r'NIT\s+([\d\-]+)',
-        ]
-        extracted_data['nit_emisor'] = self._search_patterns(nit_emisor_patterns)
-
-        # --- 8. NIT/Documento Cliente ---
-        nit_cliente_patterns = [
-            r'NUM\.\s+DOCUMENTO:\s*(\d+)',
-            r'DOCUMENTO:\s*(\d+)',
-        ]
-        extracted_data['nit_cliente'] = self._search_patterns(nit_cliente_patterns)
-
-        return extracted_data
-
-    def _search_patterns(self, patterns):
-        for pattern in patterns:
-            match = re.search(pattern, self.text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
-            if match:
-                try:
-                    result = match.group(1).strip()
-                    result = re.sub(r'\s+', ' ', result).strip()
-                    return result
-                except IndexError:
-                    result = match.group(0).strip()
-                    return re.sub(r'\s+', ' ', result).strip()
-        return ""
+    def extract_data(self):
+        return load_spec(self.FIELD_SPEC).extract(self.text, words=self.words, known=self.known_fields)
 
     def process(self):
         if not self.extract_text():
@@ -116,16 +47,7 @@ class FacturaExtractorD1(TextExtractor):
             
         extracted_data = self.extract_data()
         
-        required_fields = [
-            'fecha_emision', 
-            'numero_factura', 
-            'valor_total', 
-            'subtotal', 
-            'iva', 
-            'razon_social', 
-            'nit_emisor', 
-            'nit_cliente'
-        ]
+        required_fields = load_spec(self.FIELD_SPEC).required
         
         missing = [f for f in required_fields if not extracted_data.get(f)]
         if missing:
@@ -135,63 +57,7 @@ class FacturaExtractorD1(TextExtractor):
             
         return True, extracted_data
     
-    @staticmethod
-    def _normalize_amount(value):
-        
-        if not value:
-            return "0,00"
-        
-        value = re.sub(r'\s+', '', value)
-        
-        clean = re.sub(r"[^\d,\.]", "", value)
-        
-        if not clean:
-            return "0,00"
-        
-        
-        last_comma_pos = clean.rfind(',')
-        last_dot_pos = clean.rfind('.')
-        
-        if last_comma_pos != -1 and last_dot_pos != -1:
-            if last_comma_pos > last_dot_pos:
-                clean = clean.replace('.', '').replace(',', '.')
-            else:
-                clean = clean.replace(',', '')
-        
-        elif last_comma_pos != -1:
-            parts = clean.split(',')
-            last_part = parts[-1]
-            
-            if len(last_part) == 2:
-                clean = clean.replace('.', '').replace(',', '.')
-            elif len(last_part) == 3:
-                clean = clean.replace(',', '')
-            else:
-                clean = clean.replace(',', '.')
-        
-        elif last_dot_pos != -1:
-            parts = clean.split('.')
-            last_part = parts[-1]
-            
-            if len(last_part) == 2:
-                pass
-            elif len(last_part) == 3:
-                clean = clean.replace('.', '')
-            else:
-                if clean.count('.') == 1:
-                    pass  # Ya está bien
-                else:
-                    clean = clean.replace('.', '')
-        
-        try:
-            num = float(clean)
-            formatted = f"{num:,.2f}" 
-            
-            result = formatted.replace(",", "TEMP").replace(".", ",").replace("TEMP", ".")
-            
-            return result
-        except ValueError:
-            return "0,00"
+    _normalize_amount = staticmethod(monto_posicional)
 
     @staticmethod
     def matches(text):
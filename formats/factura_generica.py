@@ -0,0 +1,26 @@
+from text_extractor import TextExtractor
+from field_spec import load_spec
+
+class FacturaExtractorGenerica(TextExtractor):
+    """
+    Extractor para formatos definidos solo con un spec JSON (formats/specs/<clave>.json
+    con bloque "deteccion"). El registro de formatos crea una subclase por formato
+    con su FIELD_SPEC; no hace falta escribir código para un proveedor nuevo.
+    """
+    FIELD_SPEC = None
+
+    def extract_data(self):
+        return load_spec(self.FIELD_SPEC).extract(self.text, words=self.words, known=self.known_fields)
+
+    def process(self):
+        if not self.has_text():
+            self.extract_text()
+        if not self.has_text():
+            print("No se pudo extraer texto del documento")
+            return False, {}
+        extracted_data = self.extract_data()
+        missing = [f for f in load_spec(self.FIELD_SPEC).required if not extracted_data.get(f)]
+        if missing:
+            print(f"Campos faltantes: {missing}")
+            return False, missing
+        return True, extracted_data
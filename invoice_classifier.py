@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+import threading
+
+
+# Solo se usa el inicio del texto (encabezado): suficiente para el proveedor y mantiene la predicción en < 1 ms
+MAX_CHARS = 2000
+# Probabilidad a partir de la cual la detección confía en el clasificador
+MIN_CONFIDENCE = float(os.environ.get("INVOICE_CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+TEXT_EXTENSIONS = (".txt",)
+
+
+def normalize_text(text):
+    """Mayúsculas y espacios colapsados; se conservan dígitos y puntuación (NIT, prefijos)."""
+    return re.sub(r"\s+", " ", (text or "")[:MAX_CHARS].upper()).strip()
+
+
+class InvoiceClassifier:
+    """
+    Clasificador de tipo de factura entrenable: n-gramas de caracteres (tolerantes
+    a errores de OCR como B8I o AGR0CAMPO) y un modelo lineal con probabilidades
+    calibradas. scikit-learn se importa solo al entrenar o cargar el modelo.
+    """
+    def __init__(self, model=None, labels=None):
+        self.model = model
+        self.labels = labels or []
+
+    def fit(self, texts, labels):
+        from sklearn.pipeline import make_pipeline
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.calibration import CalibratedClassifierCV
+
+        texts = [normalize_text(text) for text in texts]
+        counts = {label: labels.count(label) for label in set(labels)}
+        if len(counts) < 2:
+            raise ValueError("Se necesitan ejemplos de al menos dos tipos de factura.")
+        linear = LogisticRegression(C=10.0, max_iter=1000)
+        # La calibración necesita al menos 2 ejemplos por tipo en cada partición
+        folds = min(3, min(counts.values()))
+        classifier = CalibratedClassifierCV(linear, method="sigmoid", cv=folds) if folds >= 2 else linear
+        self.model = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True, min_df=1, lowercase=False),
+            classifier,
+        )
+        self.model.fit(texts, labels)
+        self.labels = list(self.model.classes_)
+        return self
+
+    def predict(self, text):
+        """Retorna (tipo, probabilidad) del tipo más probable, o (None, 0.0) sin modelo."""
+        if self.model is None or not text:
+            return None, 0.0
+        probabilities = self.model.predict_proba([normalize_text(text)])[0]
+        best = probabilities.argmax()
+        return self.labels[best], float(probabilities[best])
+
+    def predict_batch(self, texts):
+        if self.model is None:
+            return [(None, 0.0) for _ in texts]
+        probabilities = self.model.predict_proba([normalize_text(text) for text in texts])
+        return [(self.labels[row.argmax()], float(row.max())) for row in probabilities]
+
+    def save(self, path):
+        import joblib
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        joblib.dump({"model": self.model, "labels": self.labels}, path)
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+        data = joblib.load(path)
+        return cls(data["model"], data["labels"])
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "invoice_classifier.joblib")
+_default_classifier = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def get_default_classifier():
+    """
+    Modelo compartido, cargado la primera vez que se usa. INVOICE_CLASSIFIER_PATH
+    cambia el archivo ("off" lo desactiva). Sin modelo entrenado retorna None.
+    """
+    global _default_classifier, _default_loaded
+    path = os.environ.get("INVOICE_CLASSIFIER_PATH") or DEFAULT_PATH
+    if path.lower() in ("off", "0", "false", "none"):
+        return None
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            if os.path.isfile(path):
+                try:
+                    _default_classifier = InvoiceClassifier.load(path)
+                    print(f"Clasificador de facturas cargado: {', '.join(_default_classifier.labels)}")
+                except Exception as e:
+                    print(f"No se pudo cargar el clasificador de facturas: {e}")
+        return _default_classifier
+
+
+def _document_text(path):
+    """Texto de entrenamiento: un .txt (p. ej. OCR ya guardado) o la primera página del PDF."""
+    if path.lower().endswith(TEXT_EXTENSIONS):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    from text_extractor import TextExtractor
+    extractor = TextExtractor(path)
+    try:
+        return extractor.extract_text(quick=True)
+    finally:
+        extractor.context.close()
+
+
+def _labeled_files(folder):
+    """Ejemplos etiquetados por carpeta: <carpeta>/<tipo>/<archivo.pdf|.txt>."""
+    examples = []
+    for label in sorted(os.listdir(folder)):
+        label_dir = os.path.join(folder, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            if name.lower().endswith((".pdf",) + TEXT_EXTENSIONS):
+                examples.append((os.path.join(label_dir, name), label.lower()))
+    return examples
+
+
+if __name__ == "__main__":
+    # Uso: python invoice_classifier.py train <carpeta> [modelo.joblib]
+    #      python invoice_classifier.py predict <archivo.pdf|.txt> [...]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("train", "predict"):
+        print("Uso: python invoice_classifier.py train <carpeta> [modelo.joblib]")
+        print("     python invoice_classifier.py predict <archivo.pdf|.txt> [...]")
+        print("La carpeta de entrenamiento tiene una subcarpeta por tipo (bbi/, hellen/, ...).")
+        sys.exit(1)
+
+    if sys.argv[1] == "train":
+        model_path = sys.argv[3] if len(sys.argv) > 3 else (os.environ.get("INVOICE_CLASSIFIER_PATH") or DEFAULT_PATH)
+        examples = _labeled_files(sys.argv[2])
+        texts, labels = [], []
+        for path, label in examples:
+            text = _document_text(path)
+            if text and text.strip():
+                texts.append(text)
+                labels.append(label)
+            else:
+                print(f"Sin texto, se omite: {path}")
+        classifier = InvoiceClassifier().fit(texts, labels)
+        classifier.save(model_path)
+        print(f"Modelo guardado en {model_path}: {len(texts)} documentos, tipos {', '.join(classifier.labels)}")
+    else:
+        classifier = get_default_classifier()
+        if classifier is None:
+            print("No hay un modelo entrenado.")
+            sys.exit(1)
+        for path in sys.argv[2:]:
+            text = _document_text(path)
+            start = time.perf_counter()
+            label, probability = classifier.predict(text)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{os.path.basename(path)}: {label} ({probability:.2f}, {elapsed:.2f} ms)")
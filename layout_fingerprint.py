@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import cv2
+import numpy as np
+
+
+# Miniatura de la primera página: a 36 dpi una carta mide ~306x396 px
+THUMB_DPI = 36
+GRID_SIZE = 8
+# Peso del hash perceptual frente a la rejilla de densidad de tinta
+HASH_WEIGHT = 0.5
+# Distancia máxima para aceptar una plantilla, y margen mínimo frente al mejor formato distinto
+MAX_DISTANCE = 0.18
+MIN_MARGIN = 0.04
+# Páginas con proporciones distintas (tiquete vs carta) no se comparan
+MAX_ASPECT_DIFF = 0.08
+
+
+def fingerprint(image):
+    """
+    Huella visual de una página: dHash de 64 bits (gradientes horizontales de
+    una miniatura de 9x8), rejilla GRID_SIZE x GRID_SIZE de densidad de tinta
+    y proporción alto/ancho. No requiere OCR.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    _, ink = cv2.threshold(image, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    grid = cv2.resize(ink.astype(np.float32), (GRID_SIZE, GRID_SIZE), interpolation=cv2.INTER_AREA)
+    return {
+        "dhash": "".join("1" if b else "0" for b in bits),
+        "grid": [round(float(v), 4) for v in grid.flatten()],
+        "aspect": round(image.shape[0] / image.shape[1], 4),
+    }
+
+
+def _unit_grids(grids):
+    grids = np.asarray(grids, dtype=np.float32).reshape(-1, GRID_SIZE * GRID_SIZE)
+    norms = np.linalg.norm(grids, axis=1, keepdims=True)
+    return grids / np.maximum(norms, 1e-6)
+
+
+class LayoutIndex:
+    """
+    Índice de vecino más cercano de huellas de plantillas conocidas.
+    Se guarda en JSON y se actualiza de forma incremental: añadir una factura
+    de referencia no recalcula las demás. La búsqueda compara la huella con
+    todas las entradas a la vez (operaciones vectorizadas de NumPy).
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "layout_index.json")
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        self.entries = []
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._build_arrays()
+        self._reload_if_changed()
+
+    def __len__(self):
+        # Otro proceso (o un worker) pudo añadir plantillas desde la última lectura
+        self._reload_if_changed()
+        return len(self.entries)
+
+    def _build_arrays(self):
+        self._formats = [entry["format"] for entry in self.entries]
+        self._hashes = np.array(
+            [[c == "1" for c in entry["dhash"]] for entry in self.entries], dtype=bool
+        ).reshape(-1, 64)
+        self._grids = _unit_grids([entry["grid"] for entry in self.entries])
+        self._aspects = np.array([entry["aspect"] for entry in self.entries], dtype=np.float32)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            self._load(mtime)
+
+    def _load(self, mtime):
+        """Lee el archivo (quien llama tiene el lock)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error leyendo el índice de plantillas: {e}")
+            return
+        self._mtime = mtime
+        self._build_arrays()
+
+    def save(self):
+        """Escritura atómica: otros procesos nunca leen un archivo a medio escribir."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Temporal único: varios procesos pueden guardar a la vez
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".layout_index.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    def add(self, format_key, layout, source=""):
+        """
+        Añade una huella de referencia y guarda el índice. Antes se relee el archivo,
+        para no borrar las plantillas que otro proceso añadió desde la última lectura.
+        """
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                self._load(mtime)
+            self.entries.append(dict(layout, format=format_key, source=source))
+            self._build_arrays()
+            self.save()
+
+    def distances(self, layout):
+        """Distancia (0 = idéntica) de la huella a cada entrada del índice."""
+        bits = np.array([c == "1" for c in layout["dhash"]], dtype=bool)
+        hamming = np.count_nonzero(self._hashes != bits, axis=1) / 64.0
+        grid = _unit_grids([layout["grid"]])[0]
+        grid_dist = np.linalg.norm(self._grids - grid, axis=1) / 2.0
+        dist = HASH_WEIGHT * hamming + (1 - HASH_WEIGHT) * grid_dist
+        aspect_diff = np.abs(self._aspects - layout["aspect"]) / max(layout["aspect"], 1e-6)
+        return np.where(aspect_diff > MAX_ASPECT_DIFF, 1.0, dist)
+
+    def classify(self, layout):
+        """
+        Devuelve (formato, distancia) de la plantilla más cercana si la
+        coincidencia es confiable; si no, (None, distancia).
+        """
+        self._reload_if_changed()
+        if not self.entries:
+            return None, 1.0
+        dist = self.distances(layout)
+        best = int(np.argmin(dist))
+        best_format = self._formats[best]
+        if dist[best] > MAX_DISTANCE:
+            return None, float(dist[best])
+        others = [d for d, f in zip(dist, self._formats) if f != best_format]
+        if others and min(others) - dist[best] < MIN_MARGIN:
+            return None, float(dist[best])
+        return best_format, float(dist[best])
+
+
+def document_fingerprint(extractor):
+    """Huella de la primera página usando la miniatura del contexto del documento."""
+    return fingerprint(extractor._get_page_image(THUMB_DPI, 1))
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_default_index():
+    """Índice compartido; LAYOUT_INDEX_PATH cambia el archivo ("off" lo desactiva)."""
+    global _default_index
+    path = os.environ.get("LAYOUT_INDEX_PATH")
+    if path and path.lower() in ("off", "0", "false", "none"):
+        return None
+    with _default_lock:
+        if _default_index is None:
+            _default_index = LayoutIndex(path)
+        return _default_index
+
+
+if __name__ == "__main__":
+    # Uso: python layout_fingerprint.py add <formato> <archivo.pdf> [...]
+    #      python layout_fingerprint.py classify <archivo.pdf> [...]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("add", "classify"):
+        print("Uso: python layout_fingerprint.py add <formato> <archivo.pdf> [...]")
+        print("     python layout_fingerprint.py classify <archivo.pdf> [...]")
+        sys.exit(1)
+    from text_extractor import TextExtractor
+
+    index = LayoutIndex(os.environ.get("LAYOUT_INDEX_PATH"))
+    command = sys.argv[1]
+    files = sys.argv[3:] if command == "add" else sys.argv[2:]
+    for path in files:
+        extractor = TextExtractor(path)
+        try:
+            layout = document_fingerprint(extractor)
+        finally:
+            extractor.context.close()
+        if command == "add":
+            index.add(sys.argv[2].lower(), layout, source=os.path.basename(path))
+            print(f"{os.path.basename(path)}: añadido como {sys.argv[2].lower()} ({len(index)} plantillas)")
+        else:
+            format_key, distance = index.classify(layout)
+            print(f"{os.path.basename(path)}: {format_key or 'desconocido'} (distancia {distance:.3f})")
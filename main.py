@@ -1,9 +1,24 @@
 import os
+from document_context import DocumentContext
 from factura_processor import FacturaProcessor
-from structure_analyzer import StructureAnalyzer
+from format_registry import FORMATS
+from vendor_detection import get_matcher
+from vendor_registry import get_default_registry
+from invoice_classifier import get_default_classifier, MIN_CONFIDENCE
+from ubl_ingest import ingest_file, document_type
+
+# Archivos aceptados: PDF, XML UBL de la DIAN o ZIP del proveedor (PDF + XML)
+SUPPORTED_EXTENSIONS = (".pdf", ".xml", ".zip")
+
+# Puntaje de palabras clave con el que la detección deja de ampliar el encabezado
+DETECTION_MIN_SCORE = 3
 
 # FUNCIÓN: Detección automática del tipo de factura
-def detect_factura_type(file_path):
+def detect_factura_type(file_path, context=None):
+    """
+    Detecta el tipo de factura. Si se recibe un DocumentContext, el OCR hecho
+    aquí queda disponible para FacturaProcessor.process_factura.
+    """
     print(f"\nAnalizando estructura de: {os.path.basename(file_path)}")
     try:
         if not os.path.exists(file_path):
@@ -13,91 +28,92 @@ def detect_factura_type(file_path):
             print(f"El archivo no es un PDF: {file_path}")
             return "desconocido"
 
-        from formats.factura_bbi import FacturaExtractorBBI
-        from formats.factura_hellen import FacturaExtractorHellen
-        from formats.factura_agro import FacturaExtractorAgro
-        from formats.factura_cuotas import FacturaExtractorCuotas
-        from formats.factura_yardins import FacturaExtractorYardins
-        from formats.factura_latam import FacturaExtractorLatam
-        from formats.factura_avianca import FacturaExtractorAvianca
-        from formats.factura_procafe import FacturaExtractorProcafe
-        from formats.factura_d1 import FacturaExtractorD1
-        from formats.factura_adidas import FacturaExtractoradidas
-
+        # Módulos pesados (cv2, numpy, Tesseract): solo al detectar, no al importar main
         from text_extractor import TextExtractor
+        from layout_fingerprint import get_default_index, document_fingerprint
+        from structure_analyzer import StructureAnalyzer
+        from dian_qr import read_document_qr
+
+        # Proveedores nuevos o editados en formats/specs/ sin reiniciar
+        FORMATS.refresh_json_formats()
+        temp = TextExtractor(file_path, context=context)
+        registry = get_default_registry()
 
-        EXTRACTORS = [
-            ("bbi", FacturaExtractorBBI),
-            ("hellen", FacturaExtractorHellen),
-            ("agro", FacturaExtractorAgro),
-            ("cuotas", FacturaExtractorCuotas),
-            ("yardins", FacturaExtractorYardins),
-            ("latam", FacturaExtractorLatam),
-            ("avianca", FacturaExtractorAvianca),
-            ("procafe", FacturaExtractorProcafe),
-            ("d1", FacturaExtractorD1),
-            ("adidas", FacturaExtractoradidas)
-
-        ]
-        temp = TextExtractor(file_path)
-        text = temp.extract_text(quick=True)
-
-        # Validar texto más inteligentemente
-        if not isinstance(text, str) or len(text.strip()) < 100:
-            print("Texto OCR corto o incompleto. Reintentando con OCR completo...")
-            text = temp.extract_text(quick=False)
+        # Factura electrónica: NIT del emisor en el código QR DIAN, sin OCR.
+        # Los campos del QR quedan en el contexto para la extracción.
+        qr_fields = read_document_qr(temp)
+        vendor = registry.lookup(qr_fields["nit_emisor"]) if qr_fields.get("nit_emisor") else None
+        if vendor and vendor["format"] in FORMATS:
+            print(f"Detección por código QR DIAN (NIT {vendor['nit']}-{vendor['dv']}): factura tipo {vendor['format'].upper()}")
+            return vendor["format"].upper()
+
+        # Plantillas conocidas: huella visual de la primera página, sin OCR
+        layout_index = get_default_index()
+        if layout_index is not None and len(layout_index):
+            try:
+                tipo, distance = layout_index.classify(document_fingerprint(temp))
+                if tipo and tipo in FORMATS:
+                    print(f"Detección por plantilla (distancia {distance:.3f}): factura tipo {tipo.upper()}")
+                    return tipo.upper()
+            except Exception as e:
+                print(f"Error en la detección por plantilla: {e}")
+
+        # Solo el encabezado de la primera página: se amplía hasta encontrar el proveedor
+        matcher = get_matcher(FORMATS.specs())
+        classifier = get_default_classifier()
+
+        def classify(header_text):
+            if classifier is None:
+                return None, 0.0
+            tipo, probability = classifier.predict(header_text)
+            if tipo in FORMATS and probability >= MIN_CONFIDENCE:
+                return tipo, probability
+            return None, probability
+
+        def vendor_found(header_text):
+            if registry.resolve(header_text):
+                return True
+            if classify(header_text)[0]:
+                return True
+            candidates = matcher.scan(header_text)
+            return bool(candidates) and candidates[0][1] >= DETECTION_MIN_SCORE
+
+        text = temp.extract_header(vendor_found)
         if not text or len(text.strip()) == 0:
-            print("El texto OCR sigue vacío o no es válido tras reintento.")
+            print("El texto del encabezado está vacío o no es válido.")
             return "desconocido"
 
         # Mostrar parte del texto OCR
         preview = text[:400].replace("\n", " ")
         print(f"Fragmento OCR detectado ({len(text)} caracteres):\n{preview}...\n")
-        # Normalización ligera para buscar patrones aproximados
-        clean_text = text.upper().replace(" ", "").replace("\n", "")
-
-        # Detección rápida por palabras clave
-        if any(keyword in clean_text for keyword in ["BBICOLOMBIA", "B8ICOLOMBIA", "BBICOLOMBIASAS"]):
-            print("Detección heurística: factura tipo BBI")
-            return "BBI"
-        if "HELLEN" in clean_text:
-            print("Detección heurística: factura tipo HELLEN")
-            return "HELLEN"
-        if "AGRO" in clean_text:
-            print("Detección heurística: factura tipo AGRO")
-            return "AGRO"
-        if "CUOTAS" in clean_text:
-            print("Detección heurística: factura tipo CUOTAS")
-            return "CUOTAS"
-        if "YARDINS" in clean_text:
-            print("Detección heurística: factura tipo YARDINS")
-            return "YARDINS"
-        if "LATAM" in clean_text:
-            print("Detección heurística: factura tipo LATAM")
-            return "LATAM"
-        if "AVIANCA" in clean_text:
-            print("Detección heurística: factura tipo AVIANCA")
-            return "AVIANCA"
-        if "PROCAFE" in clean_text:
-            print("Detección heurística: factura tipo PROCAFE")
-            return "PROCAFE"
-        if "ADIDAS" in clean_text:
-            print("Detección heurística: factura tipo ADIDAS")
-            return "ADIDAS"
-        if "D1" in clean_text:
-           print("Detección heurística: factura tipo D1")
-           return "D1"
-        
-
-        # Si falla la heurística, usar extractores formales
-        for tipo, extractor_class in EXTRACTORS:
-            if hasattr(extractor_class, 'matches'):
-                try:
-                    if extractor_class.matches(text):
-                        print(f"Tipo detectado: {tipo.upper()}")
-                        return tipo.upper()
-                except Exception as e:
-                    print(f"Error en matches() de {extractor_class.__name__}: {e}")
+        # Primero el NIT del emisor: búsqueda directa en el registro de proveedores
+        vendor = registry.resolve(text)
+        if vendor and vendor["format"] in FORMATS:
+            print(f"Detección por NIT {vendor['nit']}-{vendor['dv']}: factura tipo {vendor['format'].upper()}")
+            return vendor["format"].upper()
+
+        # Clasificador entrenado, si la confianza es alta
+        tipo, probability = classify(text)
+        if tipo:
+            print(f"Detección por clasificador (probabilidad {probability:.2f}): factura tipo {tipo.upper()}")
+            return tipo.upper()
+
+        # Detección en una sola pasada con las palabras clave de todos los formatos
+        candidates = matcher.scan(text)
+        if context is not None:
+            context.detection_candidates = candidates
+        if candidates:
+            for tipo, score, keywords in candidates[:3]:
+                print(f"Candidato {tipo.upper()}: puntaje {score} ({', '.join(keywords)})")
+            tipo = candidates[0][0]
+            print(f"Detección por palabras clave: factura tipo {tipo.upper()}")
+            # Segunda opinión estructural (métricas por línea, sin OCR adicional): necesita
+            # el encabezado con sus saltos de línea; el texto limpio es una sola línea
+            if temp.header_lines:
+                estructura, score = StructureAnalyzer.detect_batch([temp.header_lines])[0]
+                if estructura != "desconocido" and estructura != tipo.upper():
+                    print(f"Aviso: la estructura se parece más a {estructura} (puntaje {score:.2f}).")
+            return tipo.upper()
         print("Ningún extractor coincidió con el texto OCR.")
         return "desconocido"
     except Exception as e:
@@ -116,22 +132,38 @@ def main():
         if not os.path.exists(file_path):
             print(f"El archivo no existe: {file_path}")
             return
-        if not file_path.lower().endswith('.pdf'):
-            print(f"El archivo no es un PDF: {file_path}")
+        if not file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+            print(f"El archivo no es un PDF, XML o ZIP: {file_path}")
+            return
+        # Factura electrónica: XML UBL (solo, en el ZIP o adjunto al PDF), sin OCR
+        data, pdf_path, temp_dir = ingest_file(file_path)
+        if data:
+            print(f"Datos leídos del XML UBL (tipo {document_type(data)}), OCR omitido.")
+            success = True
+        elif pdf_path is None:
+            print(f"El archivo no contiene un XML DIAN ni un PDF: {file_path}")
             return
-        factura_type = detect_factura_type(file_path)
-        if factura_type == "desconocido":
-            print("1No se pudo detectar el tipo de factura.")
-            factura_type = input("Ingrese manualmente el tipo de factura (BBI/HELLEN/CUOTAS): ").strip().upper()
+        else:
+            # Contexto compartido: el OCR de la detección se reutiliza en la extracción
+            context = DocumentContext(pdf_path)
+            if temp_dir:
+                context.add_temp_dir(temp_dir)
+            try:
+                factura_type = detect_factura_type(pdf_path, context=context)
+                if factura_type == "desconocido":
+                    print("1No se pudo detectar el tipo de factura.")
+                    factura_type = input("Ingrese manualmente el tipo de factura (BBI/HELLEN/CUOTAS): ").strip().upper()
 
-            # Validar el tipo ingresado
-            if factura_type not in ['BBI', 'HELLEN', 'CUOTAS', 'AGRO', 'YARDINS']:
-                print("Tipo de factura no válido. Debe ser BBI, HELLEN, AGRO, CUOTAS o YARDINS.")
-                return
+                    # Validar el tipo ingresado
+                    if factura_type not in ['BBI', 'HELLEN', 'CUOTAS', 'AGRO', 'YARDINS']:
+                        print("Tipo de factura no válido. Debe ser BBI, HELLEN, AGRO, CUOTAS o YARDINS.")
+                        return
 
-        # Procesar la factura
-        print(f"\nIniciando procesamiento con extractor: FacturaExtractor{factura_type}")
-        success, data = FacturaProcessor.process_factura(file_path, factura_type)
+                # Procesar la factura
+                print(f"\nIniciando procesamiento con extractor: FacturaExtractor{factura_type}")
+                success, data = FacturaProcessor.process_factura(pdf_path, factura_type, context=context)
+            finally:
+                context.close()
 
         if success:
             print("\nDATOS EXTRAÍDOS:")
@@ -162,12 +194,12 @@ def main():
             print(f"La carpeta no existe: {folder_path}")
             return
 
-        # Obtener todos los archivos PDF en la carpeta
-        pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".pdf")]
+        # Obtener todos los PDF, XML y ZIP de la carpeta
+        pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith(SUPPORTED_EXTENSIONS)]
         if not pdf_files:
-            print("No se encontraron archivos PDF en la carpeta.")
+            print("No se encontraron archivos PDF, XML o ZIP en la carpeta.")
             return
-        print(f"\nSe encontraron {len(pdf_files)} archivos PDF:")
+        print(f"\nSe encontraron {len(pdf_files)} archivos:")
         for i, pdf_file in enumerate(pdf_files, 1):
             print(f"{i}. {pdf_file}")
 
@@ -175,38 +207,59 @@ def main():
         if confirm != "s":
             print("Proceso cancelado.")
             return
-        # Procesar cada archivo
+        # Procesar cada archivo (con el conteo de la validación de montos)
+        validaciones = {}
         for pdf_file in pdf_files:
             file_path = os.path.join(folder_path, pdf_file)
             print(f"\nProcesando: {pdf_file}")
 
             try:
-                # Detectar el tipo de factura
-                factura_type = detect_factura_type(file_path)
-                # Si no se detecta, omitir el archivo
-                if factura_type == "desconocido":
-                    print("No se detectó el tipo. Omitiendo...")
+                # Factura electrónica: XML UBL (solo, en el ZIP o adjunto al PDF), sin OCR
+                xml_data, pdf_path, temp_dir = ingest_file(file_path)
+                if not xml_data and pdf_path is None:
+                    print("No contiene un XML DIAN ni un PDF. Omitiendo...")
                     continue
+                # Contexto compartido: el OCR de la detección se reutiliza en la extracción
+                with DocumentContext(pdf_path or file_path) as context:
+                    if temp_dir:
+                        context.add_temp_dir(temp_dir)
+                    if xml_data:
+                        print(f"Datos leídos del XML UBL (tipo {document_type(xml_data)}), OCR omitido.")
+                        success, data = True, xml_data
+                    else:
+                        # Detectar el tipo de factura
+                        factura_type = detect_factura_type(pdf_path, context=context)
+                        # Si no se detecta, omitir el archivo
+                        if factura_type == "desconocido":
+                            print("No se detectó el tipo. Omitiendo...")
+                            continue
 
-                # Procesar la factura
-                print(f"\nIniciando procesamiento con extractor: FacturaExtractor{factura_type}")
-                success, data = FacturaProcessor.process_factura(file_path, factura_type)
-                if success:
-                    # Crear directorio de salida si no existe
-                    output_dir = os.path.join(folder_path, "data")
-                    os.makedirs(output_dir, exist_ok=True)
-                    csv_file = os.path.join(output_dir, os.path.splitext(pdf_file)[0] + "_extracted.csv")
-                    with open(csv_file, "w", encoding="utf-8") as f:
-                        f.write("Campo,Valor\n")
-                        for k, v in data.items():
-                            f.write(f"{k},{v}\n")
-
-                    print(f"Datos guardados en: {csv_file}")
-                else:
-                    print("No se pudo procesar la factura.")
+                        # Procesar la factura
+                        print(f"\nIniciando procesamiento con extractor: FacturaExtractor{factura_type}")
+                        success, data = FacturaProcessor.process_factura(pdf_path, factura_type, context=context)
+                    if success:
+                        # Crear directorio de salida si no existe
+                        output_dir = os.path.join(folder_path, "data")
+                        os.makedirs(output_dir, exist_ok=True)
+                        csv_file = os.path.join(output_dir, os.path.splitext(pdf_file)[0] + "_extracted.csv")
+                        with open(csv_file, "w", encoding="utf-8") as f:
+                            f.write("Campo,Valor\n")
+                            for k, v in data.items():
+                                f.write(f"{k},{v}\n")
+
+                        print(f"Datos guardados en: {csv_file}")
+                        estado = data.get(FacturaProcessor.CAMPO_VALIDACION)
+                        if estado:
+                            validaciones.setdefault(estado, []).append(pdf_file)
+                    else:
+                        print("No se pudo procesar la factura.")
             except Exception as e:
                 print(f"Error procesando {pdf_file}: {e}")
                 print("Omitiendo este archivo y continuando con el siguiente...")
+        if validaciones:
+            print("\nValidación de montos: " + ", ".join(f"{len(files)} {estado}" for estado, files in validaciones.items()))
+            for pdf_file in validaciones.get("fallida", []):
+                print(f"  Revisar: {pdf_file}")
     else:
         print("Opción no válida. Elija 1 o 2.")
 
@@ -0,0 +1,215 @@
+import os
+import importlib.util
+import queue
+import shlex
+import threading
+import subprocess
+import cv2
+import numpy as np
+
+
+class OCRBackend:
+    """
+    Interfaz común de los motores OCR usados por TextExtractor.
+    Recibe imágenes NumPy (escala de grises o RGB) y devuelve texto.
+    """
+    name = "base"
+
+    def image_to_string(self, image, lang="spa", config="", threads=None):
+        raise NotImplementedError("Debe implementarse en la subclase.")
+
+    def image_to_data(self, image, lang="spa", config="", threads=None):
+        """Palabras con caja y confianza en el TSV de Tesseract (ver word_boxes.parse_tsv)."""
+        raise NotImplementedError("Debe implementarse en la subclase.")
+
+    def close(self):
+        """Libera los recursos del motor (procesos, modelos cargados)."""
+
+
+class TesseractCLIBackend(OCRBackend):
+    """
+    Un proceso de Tesseract por imagen, alimentado por stdin/stdout.
+    No escribe archivos temporales ni modifica el estado global de pytesseract:
+    cada instancia guarda su propia ruta al ejecutable.
+    """
+    name = "cli"
+
+    def __init__(self, tesseract_cmd="tesseract"):
+        self.tesseract_cmd = tesseract_cmd or "tesseract"
+
+    def _run(self, image, lang, config, threads, output_format=None):
+        image = np.ascontiguousarray(image)
+        ext = ".pgm" if image.ndim == 2 else ".ppm"
+        ok, encoded = cv2.imencode(ext, image)
+        if not ok:
+            raise RuntimeError("No se pudo codificar la imagen para Tesseract.")
+        cmd = [self.tesseract_cmd, "stdin", "stdout", "-l", lang]
+        if config:
+            cmd += shlex.split(config)
+        if output_format:
+            cmd.append(output_format)
+        env = None
+        if threads:
+            # Límite de hilos OpenMP solo para este proceso, sin tocar os.environ
+            env = dict(os.environ, OMP_THREAD_LIMIT=str(threads))
+        result = subprocess.run(cmd, input=encoded.tobytes(), capture_output=True, env=env)
+        if result.returncode != 0:
+            stderr = result.stderr.decode("utf-8", errors="replace")
+            raise RuntimeError(f"Error ejecutando Tesseract: {stderr}")
+        return result.stdout.decode("utf-8", errors="replace")
+
+    def image_to_string(self, image, lang="spa", config="", threads=None):
+        return self._run(image, lang, config, threads)
+
+    def image_to_data(self, image, lang="spa", config="", threads=None):
+        return self._run(image, lang, config, threads, output_format="tsv")
+
+
+class TesserocrPoolBackend(OCRBackend):
+    """
+    Pool de motores Tesseract en el mismo proceso (requiere el paquete tesserocr).
+    Cada motor mantiene el modelo del idioma cargado entre páginas, así que no se
+    paga el arranque del ejecutable ni la carga de traineddata por cada imagen.
+    """
+    name = "pool"
+
+    def __init__(self, tessdata_path=None, lang="spa", size=None):
+        # OpenMP lee el límite al cargarse con tesserocr: se fija solo durante el import
+        # y se restaura después, para no dejar en un solo hilo los Tesseract por línea de
+        # comandos del proceso. La concurrencia la da el pool, no los hilos de cada motor.
+        if importlib.util.find_spec("tesserocr") is None:
+            raise ImportError("No module named 'tesserocr'")
+        previous = os.environ.get("OMP_THREAD_LIMIT")
+        os.environ["OMP_THREAD_LIMIT"] = previous or "1"
+        try:
+            import tesserocr
+        finally:
+            if previous is None:
+                del os.environ["OMP_THREAD_LIMIT"]
+        self._tesserocr = tesserocr
+        self.tessdata_path = tessdata_path
+        self.lang = lang
+        self.size = max(1, size or min(4, os.cpu_count() or 1))
+        self._engines = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_engine(self, lang):
+        kwargs = {"lang": lang}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path
+        return self._tesserocr.PyTessBaseAPI(**kwargs)
+
+    def _acquire(self):
+        try:
+            return self._engines.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._new_engine(self.lang)
+        return self._engines.get()
+
+    def _release(self, engine):
+        engine.Clear()
+        self._engines.put(engine)
+
+    @staticmethod
+    def _set_image(engine, image):
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        engine.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+
+    @staticmethod
+    def _apply_config(engine, config):
+        """
+        Soporta las opciones de configuración usadas en el proyecto (--psm y -c clave=valor).
+        Retorna lo necesario para restaurar el motor: (modo de segmentación, {variable: valor previo}).
+        """
+        previous_psm = engine.GetPageSegMode()
+        previous_vars = {}
+        args = shlex.split(config or "")
+        i = 0
+        while i < len(args):
+            if args[i] == "--psm" and i + 1 < len(args):
+                engine.SetPageSegMode(int(args[i + 1]))
+                i += 2
+            elif args[i] == "-c" and i + 1 < len(args):
+                key, _, value = args[i + 1].partition("=")
+                if key not in previous_vars:
+                    previous_vars[key] = engine.GetVariableAsString(key) or ""
+                engine.SetVariable(key, value)
+                i += 2
+            else:
+                i += 1
+        return previous_psm, previous_vars
+
+    @staticmethod
+    def _restore_config(engine, saved):
+        """Deja el motor como estaba: Clear() no restaura el modo ni las variables."""
+        previous_psm, previous_vars = saved
+        engine.SetPageSegMode(previous_psm)
+        for key, value in previous_vars.items():
+            engine.SetVariable(key, value)
+
+    def _recognize(self, image, lang, config, output):
+        if lang != self.lang:
+            raise RuntimeError(f"El pool de Tesseract está cargado con '{self.lang}', no con '{lang}'.")
+        engine = self._acquire()
+        saved = None
+        try:
+            saved = self._apply_config(engine, config)
+            self._set_image(engine, image)
+            return output(engine)
+        finally:
+            # Un recorte con --psm 7 y lista blanca no debe contaminar el OCR de las páginas siguientes
+            if saved is not None:
+                self._restore_config(engine, saved)
+            self._release(engine)
+
+    def image_to_string(self, image, lang="spa", config="", threads=None):
+        return self._recognize(image, lang, config, lambda engine: engine.GetUTF8Text())
+
+    def image_to_data(self, image, lang="spa", config="", threads=None):
+        # Mismas columnas que la salida "tsv" del ejecutable, sin la fila de encabezado
+        return self._recognize(image, lang, config, lambda engine: engine.GetTSVText(0))
+
+    def close(self):
+        while True:
+            try:
+                self._engines.get_nowait().End()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_default_backend(tesseract_cmd=None):
+    """
+    Motor OCR compartido por el proceso. OCR_BACKEND elige el tipo:
+    "pool" (tesserocr, modelos cargados en memoria), "cli" (un proceso por página)
+    o "auto" (pool si tesserocr está instalado; si no, cli).
+    """
+    kind = os.environ.get("OCR_BACKEND", "auto").lower()
+    with _backends_lock:
+        key = (kind, tesseract_cmd)
+        if key in _backends:
+            return _backends[key]
+        backend = None
+        if kind in ("auto", "pool"):
+            tessdata = os.path.join(os.path.dirname(tesseract_cmd), "tessdata") if tesseract_cmd else None
+            try:
+                backend = TesserocrPoolBackend(tessdata_path=tessdata)
+            except ImportError:
+                if kind == "pool":
+                    print("tesserocr no está instalado; se usará Tesseract por línea de comandos.")
+        if backend is None:
+            backend = TesseractCLIBackend(tesseract_cmd)
+        print(f"Motor OCR: {backend.name}")
+        _backends[key] = backend
+        return backend
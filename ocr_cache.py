@@ -0,0 +1,255 @@
+import os
+import json
+import atexit
+import time
+import zlib
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+
+class OCRCache:
+    """
+    Caché persistente de resultados OCR, direccionada por contenido.
+    La clave combina el hash SHA-256 del archivo con los parámetros de OCR
+    (dpi, idioma, modo rápido, versión de preprocesamiento, ...), así que una
+    factura reenviada o subida de nuevo no vuelve a pasar por Tesseract.
+
+    Se guarda en SQLite (modo WAL) para que varios procesos de la aplicación
+    en el mismo equipo puedan compartirla. Los textos se guardan comprimidos
+    con zlib y se expulsan por LRU cuando se supera el presupuesto de bytes.
+
+    Un acierto no escribe en la base: la hora de acceso (para el LRU) y los
+    contadores se acumulan en memoria y se escriben juntos cada FLUSH_EVERY
+    lecturas o FLUSH_SECONDS segundos, antes de cada put() y al salir.
+    """
+    DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "factura_ocr_cache.sqlite")
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    FLUSH_EVERY = 100
+    FLUSH_SECONDS = 30.0
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or self.DEFAULT_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else self.DEFAULT_MAX_BYTES
+        # Contadores de este proceso (los globales se guardan en la tabla stats)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        # Accesos {clave: hora} y contadores {nombre: n} aún no escritos
+        self._pending_access = {}
+        self._pending_stats = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    # Conexión por hilo: sqlite3 no permite compartir conexiones entre hilos
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_access ON ocr_cache(last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(content, **params):
+        """Clave = hash del contenido del archivo + parámetros de OCR ordenados."""
+        return OCRCache.key_for_digest(hashlib.sha256(content).hexdigest(), **params)
+
+    @staticmethod
+    def key_for_digest(digest, **params):
+        """Como make_key, con el SHA-256 (hex) del archivo ya calculado."""
+        return digest + ":" + json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+    def _record(self, name, key=None):
+        """Acumula un contador (y el acceso a `key`); escribe el lote si ya toca."""
+        with self._pending_lock:
+            self._pending_stats[name] = self._pending_stats.get(name, 0) + 1
+            if key is not None:
+                self._pending_access[key] = time.time()
+            due = (
+                sum(self._pending_stats.values()) >= self.FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= self.FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def _write_pending(self, conn):
+        """Escribe los accesos y contadores acumulados (quien llama abre la transacción)."""
+        with self._pending_lock:
+            access, counters = self._pending_access, self._pending_stats
+            self._pending_access, self._pending_stats = {}, {}
+            self._last_flush = time.monotonic()
+        # Otro proceso pudo registrar un acceso más reciente
+        conn.executemany(
+            "UPDATE ocr_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+            [(when, key) for key, when in access.items()]
+        )
+        conn.executemany(
+            "INSERT INTO stats(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(counters.items())
+        )
+
+    def flush(self):
+        """Escribe en una transacción los accesos y contadores acumulados por get()."""
+        if not self._pending_access and not self._pending_stats:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_pending(conn)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error escribiendo los accesos de la caché OCR: {e}")
+
+    def get(self, key):
+        """
+        Devuelve el valor guardado (dict) o None. El acceso para el LRU se escribe por lotes.
+        Una entrada que no se puede descomprimir cuenta como fallo y se elimina.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error leyendo la caché OCR: {e}")
+            return None
+        value = None
+        if row is not None:
+            try:
+                value = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+            except (zlib.error, ValueError) as e:
+                print(f"Entrada corrupta en la caché OCR, se elimina: {e}")
+                self._discard(conn, key)
+        if value is None:
+            self.misses += 1
+            self._record("misses")
+            return None
+        self.hits += 1
+        self._record("hits", key)
+        return value
+
+    def _discard(self, conn, key):
+        """Elimina una entrada (y su acceso pendiente, para no reescribirla en el LRU)."""
+        with self._pending_lock:
+            self._pending_access.pop(key, None)
+        try:
+            conn.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"Error eliminando la entrada de la caché OCR: {e}")
+
+    def put(self, key, value):
+        """Guarda un valor (dict serializable) y expulsa entradas antiguas si hace falta."""
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 6)
+        if len(blob) > self.max_bytes:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache(key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time())
+            )
+            # El LRU decide con los accesos al día
+            self._write_pending(conn)
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error escribiendo la caché OCR: {e}")
+
+    def _evict(self, conn):
+        """Expulsa las entradas menos usadas recientemente hasta respetar max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access ASC").fetchall():
+            if total - freed <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+            freed += size
+            evicted += 1
+        if evicted:
+            conn.execute(
+                "INSERT INTO stats(name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                (evicted, evicted)
+            )
+            print(f"Caché OCR: {evicted} entradas expulsadas ({freed} bytes).")
+
+    def stats(self):
+        """Estadísticas globales (todas las instancias) y de este proceso."""
+        self.flush()
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "process_hits": self.hits,
+            "process_misses": self.misses,
+        }
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM ocr_cache")
+        conn.execute("DELETE FROM stats")
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Caché compartida del proceso, configurable por entorno:
+    OCR_CACHE_PATH (ruta del archivo; "off" la desactiva) y OCR_CACHE_MAX_MB.
+    """
+    global _default_cache
+    path = os.environ.get("OCR_CACHE_PATH")
+    if path and path.lower() in ("off", "0", "false", "none"):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            max_mb = os.environ.get("OCR_CACHE_MAX_MB")
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+            try:
+                _default_cache = OCRCache(path, max_bytes)
+            except (sqlite3.Error, OSError) as e:
+                print(f"No se pudo abrir la caché OCR: {e}")
+                return None
+        return _default_cache
+
+
+if __name__ == "__main__":
+    cache = get_default_cache()
+    if cache is None:
+        print("Caché OCR desactivada.")
+    else:
+        print(f"Caché OCR: {cache.path}")
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
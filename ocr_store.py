@@ -0,0 +1,381 @@
+import os
+import sys
+import csv
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class OCRStore:
+    """
+    Almacén durable del texto de cada documento procesado, por hash SHA-256 del
+    contenido: texto (OCR o capa de texto), cajas de palabras, campos conocidos
+    (código QR DIAN), correcciones de la relectura y el último resultado.
+    A diferencia de la caché OCR no expulsa nada ni depende de los parámetros de
+    OCR: es el archivo del que se vuelven a extraer los datos cuando cambia un
+    patrón, sin volver a pasar los documentos por Tesseract (ver reextract).
+    SQLite en modo WAL; el texto y las palabras se guardan comprimidos con zlib.
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ocr_store.sqlite")
+    # Documentos leídos de SQLite por consulta al recorrer el almacén
+    FETCH_SIZE = 500
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    # Conexión por hilo: sqlite3 no permite compartir conexiones entre hilos
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " digest TEXT PRIMARY KEY, file_name TEXT, factura_type TEXT NOT NULL,"
+            " text_source TEXT, text BLOB NOT NULL, words BLOB, known TEXT, overrides TEXT,"
+            " data TEXT, updated REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(factura_type)")
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _pack(value):
+        return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 6)
+
+    @staticmethod
+    def _unpack(blob):
+        return json.loads(zlib.decompress(blob).decode("utf-8")) if blob is not None else None
+
+    def put(self, digest, factura_type, text, text_source=None, words=None, known=None,
+            overrides=None, data=None, file_name=None):
+        """
+        Guarda (o reemplaza) el documento. `words` es DocumentWords.to_dict();
+        `overrides` es {campo: [valor de los patrones, valor corregido]} para
+        las correcciones que no salen del texto (relectura OCR, reparaciones).
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents"
+                "(digest, file_name, factura_type, text_source, text, words, known, overrides, data, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    digest, file_name, factura_type, text_source, self._pack(text or ""),
+                    self._pack(words) if words is not None else None,
+                    json.dumps(known or {}, ensure_ascii=False),
+                    json.dumps(overrides or {}, ensure_ascii=False),
+                    json.dumps(data, ensure_ascii=False) if data is not None else None,
+                    time.time(),
+                )
+            )
+        except sqlite3.Error as e:
+            print(f"Error escribiendo el almacén OCR: {e}")
+
+    def get(self, digest):
+        """Documento guardado como diccionario (texto y palabras ya descomprimidos), o None."""
+        row = self._connect().execute(
+            "SELECT digest, file_name, factura_type, text_source, text, words, known, overrides, data"
+            " FROM documents WHERE digest = ?", (digest,)
+        ).fetchone()
+        return self.decode(row) if row else None
+
+    @classmethod
+    def decode(cls, row):
+        digest, file_name, factura_type, text_source, text, words, known, overrides, data = row
+        return {
+            "digest": digest,
+            "file_name": file_name,
+            "factura_type": factura_type,
+            "text_source": text_source,
+            "text": cls._unpack(text),
+            "words": cls._unpack(words),
+            "known": json.loads(known or "{}"),
+            "overrides": json.loads(overrides or "{}"),
+            "data": json.loads(data) if data else None,
+        }
+
+    def iter_rows(self, factura_types=None):
+        """
+        Filas crudas (sin descomprimir) en orden de hash, por bloques de FETCH_SIZE:
+        recorrer cien mil documentos no los carga todos en memoria.
+        """
+        conn = self._connect()
+        query = ("SELECT digest, file_name, factura_type, text_source, text, words, known, overrides, data"
+                 " FROM documents WHERE digest > ?")
+        params = []
+        if factura_types:
+            query += f" AND factura_type IN ({', '.join('?' for _ in factura_types)})"
+            params = list(factura_types)
+        query += " ORDER BY digest LIMIT ?"
+        last = ""
+        while True:
+            rows = conn.execute(query, [last] + params + [self.FETCH_SIZE]).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def update_data(self, results):
+        """Reemplaza el último resultado de varios documentos: [(digest, data)] en una transacción."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE documents SET data = ?, updated = ? WHERE digest = ?",
+                [(json.dumps(data, ensure_ascii=False), time.time(), digest) for digest, data in results]
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error escribiendo el almacén OCR: {e}")
+
+    def stats(self):
+        conn = self._connect()
+        by_type = dict(conn.execute("SELECT factura_type, COUNT(*) FROM documents GROUP BY factura_type").fetchall())
+        size = conn.execute("SELECT COALESCE(SUM(LENGTH(text) + COALESCE(LENGTH(words), 0)), 0) FROM documents").fetchone()[0]
+        return {"documents": sum(by_type.values()), "bytes": size, "by_type": by_type}
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    """Almacén compartido del proceso; OCR_STORE_PATH cambia el archivo ("off" lo desactiva)."""
+    global _default_store
+    path = os.environ.get("OCR_STORE_PATH")
+    if path and path.lower() in ("off", "0", "false", "none"):
+        return None
+    with _default_lock:
+        if _default_store is None:
+            try:
+                _default_store = OCRStore(path)
+            except (sqlite3.Error, OSError) as e:
+                print(f"No se pudo abrir el almacén OCR: {e}")
+                return None
+        return _default_store
+
+
+# Re-extracción masiva
+# Campos del resultado que no salen de los patrones (dependen del OCR o de la validación)
+DERIVED_FIELDS = ("campos_revision",)
+# Documentos por tarea enviada a cada proceso
+CHUNK_SIZE = 200
+
+
+def reextract_document(row):
+    """
+    Datos del documento con el extract_data actual de su formato, sobre el texto
+    guardado. Las correcciones guardadas (relectura OCR, reparaciones) se
+    reaplican solo si los patrones siguen dando el mismo valor que corrigieron;
+    si el patrón cambió, manda el patrón. Las invariantes se vuelven a evaluar.
+    La geometría de campos solo se consulta: aprender durante la re-extracción
+    haría depender el resultado del orden de los documentos (y varios procesos
+    reescribirían el archivo a la vez).
+    Retorna (digest, datos nuevos) o (digest, None) si el formato ya no existe.
+    """
+    from word_boxes import get_default_geometry
+
+    geometry = get_default_geometry()
+    if geometry is None:
+        return _reextract(row)
+    learning, geometry.learning = geometry.learning, False
+    try:
+        return _reextract(row)
+    finally:
+        geometry.learning = learning
+
+
+def _reextract(row):
+    from format_registry import FORMATS
+    from factura_processor import FacturaProcessor
+    from validation import validate, apply_repairs
+    from word_boxes import DocumentWords
+
+    document = OCRStore.decode(row)
+    factura_type = document["factura_type"]
+    FORMATS.refresh_json_formats()
+    if factura_type not in FORMATS:
+        return document["digest"], None
+    extractor = FORMATS[factura_type].from_stored(
+        document["text"],
+        words=DocumentWords.from_dict(document["words"]) if document["words"] else None,
+        known_fields=document["known"],
+        file_name=document["file_name"],
+    )
+    data = extractor.extract_data()
+    for field, value in document["known"].items():
+        data.setdefault(field, value)
+    corrected_fields = []
+    for field, (extracted, corrected) in document["overrides"].items():
+        if data.get(field) == extracted:
+            data[field] = corrected
+            corrected_fields.append(field)
+    previous = document["data"] or {}
+    for field in DERIVED_FIELDS:
+        if field in previous:
+            data[field] = previous[field]
+    if FacturaProcessor.USAR_VALIDACION and getattr(extractor, "FIELD_SPEC", None):
+        from field_spec import load_spec
+        matcher = load_spec(extractor.FIELD_SPEC)
+        doubtful = [f.strip() for f in previous.get(FacturaProcessor.CAMPO_REVISION, "").split(";") if f.strip()]
+        missing = [
+            field for field in FacturaProcessor._campos_no_encontrados(extractor, matcher)
+            if field not in corrected_fields
+        ]
+        result = validate(data, matcher.invariants, doubtful=doubtful, missing=missing)
+        apply_repairs(data, result)
+        if result.repairs:
+            doubtful += [field for field in result.repairs if field not in doubtful]
+            data[FacturaProcessor.CAMPO_REVISION] = "; ".join(doubtful)
+        data[FacturaProcessor.CAMPO_VALIDACION] = result.status
+    return document["digest"], data
+
+
+def _reextract_chunk(rows):
+    results = []
+    for row in rows:
+        try:
+            results.append(reextract_document(row))
+        except Exception as e:
+            print(f"Error re-extrayendo {row[0][:12]}: {e}")
+            results.append((row[0], None))
+    return results
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def reextract(store, factura_types=None, workers=None, diff_path=None, save=False):
+    """
+    Vuelve a extraer los datos de todos los documentos del almacén (o de los
+    formatos indicados) con los patrones actuales, sin OCR. Con `workers` > 1
+    reparte bloques de CHUNK_SIZE documentos entre procesos, con a lo sumo dos
+    bloques en vuelo por proceso. Escribe en `diff_path` (CSV) cada campo que
+    cambió respecto al último resultado guardado; con `save`, el resultado nuevo
+    reemplaza al guardado. Retorna el resumen.
+    """
+    start = time.perf_counter()
+    summary = {"documents": 0, "changed": 0, "skipped": 0, "fields": {}}
+    names = {}
+    diff_file = open(diff_path, "w", encoding="utf-8", newline="") if diff_path else None
+    writer = csv.writer(diff_file) if diff_file else None
+    if writer:
+        writer.writerow(["digest", "archivo", "formato", "campo", "anterior", "nuevo"])
+
+    def rows():
+        for row in store.iter_rows(factura_types):
+            names[row[0]] = (row[1], row[2], json.loads(row[8]) if row[8] else {})
+            yield row
+
+    def collect(results):
+        updates = []
+        for digest, data in results:
+            file_name, factura_type, previous = names.pop(digest)
+            summary["documents"] += 1
+            if data is None:
+                summary["skipped"] += 1
+                continue
+            changed = [
+                field for field in sorted(set(previous) | set(data))
+                if str(previous.get(field, "")) != str(data.get(field, ""))
+            ]
+            if not changed:
+                continue
+            summary["changed"] += 1
+            updates.append((digest, data))
+            for field in changed:
+                summary["fields"][field] = summary["fields"].get(field, 0) + 1
+                if writer:
+                    writer.writerow([digest, file_name, factura_type, field, previous.get(field, ""), data.get(field, "")])
+        if save and updates:
+            store.update_data(updates)
+
+    try:
+        if not workers or workers <= 1:
+            for chunk in _chunks(rows(), CHUNK_SIZE):
+                collect(_reextract_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = []
+                for chunk in _chunks(rows(), CHUNK_SIZE):
+                    pending.append(pool.submit(_reextract_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        collect(pending.pop(0).result())
+                for future in pending:
+                    collect(future.result())
+    finally:
+        if diff_file:
+            diff_file.close()
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+if __name__ == "__main__":
+    # Uso: python ocr_store.py stats
+    #      python ocr_store.py reextract [formato ...] [--workers N] [--diff cambios.csv] [--guardar]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "reextract"):
+        print("Uso: python ocr_store.py stats")
+        print("     python ocr_store.py reextract [formato ...] [--workers N] [--diff cambios.csv] [--guardar]")
+        sys.exit(1)
+    store = get_default_store()
+    if store is None:
+        print("Almacén OCR desactivado.")
+        sys.exit(1)
+    if sys.argv[1] == "stats":
+        print(f"Almacén OCR: {store.path}")
+        for name, value in store.stats().items():
+            print(f"{name}: {value}")
+        sys.exit(0)
+
+    args = sys.argv[2:]
+    workers, diff_path, save, factura_types = os.cpu_count() or 1, None, False, []
+    i = 0
+    while i < len(args):
+        if args[i] == "--workers" and i + 1 < len(args):
+            workers = int(args[i + 1])
+            i += 2
+        elif args[i] == "--diff" and i + 1 < len(args):
+            diff_path = args[i + 1]
+            i += 2
+        elif args[i] == "--guardar":
+            save = True
+            i += 1
+        else:
+            factura_types.append(args[i].lower())
+            i += 1
+    summary = reextract(store, factura_types or None, workers=workers, diff_path=diff_path, save=save)
+    print(f"{summary['documents']} documentos en {summary['seconds']}s: "
+          f"{summary['changed']} con cambios, {summary['skipped']} sin formato registrado.")
+    for field, count in sorted(summary["fields"].items(), key=lambda item: -item[1]):
+        print(f"  {field}: {count}")
+    if diff_path:
+        print(f"Diferencias en: {diff_path}")
+    if summary["changed"] and not save:
+        print("Use --guardar para reemplazar los resultados guardados.")
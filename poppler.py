@@ -0,0 +1,15 @@
+import os
+
+
+# Carpeta de los ejecutables de Poppler (modificar según la instalación)
+DEFAULT_POPPLER_PATH = r"utils\poppler-24.08.0\Library\bin"
+
+
+def find_poppler_tool(name, poppler_path=DEFAULT_POPPLER_PATH):
+    """Devuelve la ruta a un ejecutable de Poppler (pdftoppm, pdftotext, pdfdetach, ...)."""
+    if not poppler_path or not os.path.isdir(poppler_path):
+        raise RuntimeError("Poppler no está disponible")
+    tool_path = os.path.join(poppler_path, f"{name}.exe")
+    if not os.path.exists(tool_path):
+        raise RuntimeError(f"No se encontró {name}.exe en {poppler_path}")
+    return tool_path
@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+
+# ETAPAS
+# Cada etapa recibe y devuelve una imagen en escala de grises (uint8).
+# Las etapas que deciden el resto del flujo devuelven (imagen, continuar).
+
+def to_gray(image):
+    """Convierte a escala de grises (las imágenes rasterizadas con -gray ya vienen así)."""
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def skip_if_clean(gray, mid_ratio=0.02, sample=4):
+    """
+    Control de calidad rápido sobre una muestra de la imagen: un render digital
+    limpio es casi bimodal (fondo blanco, texto negro). Si hay pocos píxeles en
+    tonos medios, no hace falta binarizar y el resto de etapas se omite.
+    """
+    small = gray[::sample, ::sample]
+    mid = np.count_nonzero((small > 64) & (small < 192))
+    clean = mid <= small.size * mid_ratio and cv2.mean(small)[0] > 127
+    return gray, not clean
+
+
+def denoise(gray):
+    """Filtro de mediana 3x3: elimina ruido sal y pimienta de escaneos."""
+    return cv2.medianBlur(gray, 3)
+
+
+def deskew(gray, max_angle=10.0, min_angle=0.3):
+    """Endereza la página según el rectángulo mínimo que contiene la tinta."""
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(ink)
+    if coords is None or len(coords) < 100:
+        return gray
+    angle = cv2.minAreaRect(coords)[-1]
+    # OpenCV >= 4.5 devuelve ángulos en (0, 90]
+    if angle > 45:
+        angle -= 90
+    if abs(angle) < min_angle or abs(angle) > max_angle:
+        return gray
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def adaptive_gaussian(gray, block_size=11, c=2):
+    """Umbral adaptativo gaussiano (el preprocesamiento original del proyecto)."""
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, c)
+
+
+def otsu(gray):
+    """Umbral global de Otsu: el más barato, adecuado para fondos uniformes."""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def sauvola(gray, window=25, k=0.2, r=128.0):
+    """Umbral de Sauvola vectorizado con filtros de caja (media y varianza locales)."""
+    img = gray.astype(np.float32)
+    mean = cv2.boxFilter(img, cv2.CV_32F, (window, window))
+    sq_mean = cv2.boxFilter(img * img, cv2.CV_32F, (window, window))
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    threshold = mean * (1 + k * (std / r - 1))
+    return np.where(img > threshold, 255, 0).astype(np.uint8)
+
+
+def invert_if_dark(binary):
+    """Asegura texto oscuro sobre fondo claro."""
+    if cv2.mean(binary)[0] < 127:
+        return cv2.bitwise_not(binary)
+    return binary
+
+
+STAGES = {
+    "gris": to_gray,
+    "omitir_si_limpia": skip_if_clean,
+    "denoise": denoise,
+    "deskew": deskew,
+    "adaptativo": adaptive_gaussian,
+    "otsu": otsu,
+    "sauvola": sauvola,
+    "invertir": invert_if_dark,
+}
+
+# Perfiles: etapas en orden. "clasico" reproduce el preprocesamiento original.
+PROFILES = {
+    "clasico": ["gris", "adaptativo", "invertir"],
+    "limpio": ["gris", "omitir_si_limpia", "adaptativo", "invertir"],
+    "rapido": ["gris", "omitir_si_limpia", "otsu", "invertir"],
+    "escaneo": ["gris", "denoise", "deskew", "sauvola", "invertir"],
+}
+
+DEFAULT_PROFILE = os.environ.get("OCR_PREPROCESS_PROFILE", "clasico")
+
+
+class PreprocessingPipeline:
+    """
+    Secuencia configurable de etapas de preprocesamiento.
+    run() devuelve la imagen final y el costo (ms) de cada etapa ejecutada.
+    """
+    def __init__(self, profile=None, stages=None):
+        self.profile = profile or DEFAULT_PROFILE
+        if stages is None:
+            if self.profile not in PROFILES:
+                raise ValueError(f"Perfil de preprocesamiento desconocido: {self.profile}")
+            stages = PROFILES[self.profile]
+        unknown = [name for name in stages if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Etapas de preprocesamiento desconocidas: {', '.join(unknown)}")
+        self.stages = list(stages)
+
+    def run(self, image):
+        timings = []
+        for name in self.stages:
+            start = time.perf_counter()
+            result = STAGES[name](image)
+            elapsed = (time.perf_counter() - start) * 1000
+            timings.append((name, elapsed))
+            if isinstance(result, tuple):
+                image, keep_going = result
+                if not keep_going:
+                    break
+            else:
+                image = result
+        return image, timings
+
+
+def benchmark(images, profiles=None, ocr_backend=None, lang="spa"):
+    """
+    Ejecuta cada perfil sobre las imágenes y devuelve el costo por etapa.
+    Con un motor OCR también mide el OCR y cuenta los caracteres reconocidos,
+    para comparar costo y resultado de cada perfil en un formato.
+    """
+    results = {}
+    for profile in profiles or PROFILES:
+        pipeline = PreprocessingPipeline(profile)
+        totals = {}
+        ocr_ms = 0.0
+        chars = 0
+        for image in images:
+            processed, timings = pipeline.run(image)
+            for name, elapsed in timings:
+                totals[name] = totals.get(name, 0.0) + elapsed
+            if ocr_backend is not None:
+                start = time.perf_counter()
+                text = ocr_backend.image_to_string(processed, lang=lang)
+                ocr_ms += (time.perf_counter() - start) * 1000
+                chars += len(text.strip())
+        results[profile] = {
+            "etapas_ms": totals,
+            "preproceso_ms": sum(totals.values()),
+            "ocr_ms": ocr_ms,
+            "caracteres": chars,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # Uso: python preprocessing.py <archivo.pdf|imagen> [perfil ...] [--ocr]
+    if len(sys.argv) < 2:
+        print("Uso: python preprocessing.py <archivo.pdf|imagen> [perfil ...] [--ocr]")
+        sys.exit(1)
+    from text_extractor import TextExtractor
+
+    path = sys.argv[1]
+    with_ocr = "--ocr" in sys.argv
+    profiles = [arg for arg in sys.argv[2:] if arg != "--ocr"] or None
+    extractor = TextExtractor(path)
+    page_count = extractor._page_count()
+    pages = [extractor._get_page_image(extractor._resolve_dpi(), page) for page in range(1, page_count + 1)]
+    report = benchmark(pages, profiles, extractor.ocr_backend if with_ocr else None)
+    for profile, row in report.items():
+        stages = ", ".join(f"{name} {ms:.1f}ms" for name, ms in row["etapas_ms"].items())
+        line = f"{profile:10s} preproceso {row['preproceso_ms']:.1f}ms [{stages}]"
+        if with_ocr:
+            line += f" | OCR {row['ocr_ms']:.0f}ms, {row['caracteres']} caracteres"
+        print(line)
+    extractor.context.close()
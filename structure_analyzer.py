@@ -1,155 +1,238 @@
 import numpy as np
-from text_extractor import TextExtractor
 import re
 
+# Orden de las métricas en el vector de características
+FEATURES = [
+    "num_blocks",
+    "avg_width",
+    "avg_height",
+    "y_density",
+    "height_var",
+    "column_count",
+    "bbi_keywords",
+    "hellen_keywords",
+    "cuotas_keywords",
+]
+
+# Palabras clave por familia, en una sola expresión (un grupo con nombre por familia)
+KEYWORD_FAMILIES = {
+    "bbi_keywords": r"\bBBI\b|BBICOLOMBIASAS",
+    "hellen_keywords": r"\bCINE\s+COLOMBIA\b|CINE\s+S\.A\.S\.",
+    "cuotas_keywords": r"\bCUOTAS\b|PLAN\s+DE\s+PAGO",
+}
+KEYWORD_REGEX = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in KEYWORD_FAMILIES.items()),
+    re.IGNORECASE,
+)
+COLUMN_REGEX = re.compile(r"\S[ \t]{5,}")
+
+# --- Patrones basados en métricas y palabras clave: rangos (mínimo, máximo) ---
+PATTERNS = {
+    "bbi": {
+        "num_blocks": (100, 200),
+        "avg_width": (10, 20),
+        "column_count": (1, 2),
+        "y_density": (7, 10),
+        "bbi_keywords": (1, 10),
+        "hellen_keywords": (0, 0),
+        "cuotas_keywords": (0, 0),
+    },
+    "hellen": {
+        "num_blocks": (30, 60),
+        "avg_width": (20, 30),
+        "column_count": (1, 1),
+        "y_density": (3, 5),
+        "bbi_keywords": (0, 0),
+        "hellen_keywords": (1, 5),
+        "cuotas_keywords": (0, 0),
+    },
+    "cuotas": {
+        "num_blocks": (20, 50),
+        "avg_width": (20, 40),
+        "column_count": (1, 1),
+        "y_density": (2, 6),
+        "bbi_keywords": (0, 0),
+        "hellen_keywords": (0, 0),
+        "cuotas_keywords": (1, 5),
+    },
+}
+
+# Pesos para cada métrica (más peso = más importante)
+WEIGHTS = {
+    "num_blocks": 1.2,
+    "avg_width": 1.0,
+    "column_count": 1.0,
+    "y_density": 1.0,
+    "bbi_keywords": 2.5,
+    "hellen_keywords": 2.5,
+    "cuotas_keywords": 2.5,
+}
+
+# Umbral mínimo de confianza
+MIN_SCORE = 0.5
+
+
+def _pattern_arrays(patterns):
+    """Matrices (tipos x métricas) de mínimos, máximos y pesos; peso 0 = métrica no usada."""
+    names = list(patterns)
+    low = np.zeros((len(names), len(FEATURES)))
+    high = np.zeros((len(names), len(FEATURES)))
+    weights = np.zeros((len(names), len(FEATURES)))
+    for i, name in enumerate(names):
+        for key, (min_val, max_val) in patterns[name].items():
+            j = FEATURES.index(key)
+            low[i, j], high[i, j] = min_val, max_val
+            weights[i, j] = WEIGHTS.get(key, 1.0)
+    return names, low, high, weights
+
+
 class StructureAnalyzer:
     """
     Analiza la estructura general de una factura (sin depender del texto literal)
     para identificar el tipo de formato (BBI, Hellen, Cuotas, etc.).
+    Las métricas se calculan en una pasada sobre el texto y se comparan con
+    todos los patrones a la vez; también se puede puntuar un lote de textos.
     """
-    def __init__(self, file_path):
+    PATTERN_NAMES, PATTERN_LOW, PATTERN_HIGH, PATTERN_WEIGHTS = _pattern_arrays(PATTERNS)
+
+    def __init__(self, file_path=None, context=None):
         self.file_path = file_path
-        self.text_extractor = TextExtractor(file_path)
+        self.context = context
+        self.text_extractor = None
         self.text = ""
 
-    def analyze(self):
+    def _get_text(self):
         """
-        Extrae texto con OCR y calcula métricas estructurales aproximadas.
-        Estas métricas reflejan la "densidad" y el orden visual del texto.
+        OCR propio solo si no se recibió texto (reutiliza el contexto del documento).
+        Se arma con las palabras con caja, un renglón por línea: el texto de
+        extract_text ya pasó por _clean_text y queda en una sola línea.
         """
-        print(f"\n📄 Analizando estructura de: {self.file_path}")
-        success = self.text_extractor.extract_text()
-        if not success:
+        if self.text_extractor is None:
+            from text_extractor import TextExtractor
+            self.text_extractor = TextExtractor(self.file_path, context=self.context)
+        try:
+            words = self.text_extractor.extract_words()
+        finally:
+            self.text_extractor.close()
+        if words is None:
+            return ""
+        return "\n".join(words.pages[p].text() for p in words.page_numbers())
+
+    @staticmethod
+    def features(text):
+        """Vector de métricas (en el orden de FEATURES) calculado en una pasada, o None."""
+        lines = [line.strip() for line in re.split(r"[\n\r]+", text or "") if line.strip()]
+        if not lines:
+            return None
+        lengths = np.fromiter((len(line) for line in lines), dtype=np.float64, count=len(lines))
+        words = np.fromiter((len(line.split()) for line in lines), dtype=np.float64, count=len(lines))
+        joined = "\n".join(lines)
+        # Posición inicial de cada línea, para ubicar la línea de cada coincidencia
+        offsets = np.cumsum([0] + [len(line) + 1 for line in lines[:-1]])
+
+        def line_numbers(matches):
+            starts = np.fromiter((m.start() for m in matches), dtype=np.int64)
+            return np.searchsorted(offsets, starts, side="right") - 1
+
+        # Detección de columnas simulada: líneas con bloques de texto separados por 5+ espacios
+        column_lines = np.unique(line_numbers(COLUMN_REGEX.finditer(joined)))
+        estimated_columns = 1 + (1 if len(column_lines) > len(lines) * 0.1 else 0)
+
+        # Líneas que contienen cada familia de palabras clave (una búsqueda para todas)
+        hits = {name: set() for name in KEYWORD_FAMILIES}
+        matches = list(KEYWORD_REGEX.finditer(joined))
+        for m, line in zip(matches, line_numbers(matches)):
+            hits[m.lastgroup].add(int(line))
+
+        num_blocks = len(lines)
+        empty_lines = np.count_nonzero(lengths < 3)
+        return np.array([
+            num_blocks,
+            lengths.mean(),
+            words.mean(),
+            round(num_blocks / (empty_lines + 1), 2),
+            lengths.var(),
+            estimated_columns,
+            len(hits["bbi_keywords"]),
+            len(hits["hellen_keywords"]),
+            len(hits["cuotas_keywords"]),
+        ], dtype=np.float64)
+
+    def analyze(self, text=None):
+        """
+        Calcula métricas estructurales aproximadas del texto recibido o, si no se
+        recibe, del OCR del documento. Estas métricas reflejan la "densidad" y el
+        orden visual del texto.
+        """
+        print(f"\n📄 Analizando estructura de: {self.file_path or 'texto recibido'}")
+        if text is None:
+            text = self._get_text()
+        if not text:
             print("No se pudo extraer texto OCR para análisis estructural.")
             return {}
-        self.text = self.text_extractor.get_text()
-        lines = [line.strip() for line in re.split(r"[\\n\\r]+", self.text) if line.strip()]
-        if not lines:
+        self.text = text
+        vector = self.features(text)
+        if vector is None:
             print("No se detectaron líneas válidas en el OCR.")
             return {}
-
-        # Estimaciones estructurales a partir de características del texto
-        num_blocks = len(lines)
-        avg_line_len = np.mean([len(l) for l in lines])
-        height_var = np.var([len(l) for l in lines])
-        empty_lines = sum(1 for l in lines if len(l.strip()) < 3)
-        density = round(num_blocks / (empty_lines + 1), 2)
-
-        # Detección de columnas simulada: si hay muchos guiones/tabulaciones
-        column_markers = sum(1 for l in lines if re.search(r"\s{5,}", l))
-        estimated_columns = 1 + (1 if column_markers > len(lines) * 0.1 else 0)
-
-        # Detectar palabras clave específicas de cada formato (más específicas)
-        bbi_keywords = sum(1 for line in lines if re.search(r'\bBBI\b|BBICOLOMBIASAS', line, re.IGNORECASE))
-        hellen_keywords = sum(1 for line in lines if re.search(r'\bCINE\s+COLOMBIA\b|CINE\s+S\.A\.S\.', line, re.IGNORECASE))
-        cuotas_keywords = sum(1 for line in lines if re.search(r'\bCUOTAS\b|PLAN\s+DE\s+PAGO', line, re.IGNORECASE))
-
-        metrics = {
-            "num_blocks": num_blocks,
-            "avg_width": avg_line_len,
-            "avg_height": np.mean([len(l.split()) for l in lines]),
-            "y_density": density,
-            "height_var": height_var,
-            "column_count": estimated_columns,
-            "bbi_keywords": bbi_keywords,
-            "hellen_keywords": hellen_keywords,
-            "cuotas_keywords": cuotas_keywords,
-        }
+        metrics = dict(zip(FEATURES, vector.tolist()))
         print(f"📊 Métricas detectadas: {metrics}")
         return metrics
 
-    def detect_structure(self):
+    @classmethod
+    def score(cls, vectors):
+        """
+        Puntúa uno (F,) o varios (N, F) vectores contra todos los patrones a la vez.
+        Retorna una matriz (N, tipos): dentro del rango, cercanía al centro del
+        rango; fuera, 0. Normalizada por el peso total de cada patrón.
+        """
+        X = np.atleast_2d(np.asarray(vectors, dtype=np.float64))[:, None, :]
+        low, high, weights = cls.PATTERN_LOW, cls.PATTERN_HIGH, cls.PATTERN_WEIGHTS
+        range_size = high - low
+        center = (low + high) / 2
+        proximity = np.where(
+            range_size > 0,
+            1 - np.abs(X - center) / np.where(range_size > 0, range_size, 1),
+            1.0,
+        )
+        inside = (X >= low) & (X <= high)
+        totals = weights.sum(axis=1)
+        return (weights * inside * proximity).sum(axis=2) / np.where(totals > 0, totals, 1)
+
+    def detect_structure(self, text=None):
         """
         Determina el tipo de factura (BBI, Hellen, Cuotas, etc.)
         basándose en patrones de estructura visual y palabras clave.
         """
-        metrics = self.analyze()
+        metrics = self.analyze(text)
         if not metrics:
             return "desconocido"
-        # --- Patrones basados en métricas y palabras clave ---
-        patterns = {
-            "bbi": {
-                "num_blocks": (100, 200),     
-                "avg_width": (10, 20),        
-                "column_count": (1, 2),
-                "y_density": (7, 10),
-                "bbi_keywords": (1, 10),      
-                "hellen_keywords": (0, 0),     
-                "cuotas_keywords": (0, 0),    
-            },
-            "hellen": {
-                "num_blocks": (30, 60),
-                "avg_width": (20, 30),
-                "column_count": (1, 1),
-                "y_density": (3, 5),
-                "bbi_keywords": (0, 0),
-                "hellen_keywords": (1, 5),
-                "cuotas_keywords": (0, 0),
-            },
-            "cuotas": {
-                "num_blocks": (20, 50),
-                "avg_width": (20, 40),
-                "column_count": (1, 1),
-                "y_density": (2, 6),
-                "bbi_keywords": (0, 0),
-                "hellen_keywords": (0, 0),
-                "cuotas_keywords": (1, 5),
-            },
-        }
-        best_match = None
-        best_score = -1
-
-        for tipo, pattern in patterns.items():
-            score = self._compare_metrics(metrics, pattern)
+        scores = self.score([metrics[name] for name in FEATURES])[0]
+        for tipo, score in zip(self.PATTERN_NAMES, scores):
             print(f"Coincidencia {tipo.upper()}: {score:.2f}")
-            if score > best_score:
-                best_score = score
-                best_match = tipo
-        # Umbral mínimo de confianza
-        if best_score < 0.5:
+        best = int(np.argmax(scores))
+        if scores[best] < MIN_SCORE:
             print("Confianza baja en la detección estructural.")
             return "desconocido"
+        best_match = self.PATTERN_NAMES[best]
         print(f"Estructura detectada como: {best_match.upper()}")
         return best_match.upper()
 
-    def _compare_metrics(self, metrics, pattern):
-        """Evalúa coincidencia entre métricas detectadas y patrón base."""
-        score = 0
-        total_weight = 0
-        
-        # Pesos para cada métrica (más peso = más importante)
-        weights = {
-            "num_blocks": 1.2,
-            "avg_width": 1.0,
-            "column_count": 1.0,
-            "y_density": 1.0,
-            "bbi_keywords": 2.5,    
-            "hellen_keywords": 2.5,
-            "cuotas_keywords": 2.5,
-        }
-        
-        for key, (min_val, max_val) in pattern.items():
-            if key not in metrics:
-                continue               
-            val = metrics[key]
-            weight = weights.get(key, 1.0)           
-            # Verificar si el valor está dentro del rango esperado
-            if min_val <= val <= max_val:
-                # Calcular qué tan cerca está del centro del rango
-                center = (min_val + max_val) / 2
-                range_size = max_val - min_val
-                if range_size > 0:
-                    distance = abs(val - center) / range_size
-                    proximity = 1 - distance
-                else:
-                    proximity = 1.0
-                
-                score += weight * proximity
-            else:
-                # Fuera del rango, penalización
-                score += 0                
-            total_weight += weight        
-        # Normalizar puntuación
-        if total_weight == 0:
-            return 0           
-        return score / total_weight
\ No newline at end of file
+    @classmethod
+    def detect_batch(cls, texts):
+        """
+        Tipo estructural de un lote de textos, puntuados juntos: [(tipo, puntaje)].
+        Los textos sin líneas válidas o con baja confianza quedan como "desconocido".
+        """
+        vectors = [cls.features(text) for text in texts]
+        valid = [i for i, vector in enumerate(vectors) if vector is not None]
+        results = [("desconocido", 0.0)] * len(texts)
+        if not valid:
+            return results
+        scores = cls.score(np.vstack([vectors[i] for i in valid]))
+        best = scores.argmax(axis=1)
+        for row, i in enumerate(valid):
+            score = float(scores[row, best[row]])
+            tipo = cls.PATTERN_NAMES[best[row]].upper() if score >= MIN_SCORE else "desconocido"
+            results[i] = (tipo, score)
+        return results
@@ -1,5 +1,4 @@
 import re
-import pytesseract
 import os
 import subprocess
 import cv2
@@ -8,30 +7,92 @@ from PIL import Image
 import shutil
 import tempfile
 import getpass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from document_context import DocumentContext
+from ocr_cache import get_default_cache
+from ocr_backend import get_default_backend
+from poppler import DEFAULT_POPPLER_PATH, find_poppler_tool
+from preprocessing import PreprocessingPipeline, to_gray
+from word_boxes import DocumentWords, parse_tsv, parse_pdf_bbox, merge_pages
 
 class TextExtractor:
     """
     Clase base para extracción de texto desde PDF o imagen usando Tesseract + Poppler.
     Soporta PDFs de múltiples páginas y unifica el texto en un solo bloque.
     """
-    def __init__(self, file_path):
+    # Mínimo de caracteres útiles por página para confiar en la capa de texto del PDF
+    MIN_TEXT_LAYER_CHARS = 30
+    # Proporción mínima de caracteres alfanuméricos (descarta fuentes sin mapa Unicode)
+    MIN_TEXT_LAYER_ALNUM_RATIO = 0.5
+    # Versión del preprocesamiento; cambiarla invalida las entradas de la caché OCR
+    PREPROCESS_VERSION = 2
+    # Perfil de preprocesamiento (ver preprocessing.PROFILES); None = perfil por defecto
+    PREPROCESS_PROFILE = None
+    # Resoluciones de rasterización: modo rápido (detección) y OCR completo
+    QUICK_DPI = 150
+    DEFAULT_DPI = 300
+    # dpi fijo del formato (None = usar DEFAULT_DPI o el modo adaptativo)
+    OCR_DPI = None
+    # dpi adaptativo según la altura de los caracteres (los formatos pueden activarlo)
+    ADAPTIVE_DPI = os.environ.get("OCR_ADAPTIVE_DPI", "0").lower() in ("1", "true", "si", "sí")
+    # Sondeo del modo adaptativo: resolución baja y altura x objetivo para Tesseract (px)
+    PROBE_DPI = 100
+    TARGET_XHEIGHT = 20
+    MIN_ADAPTIVE_DPI = 150
+    # Orden de páginas para el OCR incremental: "first", "last", "rest" o índices (0, -1, ...)
+    PAGE_PRIORITY = ("first", "last", "rest")
+    # Franjas superiores de la primera página (fracción del alto) para la detección,
+    # de la más angosta a la página completa; cada paso solo agrega la franja nueva
+    HEADER_BANDS = (0.20, 0.35, 0.50, 1.0)
+    # Solapamiento entre franjas para no cortar una línea de texto por la mitad
+    HEADER_OVERLAP = 0.02
+    # Hilos de OCR por defecto (cada uno lanza su propio proceso de Tesseract)
+    DEFAULT_OCR_WORKERS = int(os.environ.get("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+
+    def __init__(self, file_path, use_text_layer=True, context=None, ocr_workers=None, ocr_backend=None):
         self.file_path = file_path
         self.text = ""
+        # Palabras con caja por página (DocumentWords) para las reglas espaciales, o None
+        self.words = None
+        # OCR con cajas de palabras (image_to_data): el texto se arma con las mismas palabras
+        self.word_boxes = False
+        # Campos ya conocidos por otra vía (código QR DIAN): los extractores no los buscan
+        self.known_fields = {}
+        # Contexto compartido entre detección y extracción (imágenes y OCR por página).
+        # Si no se recibe uno, se usa uno propio y sus temporales se borran al terminar.
+        self._owns_context = context is None
+        self.context = context if context is not None else DocumentContext(file_path)
+        # Usar la capa de texto embebida del PDF antes de rasterizar y aplicar OCR
+        self.use_text_layer = use_text_layer
+        # Ruta usada en la última extracción: "capa_texto" u "ocr"
+        self.text_source = None
+        # Encabezado de extract_header con sus saltos de línea (antes de _clean_text), o None
+        self.header_lines = None
+        # Páginas procesadas en paralelo por OCR
+        self.ocr_workers = max(1, ocr_workers or self.DEFAULT_OCR_WORKERS)
+        # Rasterizar en memoria (pdftoppm → tubería → NumPy) en lugar de PNG temporales
+        self.in_memory_raster = True
+        # Caché persistente de resultados OCR (None si está desactivada)
+        self.ocr_cache = get_default_cache()
+        # Preprocesamiento configurable y costo acumulado (ms) por etapa
+        self.preprocessor = PreprocessingPipeline(self.PREPROCESS_PROFILE)
+        self.preprocess_stats = {}
+        self._stats_lock = threading.Lock()
 
         # Obtener usuario actual de Windows
         user = getpass.getuser()
 
         # Configuración de rutas (modificar las rutas el usuario)
         default_tesseract = fr"utils\Tesseract-OCR\tesseract.exe"
-        default_poppler = fr"utils\poppler-24.08.0\Library\bin"
+        default_poppler = DEFAULT_POPPLER_PATH
 
-        # Validar y configurar Tesseract
+        # Validar Tesseract (la ruta la guarda el motor OCR, sin tocar el estado global de pytesseract)
         if os.path.exists(default_tesseract):
             self.tesseract_path = default_tesseract
-            pytesseract.pytesseract.tesseract_cmd = self.tesseract_path
             print(f"Tesseract configurado en: {self.tesseract_path}")
         else:
-            print(f"No se encontró Tesseract en {self.tesseract_path}")
+            print(f"No se encontró Tesseract en {default_tesseract}")
             self.tesseract_path = None
 
         # Validar Poppler
@@ -39,27 +100,102 @@ class TextExtractor:
             self.poppler_path = default_poppler
             print(f"Poppler encontrado en: {self.poppler_path}")
         else:
-            print(f"No se encontró Poppler en {self.poppler_path}")
+            print(f"No se encontró Poppler en {default_poppler}")
             self.poppler_path = None
 
+        # Motor OCR: compartido por el proceso (pool con modelos cargados o CLI), o el recibido
+        self.ocr_backend = ocr_backend if ocr_backend is not None else get_default_backend(self.tesseract_path)
+
+    @classmethod
+    def from_stored(cls, text, words=None, known_fields=None, file_name=None):
+        """
+        Extractor sin documento, para volver a aplicar extract_data a un texto ya
+        guardado (ver ocr_store.reextract): no abre el archivo ni configura
+        Tesseract, Poppler, la caché OCR o el contexto.
+        """
+        extractor = cls.__new__(cls)
+        extractor.file_path = file_name or ""
+        extractor.text = text or ""
+        extractor.words = words
+        extractor.word_boxes = False
+        extractor.known_fields = dict(known_fields or {})
+        extractor.context = None
+        extractor.text_source = "almacen"
+        extractor.ocr_cache = None
+        return extractor
+
+    def _poppler_tool(self, name):
+        """Devuelve la ruta a un ejecutable de Poppler (pdftoppm, pdftotext, ...)."""
+        return find_poppler_tool(name, self.poppler_path)
+
+    @staticmethod
+    def _clean_text(text):
+        """Limpieza común para texto OCR y texto nativo del PDF."""
+        #clean = re.sub(r"[^\w\s\.\-\:/\$º°ºªÑñáéíóúÁÉÍÓÚ]", " ", text)
+        clean = re.sub(r"[^\w\s\.\-\:/]", " ", text)
+        return re.sub(r"\s+", " ", clean).strip()
+
+    # Capa de texto nativa (PDF generados digitalmente)
+    def _pdf_text_layer(self, pdf_path, quick=False):
+        """
+        Extrae la capa de texto embebida del PDF con pdftotext, una entrada por página.
+        Retorna None si el documento no tiene texto utilizable (PDF escaneado).
+        """
+        pdftotext_path = self._poppler_tool("pdftotext")
+        cmd = [pdftotext_path, "-enc", "UTF-8"]
+        if quick:
+            cmd += ["-f", "1", "-l", "1"]
+        cmd += [os.path.abspath(pdf_path), "-"]
+        try:
+            result = subprocess.run(cmd, check=True, cwd=self.poppler_path, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            print(f"Error ejecutando pdftotext: {e.stderr}")
+            return None
+
+        # pdftotext separa las páginas con un salto de página (\f)
+        raw_pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+        if raw_pages and not raw_pages[-1].strip():
+            raw_pages = raw_pages[:-1]
+        self.context.text_layer_raw[quick] = raw_pages
+        pages = [self._clean_text(page) for page in raw_pages]
+        if not pages:
+            return None
+
+        for i, page in enumerate(pages, start=1):
+            if len(page) < self.MIN_TEXT_LAYER_CHARS:
+                print(f"Página {i} sin capa de texto utilizable ({len(page)} caracteres).")
+                return None
+            alnum = sum(1 for c in page if c.isalnum())
+            if alnum / len(page) < self.MIN_TEXT_LAYER_ALNUM_RATIO:
+                print(f"Página {i} con capa de texto ilegible, se usará OCR.")
+                return None
+        return pages
+
+    def _pdf_text_layer_words(self, pdf_path):
+        """Palabras con caja de la capa de texto (pdftotext -bbox-layout), una PageWords por página."""
+        pdftotext_path = self._poppler_tool("pdftotext")
+        cmd = [pdftotext_path, "-bbox-layout", "-enc", "UTF-8", os.path.abspath(pdf_path), "-"]
+        try:
+            result = subprocess.run(cmd, check=True, cwd=self.poppler_path, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            print(f"Error ejecutando pdftotext -bbox-layout: {e.stderr}")
+            return None
+        return parse_pdf_bbox(result.stdout.decode("utf-8", errors="replace")) or None
+
     # Conversión PDF → múltiples imágenes
-    def _pdf_to_images(self, pdf_path: str, quick=False):
+    def _pdf_to_images(self, pdf_path: str, quick=False, dpi=None):
         """Convierte un PDF multipágina en varias imágenes PNG."""
-        if not self.poppler_path:
-            raise RuntimeError("Poppler no está disponible")
+        dpi = dpi or (self.QUICK_DPI if quick else self.DEFAULT_DPI)
+        pdftoppm_path = self._poppler_tool("pdftoppm")
 
         temp_dir = tempfile.mkdtemp(prefix="ocr_temp_")
         print(f"Directorio temporal creado: {temp_dir}")
 
         try:
-            pdftoppm_path = os.path.join(self.poppler_path, "pdftoppm.exe")
-            if not os.path.exists(pdftoppm_path):
-                raise RuntimeError(f"No se encontró pdftoppm.exe en {self.poppler_path}")
-
             pdf_filename = os.path.basename(pdf_path)
             temp_pdf_path = os.path.join(temp_dir, pdf_filename)
             shutil.copy2(pdf_path, temp_pdf_path)
-            cmd = [pdftoppm_path, "-png", "-r", "150" if quick else "300", temp_pdf_path, os.path.join(temp_dir, "page")]
+            cmd = [pdftoppm_path, "-png", "-gray", "-r", str(dpi), temp_pdf_path, os.path.join(temp_dir, "page")]
             if quick:
                 cmd[1:1] = ["-f", "1", "-l", "1"]
             print(f"➡️ Ejecutando Poppler ({'primera página' if quick else 'todas las páginas'}): {' '.join(cmd)}")
@@ -78,65 +214,498 @@ class TextExtractor:
         except Exception as e:
             raise RuntimeError(f"Error general al convertir PDF a imágenes: {e}")
 
-    # Preprocesamiento de imagen
-    def preprocess_image(self, image_path):
-        img = cv2.imread(image_path)
+    # Conversión PDF → imágenes en memoria (sin archivos temporales)
+    def _pdf_to_arrays(self, pdf_path, dpi=300, quick=False, first=None, last=None, crop=None):
+        """
+        Rasteriza el PDF con pdftoppm leyendo el documento desde stdin y las páginas
+        PGM desde stdout. Genera un arreglo NumPy en escala de grises por página, a medida
+        que llegan (rasterizar en gris evita la conversión de color en cada página).
+        `first`/`last` limitan el rango de páginas (quick=True equivale a solo la primera).
+        `crop` = (x, y, ancho, alto) en píxeles a ese dpi rasteriza solo esa región.
+        """
+        pdftoppm_path = self._poppler_tool("pdftoppm")
+        cmd = [pdftoppm_path, "-gray", "-r", str(dpi)]
+        if quick:
+            first, last = 1, 1
+        if first:
+            cmd += ["-f", str(first)]
+        if last:
+            cmd += ["-l", str(last)]
+        if crop:
+            cmd += ["-x", str(crop[0]), "-y", str(crop[1]), "-W", str(crop[2]), "-H", str(crop[3])]
+        # Sin raíz de salida, pdftoppm escribe las páginas concatenadas en stdout
+        cmd += ["-"]
+        pdf_bytes = self.context.get_pdf_bytes()
+        print(f"➡️ Ejecutando Poppler en memoria ({'primera página' if quick else 'todas las páginas'}, {dpi} dpi)")
+
+        proc = subprocess.Popen(
+            cmd, cwd=self.poppler_path,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stderr_chunks = []
+
+        def feed_stdin():
+            try:
+                proc.stdin.write(pdf_bytes)
+            except (BrokenPipeError, OSError):
+                pass
+            finally:
+                proc.stdin.close()
+
+        # stdin y stderr en hilos aparte para que ninguna tubería llena bloquee a pdftoppm
+        writer = threading.Thread(target=feed_stdin, daemon=True)
+        drainer = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+        writer.start()
+        drainer.start()
+
+        pages = 0
+        try:
+            while True:
+                img = self._read_pnm(proc.stdout)
+                if img is None:
+                    break
+                pages += 1
+                yield img
+        finally:
+            proc.stdout.close()
+            writer.join()
+            drainer.join()
+            returncode = proc.wait()
+
+        if returncode != 0:
+            stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace")
+            print(f"Error ejecutando Poppler: {stderr}")
+            raise RuntimeError(f"Error ejecutando Poppler: {stderr}")
+        if not pages:
+            raise RuntimeError("Poppler no generó ninguna página.")
+        print(f"{pages} páginas rasterizadas en memoria.")
+
+    @staticmethod
+    def _read_pnm(stream):
+        """Lee una imagen PPM (P6) o PGM (P5) binaria del stream. Retorna None al final."""
+        tokens = []
+        while len(tokens) < 4:
+            token = b""
+            while True:
+                ch = stream.read(1)
+                if not ch:
+                    if tokens or token:
+                        raise RuntimeError("Imagen PNM truncada en la salida de Poppler.")
+                    return None
+                if ch == b"#" and not token:
+                    stream.readline()
+                    continue
+                if ch.isspace():
+                    if token:
+                        break
+                    continue
+                token += ch
+            tokens.append(token)
+
+        magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+        if magic not in (b"P5", b"P6") or maxval > 255:
+            raise RuntimeError(f"Formato PNM no soportado: {magic!r} (maxval {maxval})")
+        channels = 3 if magic == b"P6" else 1
+        size = width * height * channels
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        read = 0
+        while read < size:
+            n = stream.readinto(view[read:])
+            if not n:
+                raise RuntimeError("Imagen PNM truncada en la salida de Poppler.")
+            read += n
+        img = np.frombuffer(buffer, dtype=np.uint8)
+        return img.reshape((height, width, channels)) if channels == 3 else img.reshape((height, width))
+
+    def _page_count(self):
+        """Número de páginas del documento (pdfinfo), guardado en el contexto."""
+        if self.context.page_count is not None:
+            return self.context.page_count
+        if not self.file_path.lower().endswith(".pdf"):
+            self.context.page_count = 1
+            return 1
+        pdfinfo_path = self._poppler_tool("pdfinfo")
+        result = subprocess.run(
+            [pdfinfo_path, os.path.abspath(self.file_path)],
+            check=True, cwd=self.poppler_path, capture_output=True
+        )
+        m = re.search(r"^Pages:\s*(\d+)", result.stdout.decode("utf-8", errors="replace"), re.MULTILINE)
+        if not m:
+            raise RuntimeError("pdfinfo no informó el número de páginas.")
+        self.context.page_count = int(m.group(1))
+        return self.context.page_count
+
+    def _get_page_image(self, dpi, page):
+        """Imagen NumPy de una sola página (desde 1), rasterizada solo si no está en el contexto."""
+        image = self.context.get_page_image(dpi, page)
+        if image is not None:
+            return image if isinstance(image, np.ndarray) else self._load_image(image)
+        if self.file_path.lower().endswith(".pdf"):
+            image = list(self._pdf_to_arrays(self.file_path, dpi=dpi, first=page, last=page))[0]
+        else:
+            image = self._load_image(self.file_path)
+        self.context.add_page_images(dpi, [image], complete=False, first_page=page)
+        return image
+
+    def _page_size(self, page):
+        """(ancho, alto) en puntos de una página del PDF, ya rotada (pdfinfo); se guarda en el contexto."""
+        size = self.context.page_sizes.get(page)
+        if size is not None:
+            return size
+        pdfinfo_path = self._poppler_tool("pdfinfo")
+        result = subprocess.run(
+            [pdfinfo_path, "-f", str(page), "-l", str(page), os.path.abspath(self.file_path)],
+            check=True, cwd=self.poppler_path, capture_output=True
+        )
+        output = result.stdout.decode("utf-8", errors="replace")
+        m = re.search(rf"^Page\s+{page} size:\s*([\d.]+) x ([\d.]+)", output, re.MULTILINE)
+        if not m:
+            raise RuntimeError(f"pdfinfo no informó el tamaño de la página {page}.")
+        width, height = float(m.group(1)), float(m.group(2))
+        rotation = re.search(rf"^Page\s+{page} rot:\s*(\d+)", output, re.MULTILINE)
+        if rotation and int(rotation.group(1)) % 180:
+            width, height = height, width
+        self.context.page_sizes[page] = (width, height)
+        return width, height
+
+    def _get_zone_image(self, dpi, page, box):
+        """
+        Recorte de una zona normalizada (x0, y0, x1, y1) de una página a `dpi`. Si la
+        página ya está rasterizada a ese dpi se recorta; si no, pdftoppm rasteriza
+        solo la zona (-x/-y/-W/-H), sin generar la página completa.
+        """
+        if self.context.get_page_image(dpi, page) is not None or not self.file_path.lower().endswith(".pdf"):
+            return self._crop_zone(self._get_page_image(dpi, page), box)
+        width, height = self._page_size(page)
+        width, height = int(round(width * dpi / 72)), int(round(height * dpi / 72))
+        x0, y0, x1, y1 = box
+        left, top = max(0, int(round(x0 * width))), max(0, int(round(y0 * height)))
+        right, bottom = min(width, int(round(x1 * width))), min(height, int(round(y1 * height)))
+        if right <= left or bottom <= top:
+            return np.zeros((0, 0), dtype=np.uint8)
+        crop = (left, top, right - left, bottom - top)
+        return list(self._pdf_to_arrays(self.file_path, dpi=dpi, first=page, last=page, crop=crop))[0]
+
+    # Resolución adaptativa
+    @staticmethod
+    def _estimate_xheight(gray):
+        """
+        Estima la altura x dominante (px) con componentes conexas: la moda de las
+        alturas corresponde a las minúsculas sin ascendentes. None si hay poco texto.
+        """
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        # Descartar ruido, líneas de tablas y logos
+        glyphs = (heights >= 2) & (heights <= gray.shape[0] * 0.05) & (widths <= heights * 3) & (areas >= 3)
+        if np.count_nonzero(glyphs) < 20:
+            return None
+        return int(np.argmax(np.bincount(heights[glyphs])))
+
+    def _resolve_dpi(self, quick=False):
+        """
+        dpi para rasterizar: QUICK_DPI en modo rápido, OCR_DPI si el formato lo fija,
+        el dpi adaptativo si está activo, o DEFAULT_DPI.
+        """
+        if quick:
+            return self.QUICK_DPI
+        if self.OCR_DPI:
+            return self.OCR_DPI
+        if not self.ADAPTIVE_DPI or not self.file_path.lower().endswith(".pdf"):
+            return self.DEFAULT_DPI
+        if self.context.adaptive_dpi is not None:
+            return self.context.adaptive_dpi
+        dpi = self.DEFAULT_DPI
+        try:
+            probe = self._get_page_image(self.PROBE_DPI, 1)
+            xheight = self._estimate_xheight(to_gray(probe))
+            if xheight:
+                # Menor dpi (múltiplo de 25) con el que la altura x llega al objetivo
+                needed = self.PROBE_DPI * self.TARGET_XHEIGHT / xheight
+                dpi = int(min(self.DEFAULT_DPI, max(self.MIN_ADAPTIVE_DPI, -(-needed // 25) * 25)))
+                print(f"dpi adaptativo: altura x {xheight}px a {self.PROBE_DPI} dpi → {dpi} dpi")
+            else:
+                print(f"dpi adaptativo: no hay texto suficiente para medir, se usa {dpi} dpi")
+        except Exception as e:
+            print(f"Error estimando el dpi adaptativo: {e}")
+        self.context.adaptive_dpi = dpi
+        return dpi
+
+    @staticmethod
+    def _load_image(path):
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
         if img is None:
-            raise RuntimeError(f"No se pudo abrir la imagen: {image_path}")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.adaptiveThreshold(
-            gray, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
+            raise RuntimeError(f"No se pudo abrir la imagen: {path}")
+        return img
+
+    @staticmethod
+    def _zone_bounds(image, box):
+        """(left, top, right, bottom) en píxeles de una zona normalizada (x0, y0, x1, y1) en [0, 1]."""
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = box
+        left, right = int(round(x0 * width)), int(round(x1 * width))
+        top, bottom = int(round(y0 * height)), int(round(y1 * height))
+        return max(0, left), max(0, top), min(width, right), min(height, bottom)
+
+    @classmethod
+    def _crop_zone(cls, image, box):
+        """Recorta una zona normalizada (x0, y0, x1, y1) en [0, 1] de la imagen."""
+        left, top, right, bottom = cls._zone_bounds(image, box)
+        return image[top:bottom, left:right]
+
+    @staticmethod
+    def _zone_page(zone, page_count):
+        """Número de página (desde 1) de una zona, o None si el documento no la tiene."""
+        index = zone.get("page", 0)
+        page = index + 1 if index >= 0 else page_count + index + 1
+        return page if 1 <= page <= page_count else None
+
+    # OCR por zonas (regiones de interés declaradas por cada formato)
+    def extract_zones(self, zones=None, dpi=None):
+        """
+        Aplica OCR solo a las zonas declaradas en OCR_ZONES (o las recibidas).
+        Cada zona es {"page": índice (0 = primera, -1 = última), "box": (x0, y0, x1, y1)}
+        con coordenadas normalizadas. Retorna el texto de las zonas, en orden, o "".
+        Las palabras con caja de cada zona quedan en el contexto (ver zone_words).
+        """
+        zones = zones if zones is not None else getattr(self, "OCR_ZONES", None)
+        if not zones:
+            return ""
+        try:
+            dpi = dpi or self._resolve_dpi()
+            page_count = self._page_count()
+            texts = []
+            for name, zone in zones.items():
+                page = self._zone_page(zone, page_count)
+                if page is None:
+                    continue
+                box = tuple(zone["box"])
+                clean = self.context.get_page_text(dpi, page, zone=box)
+                if clean is None:
+                    image = self._get_page_image(dpi, page)
+                    left, top, right, bottom = self._zone_bounds(image, box)
+                    if right <= left or bottom <= top:
+                        continue
+                    print(f"OCR de la zona '{name}' (página {page}/{page_count})...")
+                    processed = self.preprocess_image(image[top:bottom, left:right])
+                    # Con cajas: la confianza de los campos se mide en las palabras de la zona
+                    words = parse_tsv(self.ocr_backend.image_to_data(processed, lang="spa"))
+                    height, width = image.shape[:2]
+                    self.context.set_page_words(dpi, page, words.placed(left, top, width, height), zone=box)
+                    clean = self._clean_text(words.text())
+                    self.context.set_page_text(dpi, page, clean, zone=box)
+                texts.append(clean)
+            return "\n".join(texts)
+        except Exception as e:
+            print(f"Error en OCR por zonas: {e}")
+            return ""
+
+    def zone_words(self, zones=None, dpi=None):
+        """
+        DocumentWords de las zonas ya leídas por extract_zones, en coordenadas de la
+        página completa; None en las páginas sin zonas. None si no se leyó ninguna.
+        """
+        zones = zones if zones is not None else getattr(self, "OCR_ZONES", None)
+        if not zones:
+            return None
+        dpi = dpi or self._resolve_dpi()
+        page_count = self._page_count()
+        by_page = {}
+        for zone in zones.values():
+            page = self._zone_page(zone, page_count)
+            words = self.context.get_page_words(dpi, page, zone=zone["box"]) if page else None
+            if words is not None:
+                by_page.setdefault(page, []).append(words)
+        if not by_page:
+            return None
+        return DocumentWords(
+            merge_pages(by_page[page]) if page in by_page else None for page in range(1, page_count + 1)
         )
-        if np.mean(thresh) < 127:
-            thresh = cv2.bitwise_not(thresh)
 
-        return thresh
+    # Preprocesamiento de imagen
+    def preprocess_image(self, image):
+        """
+        Acepta la ruta de una imagen o un arreglo NumPy (escala de grises o RGB) y
+        aplica el perfil de preprocesamiento. El costo de cada etapa se acumula en
+        self.preprocess_stats.
+        """
+        if not isinstance(image, np.ndarray):
+            image = self._load_image(image)
+        processed, timings = self.preprocessor.run(image)
+        with self._stats_lock:
+            for name, elapsed in timings:
+                self.preprocess_stats[name] = self.preprocess_stats.get(name, 0.0) + elapsed
+        return processed
+
+    def _report_preprocess_stats(self):
+        if self.preprocess_stats:
+            stages = ", ".join(f"{name} {ms:.1f}ms" for name, ms in self.preprocess_stats.items())
+            print(f"Preprocesamiento ({self.preprocessor.profile}): {stages}")
   
+    def _ocr_page(self, image, dpi, page, total=None, omp_threads=None):
+        """Preprocesa y aplica OCR a una página; guarda el texto limpio en el contexto."""
+        label = f"{page}/{total}" if total else f"{page}"
+        clean = self.context.get_page_text(dpi, page)
+        if clean is not None:
+            print(f"OCR de la página {label} ya disponible en el contexto.")
+            return clean
+        print(f"OCR procesando página {label}...")
+        if self.word_boxes:
+            # Un solo OCR sirve para el texto y para las cajas de las reglas espaciales
+            text = self._ocr_page_words(image, dpi, page, omp_threads).text()
+        else:
+            processed = self.preprocess_image(image)
+            text = self.ocr_backend.image_to_string(processed, lang="spa", threads=omp_threads)
+
+        # Limpieza de texto
+        clean = self._clean_text(text)
+        if len(clean) < 30:
+            print(f"Texto OCR muy corto ({len(clean)} caracteres), posible error.")
+        self.context.set_page_text(dpi, page, clean)
+        return clean
+
+    def _ocr_page_words(self, image, dpi, page, omp_threads=None):
+        """OCR de una página con cajas de palabras (image_to_data); se guarda en el contexto."""
+        processed = self.preprocess_image(image)
+        words = parse_tsv(self.ocr_backend.image_to_data(processed, lang="spa", threads=omp_threads))
+        self.context.set_page_words(dpi, page, words)
+        return words
+
+    def _ocr_pages(self, images, dpi, total=None):
+        """
+        Aplica OCR a las páginas con un pool de hilos (el motor OCR libera el GIL:
+        un proceso de Tesseract o tesserocr en C++). Conserva el orden de páginas.
+        `images` puede ser un generador: cada página se envía al pool en cuanto llega.
+        """
+        if total is None and isinstance(images, list):
+            total = len(images)
+        workers = min(self.ocr_workers, total) if total else self.ocr_workers
+        if workers <= 1:
+            return [self._ocr_page(img, dpi, i, total) for i, img in enumerate(images, start=1)]
+
+        # Limitar los hilos OpenMP de cada Tesseract para no sobresuscribir la CPU:
+        # workers x hilos_por_tesseract <= núcleos disponibles
+        omp_threads = max(1, (os.cpu_count() or 1) // workers)
+        current = os.environ.get("OMP_THREAD_LIMIT")
+        if current and current.isdigit():
+            omp_threads = min(omp_threads, int(current))
+        print(f"OCR en paralelo: {workers} hilos, {omp_threads} hilo(s) OpenMP por Tesseract.")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+            # map() devuelve los resultados en el orden de entrada
+            return list(pool.map(
+                lambda args: self._ocr_page(args[1], dpi, args[0], total, omp_threads),
+                enumerate(images, start=1)
+            ))
+
+    def _cache_key(self, quick, use_text_layer):
+        """Clave de la caché OCR para este documento y parámetros, o None sin caché."""
+        if self.ocr_cache is None or not os.path.isfile(self.file_path):
+            return None
+        return self.ocr_cache.key_for_digest(
+            self.context.get_digest(),
+            dpi=self._dpi_setting(quick),
+            lang="spa",
+            quick=quick,
+            text_layer=bool(use_text_layer),
+            preprocess=f"{self.PREPROCESS_VERSION}:{self.preprocessor.profile}",
+            engine=self.ocr_backend.name,
+        )
+
+    def _dpi_setting(self, quick=False):
+        """Configuración de dpi para la clave de caché, sin rasterizar el sondeo adaptativo."""
+        if quick:
+            return self.QUICK_DPI
+        if self.OCR_DPI:
+            return self.OCR_DPI
+        if self.ADAPTIVE_DPI and self.file_path.lower().endswith(".pdf"):
+            return f"adaptativo:{self.PROBE_DPI}:{self.TARGET_XHEIGHT}"
+        return self.DEFAULT_DPI
+
+    def _cache_store(self, cache_key):
+        if cache_key:
+            self.ocr_cache.put(cache_key, {"text": self.text, "source": self.text_source})
+
     # OCR completo o rápido (quick mode)
-    def extract_text(self, force_extract=False, quick=False):
+    def extract_text(self, force_extract=False, quick=False, use_text_layer=None):
         """
-        Extrae texto OCR de todas las páginas o solo la primera si quick=True.
+        Extrae texto de todas las páginas o solo la primera si quick=True.
+        Si el PDF trae capa de texto utilizable se usa directamente; si no,
+        se rasteriza y se aplica OCR. La ruta usada queda en self.text_source.
         Retorna SIEMPRE una cadena con el texto extraído (nunca un bool).
         """
         # Si ya hay texto y no se fuerza extracción, retornarlo directamente
         if self.text and not force_extract:
             print("Texto ya extraído, omitiendo paso de extracción.")
             return self.text
+        if use_text_layer is None:
+            use_text_layer = self.use_text_layer
         try:
-            # Convertir PDF a imágenes
-            if self.file_path.lower().endswith(".pdf"):
-                image_paths, temp_dir = self._pdf_to_images(self.file_path, quick=quick)
+            # Caché OCR: mismo contenido y mismos parámetros → mismo texto
+            cache_key = self._cache_key(quick=quick, use_text_layer=use_text_layer)
+            if cache_key:
+                cached = self.ocr_cache.get(cache_key)
+                if cached:
+                    self.text = cached["text"]
+                    self.text_source = self.context.text_source = cached["source"]
+                    print(f"Texto recuperado de la caché OCR ({len(self.text)} caracteres, origen: {self.text_source}).")
+                    return self.text.strip()
+
+            # Ruta rápida: capa de texto nativa del PDF
+            if use_text_layer and self.file_path.lower().endswith(".pdf"):
+                found, pages = self.context.get_text_layer(quick=quick)
+                if not found:
+                    pages = self._pdf_text_layer(self.file_path, quick=quick)
+                    self.context.set_text_layer(pages, quick=quick)
+                if pages:
+                    self.text = "\n---PAGE_BREAK---\n".join(pages)
+                    self.text_source = self.context.text_source = "capa_texto"
+                    print(f"Texto nativo del PDF: {len(pages)} páginas ({len(self.text)} caracteres), OCR omitido.")
+                    self._cache_store(cache_key)
+                    return self.text.strip()
+                print("El PDF no tiene capa de texto utilizable. Se usará OCR.")
+
+            # Convertir PDF a imágenes (o reutilizar las del contexto)
+            dpi = self._resolve_dpi(quick)
+            images = self.context.get_page_images(dpi, first_only=quick)
+            if images is not None:
+                pages_to_read = images if not quick else [images[0]]
+                all_text = self._ocr_pages(pages_to_read, dpi)
+            elif self.file_path.lower().endswith(".pdf") and self.in_memory_raster:
+                # Las páginas se rasterizan y se envían a OCR a medida que salen de pdftoppm
+                pages_to_read = []
+
+                def stream_pages():
+                    for img in self._pdf_to_arrays(self.file_path, dpi=dpi, quick=quick):
+                        pages_to_read.append(img)
+                        yield img
+
+                all_text = self._ocr_pages(stream_pages(), dpi)
+                self.context.add_page_images(dpi, pages_to_read, complete=not quick)
             else:
-                image_paths, temp_dir = [self.file_path], None
-            all_text = []
-            pages_to_read = image_paths if not quick else [image_paths[0]]
-            for i, img_path in enumerate(pages_to_read, start=1):
-                print(f"OCR procesando página {i}/{len(pages_to_read)}...")
-                processed = self.preprocess_image(img_path)
-                text = pytesseract.image_to_string(processed, lang="spa")
-
-                # Limpieza de texto
-                #clean = re.sub(r"[^\w\s\.\-\:/\$º°ºªÑñáéíóúÁÉÍÓÚ]", " ", text)
-                clean = re.sub(r"[^\w\s\.\-\:/]", " ", text)
-                clean = re.sub(r"\s+", " ", clean).strip()
-                if len(clean) < 30:
-                    print(f"Texto OCR muy corto ({len(clean)} caracteres), posible error.")
-                all_text.append(clean)
+                if self.file_path.lower().endswith(".pdf"):
+                    image_paths, temp_dir = self._pdf_to_images(self.file_path, quick=quick, dpi=dpi)
+                else:
+                    image_paths, temp_dir = [self.file_path], None
+                self.context.add_page_images(dpi, image_paths, temp_dir, complete=not quick)
+                pages_to_read = image_paths if not quick else [image_paths[0]]
+                all_text = self._ocr_pages(pages_to_read, dpi)
             # Unificar texto
             self.text = "\n---PAGE_BREAK---\n".join(all_text)
+            self.text_source = self.context.text_source = "ocr"
             char_count = len(self.text)
             if char_count < 50:
                 print("El texto OCR está vacío o no es válido.")
             else:
                 print(f"Texto combinado de {len(pages_to_read)} páginas ({char_count} caracteres totales).")
+            self._report_preprocess_stats()
             # Mostrar fragmento
             print(self.text[:800] + ("..." if char_count > 800 else ""))
-            # Eliminar temporales
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-                print(f"Directorio temporal eliminado: {temp_dir}")
+            if char_count >= 50:
+                self._cache_store(cache_key)
             # DEVOLVER SIEMPRE STRING
             return self.text.strip()
 
@@ -144,9 +713,202 @@ class TextExtractor:
             print(f"Error al extraer texto multipágina: {e}")
             return ""
 
+    def close(self):
+        """
+        Elimina los temporales y las imágenes del contexto si es propio; uno compartido
+        lo cierra quien lo creó. Se llama una vez al terminar con el documento, no por
+        extracción: las páginas rasterizadas sirven a extract_words y a la relectura.
+        """
+        if self._owns_context:
+            self.context.close()
+
+    def _page_order(self, page_count):
+        """Páginas (desde 1) en el orden de PAGE_PRIORITY, sin repetir y sin omitir ninguna."""
+        order = []
+        for item in self.PAGE_PRIORITY:
+            if item == "first":
+                candidates = [1]
+            elif item == "last":
+                candidates = [page_count]
+            elif item == "rest":
+                candidates = range(1, page_count + 1)
+            else:
+                candidates = [item + 1 if item >= 0 else page_count + item + 1]
+            for page in candidates:
+                if 1 <= page <= page_count and page not in order:
+                    order.append(page)
+        order += [page for page in range(1, page_count + 1) if page not in order]
+        return order
+
+    # OCR incremental con parada temprana
+    def extract_text_incremental(self, is_complete, use_text_layer=None):
+        """
+        Aplica OCR página por página en el orden de PAGE_PRIORITY y ejecuta
+        extract_data() después de cada una; se detiene cuando is_complete(datos)
+        es verdadero. Las páginas restantes (condiciones, anexos) no pasan por OCR.
+        Si el PDF tiene capa de texto, o una sola página, equivale a extract_text().
+        """
+        if self.text:
+            return self.text
+        if use_text_layer is None:
+            use_text_layer = self.use_text_layer
+        if not self.file_path.lower().endswith(".pdf") or not hasattr(self, "extract_data"):
+            return self.extract_text(use_text_layer=use_text_layer)
+        try:
+            page_count = self._page_count()
+            if page_count <= 1:
+                return self.extract_text(use_text_layer=use_text_layer)
+            if use_text_layer:
+                found, pages = self.context.get_text_layer(quick=False)
+                if not found:
+                    pages = self._pdf_text_layer(self.file_path)
+                    self.context.set_text_layer(pages)
+                if pages:
+                    return self.extract_text(use_text_layer=use_text_layer)
+            cache_key = self._cache_key(quick=False, use_text_layer=use_text_layer)
+            if cache_key:
+                cached = self.ocr_cache.get(cache_key)
+                if cached:
+                    self.text = cached["text"]
+                    self.text_source = self.context.text_source = cached["source"]
+                    print(f"Texto recuperado de la caché OCR ({len(self.text)} caracteres, origen: {self.text_source}).")
+                    return self.text.strip()
+
+            dpi = self._resolve_dpi()
+            page_texts = {}
+            for done, page in enumerate(self._page_order(page_count), start=1):
+                image = self._get_page_image(dpi, page)
+                page_texts[page] = self._ocr_page(image, dpi, page, page_count)
+                self.text = "\n---PAGE_BREAK---\n".join(page_texts[p] for p in sorted(page_texts))
+                try:
+                    data = self.extract_data()
+                except Exception as e:
+                    print(f"Error en extract_data durante el OCR incremental: {e}")
+                    continue
+                if done < page_count and is_complete(data):
+                    print(f"Campos completos tras {done}/{page_count} páginas; se omite el OCR del resto.")
+                    break
+
+            if len(page_texts) == page_count:
+                self.text_source = self.context.text_source = "ocr"
+                self._cache_store(cache_key)
+            else:
+                self.text_source = self.context.text_source = "ocr_incremental"
+            self._report_preprocess_stats()
+            return self.text.strip()
+        except Exception as e:
+            print(f"Error en el OCR incremental: {e}")
+            return self.extract_text(use_text_layer=use_text_layer)
+
+    # Encabezado para la detección
+    def extract_header(self, is_confident, use_text_layer=None, dpi=None):
+        """
+        Texto del encabezado de la primera página (nombre, logo y NIT del emisor).
+        Usa la capa de texto si existe; si no, aplica OCR a la franja superior y
+        la amplía según HEADER_BANDS solo mientras is_confident(texto) sea falso.
+        El costo no depende del número de páginas del documento.
+        En self.header_lines queda el mismo encabezado con sus saltos de línea, para
+        los análisis por líneas; None si alguna franja salió de la caché OCR.
+        """
+        if use_text_layer is None:
+            use_text_layer = self.use_text_layer
+        self.header_lines = None
+        if use_text_layer and self.file_path.lower().endswith(".pdf"):
+            found, pages = self.context.get_text_layer(quick=True)
+            if not found:
+                pages = self._pdf_text_layer(self.file_path, quick=True)
+                self.context.set_text_layer(pages, quick=True)
+            if pages:
+                raw = self.context.text_layer_raw.get(True) or self.context.text_layer_raw.get(False)
+                self.header_lines = raw[0] if raw else None
+                self.text_source = self.context.text_source = "capa_texto"
+                return pages[0]
+        # Cada franja se guarda también en la caché OCR persistente
+        base_key = None if dpi else self._cache_key(quick=False, use_text_layer=False)
+        dpi = dpi or self._resolve_dpi()
+        texts = []
+        lines = []
+        top = 0.0
+        for bottom in self.HEADER_BANDS:
+            zone = {"page": 0, "box": (0.0, max(0.0, top - self.HEADER_OVERLAP), 1.0, bottom)}
+            strip_key = f"{base_key}|encabezado:{zone['box'][1]:.2f}-{bottom:.2f}" if base_key else None
+            cached = self.ocr_cache.get(strip_key) if strip_key else None
+            if cached:
+                strip = cached["text"]
+                lines = None
+            else:
+                strip = self.extract_zones({f"encabezado_{bottom:.2f}": zone}, dpi=dpi)
+                if strip_key and strip:
+                    self.ocr_cache.put(strip_key, {"text": strip, "source": "ocr_encabezado"})
+                words = self.context.get_page_words(dpi, 1, zone=zone["box"])
+                if lines is not None and words is not None:
+                    lines.append(words.text())
+            if strip:
+                texts.append(strip)
+            top = bottom
+            text = "\n".join(texts)
+            if text and is_confident(text):
+                print(f"Encabezado suficiente con el {bottom:.0%} superior de la primera página.")
+                break
+        self.header_lines = "\n".join(lines) if lines else None
+        self.text_source = self.context.text_source = "ocr_encabezado"
+        return "\n".join(texts)
+
+    # Palabras con caja (reglas espaciales de los specs de campos)
+    def extract_words(self, use_text_layer=None):
+        """
+        Palabras con caja y confianza de cada página (DocumentWords), para ubicar
+        valores por posición respecto a su etiqueta. Con capa de texto se usa
+        pdftotext -bbox-layout; si no, las cajas que el OCR dejó en el contexto y
+        image_to_data en las páginas que falten. Si el OCR incremental se detuvo
+        antes, las páginas que no leyó quedan en None. Se guarda en la caché OCR.
+        """
+        if self.words is not None:
+            return self.words
+        if use_text_layer is None:
+            use_text_layer = self.use_text_layer
+        cache_key = self._cache_key(quick=False, use_text_layer=use_text_layer)
+        words_key = f"{cache_key}|palabras" if cache_key else None
+        cached = self.ocr_cache.get(words_key) if words_key else None
+        if cached:
+            self.words = DocumentWords.from_dict(cached["words"])
+            return self.words
+        try:
+            pages = None
+            is_pdf = self.file_path.lower().endswith(".pdf")
+            if use_text_layer and is_pdf:
+                found, layer = self.context.get_text_layer(quick=False)
+                if not found:
+                    layer = self._pdf_text_layer(self.file_path)
+                    self.context.set_text_layer(layer)
+                if layer:
+                    pages = self._pdf_text_layer_words(self.file_path)
+            if pages is None:
+                dpi = self._resolve_dpi()
+                page_count = self._page_count()
+                read = [p for p in range(1, page_count + 1) if self.context.get_page_text(dpi, p) is not None]
+                pages = []
+                for page in range(1, page_count + 1):
+                    words = self.context.get_page_words(dpi, page)
+                    if words is None and (not read or page in read):
+                        print(f"OCR con cajas de palabras, página {page}/{page_count}...")
+                        words = self._ocr_page_words(self._get_page_image(dpi, page), dpi, page)
+                    pages.append(words)
+            self.words = DocumentWords(pages)
+            if words_key and all(page is not None for page in self.words.pages):
+                self.ocr_cache.put(words_key, {"words": self.words.to_dict(), "source": "cajas"})
+            print(f"Cajas de palabras: {sum(len(page) for page in self.words.pages if page is not None)} palabras.")
+        except Exception as e:
+            print(f"Error extrayendo las cajas de palabras: {e}")
+            self.words = None
+        return self.words
+
     def get_text(self):
         """Devuelve el texto extraído (unificado)."""
         return self.text or ""
     def has_text(self):
         """Verifica si ya se ha extraído texto."""
         return bool(self.text)
+    def get_text_source(self):
+        """Indica la ruta de la última extracción: "capa_texto", "ocr" o None."""
+        return self.text_source
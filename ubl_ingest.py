@@ -0,0 +1,297 @@
+import io
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+import subprocess
+import xml.etree.ElementTree as ET
+from field_spec import monto_mixto, load_spec, spec_path
+from poppler import DEFAULT_POPPLER_PATH, find_poppler_tool
+from vendor_registry import get_default_registry
+
+
+# Documentos UBL 2.1 de la DIAN que traen los campos de la factura
+DOCUMENT_TYPES = {"Invoice": "factura", "CreditNote": "nota_credito", "DebitNote": "nota_debito"}
+# Contenedor que envían los proveedores: el documento va como CDATA en Description
+ATTACHED_ROOT = "AttachedDocument"
+EMBEDDED_PATH = ("Attachment", "ExternalReference", "Description")
+# Código del IVA en TaxScheme/ID
+IVA_SCHEME = "01"
+# Miembros más grandes que esto en un ZIP no se leen (ZIP malformado o bomba)
+MAX_ZIP_MEMBER_BYTES = 50 * 1024 * 1024
+
+# Ruta de nombres locales bajo la raíz → campo; ante varias rutas del mismo campo
+# gana la primera de la lista (la razón social legal antes que el nombre comercial)
+UBL_FIELDS = [
+    (("ID",), "numero_factura"),
+    (("UUID",), "cufe"),
+    (("IssueDate",), "fecha_emision"),
+    (("AccountingSupplierParty", "Party", "PartyTaxScheme", "CompanyID"), "nit_emisor"),
+    (("AccountingSupplierParty", "Party", "PartyLegalEntity", "CompanyID"), "nit_emisor"),
+    (("AccountingSupplierParty", "Party", "PartyTaxScheme", "RegistrationName"), "razon_social"),
+    (("AccountingSupplierParty", "Party", "PartyLegalEntity", "RegistrationName"), "razon_social"),
+    (("AccountingSupplierParty", "Party", "PartyName", "Name"), "razon_social"),
+    (("AccountingCustomerParty", "Party", "PartyTaxScheme", "CompanyID"), "nit_cliente"),
+    (("AccountingCustomerParty", "Party", "PartyIdentification", "ID"), "nit_cliente"),
+    (("LegalMonetaryTotal", "LineExtensionAmount"), "subtotal"),
+    (("RequestedMonetaryTotal", "LineExtensionAmount"), "subtotal"),
+    (("LegalMonetaryTotal", "PayableAmount"), "valor_total"),
+    (("RequestedMonetaryTotal", "PayableAmount"), "valor_total"),
+]
+# Datos del contenedor, por si el documento embebido no los trae
+ATTACHED_FIELDS = [
+    (("ParentDocumentID",), "numero_factura"),
+    (("SenderParty", "PartyTaxScheme", "CompanyID"), "nit_emisor"),
+    (("SenderParty", "PartyTaxScheme", "RegistrationName"), "razon_social"),
+    (("ReceiverParty", "PartyTaxScheme", "CompanyID"), "nit_cliente"),
+]
+# Orden y valores por defecto del resultado, como los de los extractores de formats/
+RESULT_FIELDS = {
+    "fecha_emision": "", "numero_factura": "", "valor_total": "0,00", "subtotal": "0,00",
+    "iva": "0,00", "razon_social": "", "nit_emisor": "", "nit_cliente": "", "cufe": "",
+}
+AMOUNT_FIELDS = ("subtotal", "iva", "valor_total")
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _index(paths):
+    return {path: (priority, field) for priority, (path, field) in enumerate(paths)}
+
+
+UBL_INDEX = _index(UBL_FIELDS)
+ATTACHED_INDEX = _index(ATTACHED_FIELDS)
+
+DOCTYPE = re.compile(rb"<!DOCTYPE|<!ENTITY", re.IGNORECASE)
+# Comentarios e instrucciones de procesamiento completos del prólogo
+PROLOG_NOISE = re.compile(rb"<!--.*?-->|<\?.*?\?>", re.DOTALL)
+# Inicio del elemento raíz
+ROOT_START = re.compile(rb"<[A-Za-z_]")
+
+
+class _NoDTDReader:
+    """
+    Lector que rechaza los XML con DTD: las entidades declaradas ahí permiten
+    expandir el documento sin límite ("billion laughs") o leer archivos locales,
+    y un UBL de la DIAN nunca trae DTD. El DTD solo puede ir antes del elemento
+    raíz, así que se revisa el prólogo y después se deja pasar todo.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.head = b""
+        self.checked = False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if not self.checked and data:
+            self.head += data
+            if self.head[:2] in (b"\xff\xfe", b"\xfe\xff") or b"\x00" in self.head[:4]:
+                # UTF-16/32: el prólogo no se puede revisar byte a byte
+                raise ValueError("el XML no está en UTF-8")
+            prolog = PROLOG_NOISE.sub(b"", self.head)
+            # Un comentario sin cerrar todavía puede contener cualquier cosa
+            open_noise = min((i for i in (prolog.find(b"<!--"), prolog.find(b"<?")) if i >= 0), default=-1)
+            if open_noise >= 0:
+                prolog = prolog[:open_noise]
+            root = ROOT_START.search(prolog)
+            if DOCTYPE.search(prolog[:root.start()] if root else prolog):
+                raise ValueError("el XML declara un DTD o entidades; no se procesa")
+            self.checked = root is not None
+        return data
+
+
+def parse_ubl(source):
+    """
+    Campos estándar de una factura electrónica DIAN (UBL 2.1): Invoice, CreditNote,
+    DebitNote o AttachedDocument con el documento embebido. `source` es una ruta o
+    un archivo binario. Se lee en streaming (iterparse) y cada hijo de la raíz se
+    libera al terminar, así que las facturas con miles de líneas no se cargan
+    completas. El IVA suma los TaxSubtotal del esquema 01 del documento (no de
+    las líneas). Los XML con DTD se rechazan (ver _NoDTDReader).
+    Retorna el diccionario de campos o None si no es un documento DIAN.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return parse_ubl(f)
+    root = None
+    path = []
+    found = {}
+    embedded = None
+    iva, tax_amount, sub_amount, scheme = None, None, None, None
+    try:
+        for event, elem in ET.iterparse(_NoDTDReader(source), events=("start", "end")):
+            name = _local(elem.tag)
+            if event == "start":
+                if root is None:
+                    root = name
+                    if root not in DOCUMENT_TYPES and root != ATTACHED_ROOT:
+                        return None
+                else:
+                    path.append(name)
+                continue
+            if not path:
+                break
+            key = tuple(path)
+            text = (elem.text or "").strip()
+            index = ATTACHED_INDEX if root == ATTACHED_ROOT else UBL_INDEX
+            if key in index and text:
+                priority, field = index[key]
+                if field not in found or priority < found[field][0]:
+                    found[field] = (priority, text)
+            if root == ATTACHED_ROOT:
+                if key == EMBEDDED_PATH and embedded is None and text.startswith("<"):
+                    embedded = parse_ubl(io.BytesIO(text.encode("utf-8")))
+            elif key == ("TaxTotal", "TaxSubtotal", "TaxAmount"):
+                sub_amount = text
+            elif key == ("TaxTotal", "TaxSubtotal", "TaxCategory", "TaxScheme", "ID"):
+                scheme = text
+            elif key == ("TaxTotal", "TaxSubtotal"):
+                if scheme == IVA_SCHEME and sub_amount:
+                    iva = (iva or 0.0) + float(sub_amount)
+                sub_amount, scheme = None, None
+            elif key == ("TaxTotal", "TaxAmount") and text:
+                tax_amount = (tax_amount or 0.0) + float(text)
+            path.pop()
+            if not path:
+                elem.clear()
+    except (ET.ParseError, ValueError) as e:
+        print(f"Error leyendo el XML UBL: {e}")
+        return None
+
+    values = {field: value for field, (_, value) in found.items()}
+    if root == ATTACHED_ROOT:
+        if embedded is None:
+            return None
+        # El documento embebido manda; el contenedor completa lo que falte
+        for field, value in values.items():
+            if not embedded.get(field):
+                embedded[field] = value
+        return embedded
+    # Sin desglose por esquema (documentos antiguos), el total de impuestos
+    if iva is None:
+        iva = tax_amount
+    if iva is not None:
+        values["iva"] = f"{iva:.2f}"
+    if not values.get("numero_factura") and not values.get("cufe"):
+        return None
+    data = {field: values.get(field) or default for field, default in RESULT_FIELDS.items()}
+    for field in AMOUNT_FIELDS:
+        if field in values:
+            data[field] = monto_mixto(values[field])
+    data["tipo_documento"] = DOCUMENT_TYPES[root]
+    return data
+
+
+def read_zip(zip_path):
+    """
+    Paquete ZIP del proveedor: (datos, ruta del PDF, directorio temporal).
+    Si algún XML es un documento DIAN, se usa ese (sin OCR) y no se extrae nada;
+    si no, se extrae el primer PDF a un directorio temporal que borra quien llama.
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as bundle:
+            members = [m for m in bundle.infolist() if not m.is_dir() and m.file_size <= MAX_ZIP_MEMBER_BYTES]
+            for member in members:
+                if member.filename.lower().endswith(".xml"):
+                    with bundle.open(member) as f:
+                        data = parse_ubl(f)
+                    if data:
+                        print(f"XML UBL encontrado en el ZIP: {member.filename}")
+                        return data, None, None
+            pdfs = [m for m in members if m.filename.lower().endswith(".pdf")]
+            if not pdfs:
+                print(f"El ZIP no contiene XML DIAN ni PDF: {os.path.basename(zip_path)}")
+                return None, None, None
+            temp_dir = tempfile.mkdtemp(prefix="factura_zip_")
+            pdf_path = os.path.join(temp_dir, os.path.basename(pdfs[0].filename))
+            with bundle.open(pdfs[0]) as src, open(pdf_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            print(f"El ZIP no trae XML DIAN; se procesará el PDF {pdfs[0].filename}")
+            return None, pdf_path, temp_dir
+    except zipfile.BadZipFile as e:
+        print(f"ZIP inválido {os.path.basename(zip_path)}: {e}")
+        return None, None, None
+
+
+def read_pdf_attachments(pdf_path):
+    """Campos del XML UBL adjunto al PDF (pdfdetach de Poppler), o None si no trae uno."""
+    pdfdetach_path = find_poppler_tool("pdfdetach")
+    pdf_path = os.path.abspath(pdf_path)
+    listing = subprocess.run([pdfdetach_path, "-list", pdf_path], cwd=DEFAULT_POPPLER_PATH, capture_output=True)
+    if listing.returncode != 0 or b".xml" not in listing.stdout.lower():
+        return None
+    temp_dir = tempfile.mkdtemp(prefix="factura_adjuntos_")
+    try:
+        subprocess.run(
+            [pdfdetach_path, "-saveall", "-o", temp_dir, pdf_path],
+            check=True, cwd=DEFAULT_POPPLER_PATH, capture_output=True
+        )
+        for name in sorted(os.listdir(temp_dir)):
+            if name.lower().endswith(".xml"):
+                data = parse_ubl(os.path.join(temp_dir, name))
+                if data:
+                    print(f"XML UBL adjunto al PDF: {name}")
+                    return data
+        return None
+    except subprocess.CalledProcessError as e:
+        print(f"Error ejecutando pdfdetach: {e.stderr}")
+        return None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def ingest_file(file_path):
+    """
+    Ruta de ingesta sin OCR para facturas electrónicas: XML UBL, ZIP con el XML
+    y el PDF, o PDF con el XML adjunto. Retorna (datos, pdf_path, temp_dir):
+    datos son los campos del XML (o None); pdf_path es el PDF que debe pasar por
+    la detección y el OCR si no hubo XML; temp_dir, el temporal que hay que borrar.
+    Los campos quedan en la forma del formato del emisor (ver to_format).
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".xml":
+        data, pdf_path, temp_dir = parse_ubl(file_path), None, None
+    elif ext == ".zip":
+        data, pdf_path, temp_dir = read_zip(file_path)
+    elif ext == ".pdf":
+        try:
+            data = read_pdf_attachments(file_path)
+        except Exception as e:
+            print(f"Error buscando XML adjunto en el PDF: {e}")
+            data = None
+        pdf_path, temp_dir = (None if data else file_path), None
+    else:
+        return None, None, None
+    return (to_format(data) if data else data), pdf_path, temp_dir
+
+
+def _vendor(data):
+    nit = re.sub(r"[.\s]", "", data.get("nit_emisor", "")).partition("-")[0]
+    return get_default_registry().lookup(nit)
+
+
+def to_format(data):
+    """
+    Campos del XML en la forma del formato registrado del emisor, con las mismas
+    conversiones que los del código QR DIAN (bloque "qr" de su spec): fechas
+    dd/mm/aaaa, NIT con DV, etc. Sin formato registrado o sin spec quedan igual.
+    """
+    vendor = _vendor(data)
+    if not vendor or not os.path.exists(spec_path(vendor["format"])):
+        return data
+    try:
+        converted = load_spec(vendor["format"]).from_qr(data)
+    except ValueError as e:
+        print(f"Error cargando el spec de {vendor['format']}: {e}")
+        return data
+    # Un campo que el formato no toma del QR ("qr": null) conserva el valor del XML
+    return {field: converted.get(field) or value for field, value in data.items()}
+
+
+def document_type(data):
+    """Formato registrado del emisor (por NIT) en mayúsculas, o "UBL" si no se conoce."""
+    vendor = _vendor(data)
+    return vendor["format"].upper() if vendor else "UBL"
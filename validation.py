@@ -0,0 +1,217 @@
+import re
+from decimal import Decimal, InvalidOperation
+from collections import namedtuple
+
+
+# Clasificación de un resultado según las invariantes de su formato
+CONSISTENTE = "consistente"
+REPARABLE = "reparable"
+FALLIDA = "fallida"
+
+# Diferencia aceptada en una suma: el mayor entre pesos absolutos y fracción del total
+# (redondeos por línea de los emisores)
+DEFAULT_TOLERANCE = Decimal("1")
+DEFAULT_RELATIVE_TOLERANCE = Decimal("0.001")
+# Tarifa general del IVA en Colombia: ninguna factura supera el 19 % sobre la base
+MAX_IVA_RATE = Decimal("0.19")
+# Lecturas erradas del separador decimal que se intentan antes de dar una suma por fallida
+SCALE_FIXES = (Decimal("100"), Decimal("0.01"), Decimal("1000"), Decimal("0.001"))
+
+# Invariantes de los specs que no declaran "invariantes"
+DEFAULT_INVARIANTS = [
+    {"tipo": "suma", "sumandos": ["subtotal", "iva"], "total": "valor_total"},
+    {"tipo": "proporcion", "campo": "iva", "base": "subtotal", "maximo": float(MAX_IVA_RATE)},
+]
+
+# Resultado de validar: clasificación, {campo: monto reparado} y campos afectados
+Validation = namedtuple("Validation", "status repairs affected")
+# Resultado de una invariante: "ok", "omitida", "reparable" o "fallida"
+Outcome = namedtuple("Outcome", "status repairs affected")
+
+AMOUNT_CHARS = re.compile(r"[^\d,\.\-]")
+
+
+def parse_amount(value):
+    """
+    "1.234,56" (formato de los extractores) → Decimal("1234.56"); "0,00" → 0.
+    None si el texto no es un monto. Un cero leído es un monto (IVA exento):
+    si el campo no se encontró lo dice `missing` en validate().
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+    clean = AMOUNT_CHARS.sub("", str(value)).replace(".", "").replace(",", ".")
+    if not clean or clean == "-":
+        return None
+    try:
+        amount = Decimal(clean)
+    except InvalidOperation:
+        return None
+    return amount
+
+
+def format_amount(amount):
+    """Decimal("1234.5") → "1.234,50"."""
+    return f"{amount:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class SumInvariant:
+    """
+    sumandos = total (modo "igual") o sumandos ≤ total (modo "minimo", cuando el
+    total incluye cargos que el formato no extrae, como tasas aeroportuarias).
+    Si falta un solo campo, se deduce de los demás; si la suma no cuadra y un
+    solo campo es dudoso (o un solo cambio de escala la hace cuadrar), ese campo
+    se repara. Si no, la invariante falla y afecta a los campos dudosos, o a todos.
+    """
+    MODES = ("igual", "minimo")
+
+    def __init__(self, addends, total, mode="igual", tolerance=None, relative_tolerance=None):
+        if not addends or not total:
+            raise ValueError("La invariante 'suma' necesita 'sumandos' y 'total'")
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de suma no válido: {mode!r} (use {', '.join(self.MODES)})")
+        self.addends = list(addends)
+        self.total = total
+        self.mode = mode
+        self.tolerance = Decimal(str(tolerance)) if tolerance is not None else DEFAULT_TOLERANCE
+        self.relative_tolerance = (
+            Decimal(str(relative_tolerance)) if relative_tolerance is not None else DEFAULT_RELATIVE_TOLERANCE
+        )
+
+    @property
+    def fields(self):
+        return self.addends + [self.total]
+
+    def _holds(self, amounts):
+        total = amounts[self.total]
+        difference = total - sum(amounts[field] for field in self.addends)
+        tolerance = max(self.tolerance, abs(total) * self.relative_tolerance)
+        if self.mode == "minimo":
+            return difference >= -tolerance
+        return abs(difference) <= tolerance
+
+    def _derive(self, field, amounts):
+        others = sum(amounts[f] for f in self.addends if f != field)
+        return others if field == self.total else amounts[self.total] - others
+
+    def evaluate(self, amounts, doubtful=()):
+        present = {field: amounts.get(field) for field in self.fields}
+        unknown = [field for field, amount in present.items() if amount is None]
+        if len(unknown) > 1 or (unknown and self.mode == "minimo"):
+            return Outcome("omitida", {}, [])
+        if unknown:
+            # Un solo faltante: se deduce (un IVA deducido en cero es una factura exenta)
+            field = unknown[0]
+            derived = self._derive(field, present)
+            if abs(derived) <= self.tolerance:
+                return Outcome("ok", {}, [])
+            if derived < 0:
+                return Outcome("fallida", {}, self.fields)
+            return Outcome("reparable", {field: derived}, [field])
+        if self._holds(present):
+            return Outcome("ok", {}, [])
+        suspects = [field for field in self.fields if field in doubtful]
+        if len(suspects) == 1 and self.mode == "igual":
+            derived = self._derive(suspects[0], present)
+            if derived > 0:
+                return Outcome("reparable", {suspects[0]: derived}, suspects)
+        fixes = [
+            (field, present[field] * factor)
+            for field in (suspects or self.fields) for factor in SCALE_FIXES
+            if self._holds(dict(present, **{field: present[field] * factor}))
+        ]
+        if len(fixes) == 1:
+            field, amount = fixes[0]
+            return Outcome("reparable", {field: amount}, [field])
+        return Outcome("fallida", {}, suspects or self.fields)
+
+
+class RatioInvariant:
+    """campo ≤ maximo × base (p. ej. el IVA no supera el 19 % del subtotal). No se repara."""
+    def __init__(self, field, base, maximum, tolerance=None):
+        if not field or not base:
+            raise ValueError("La invariante 'proporcion' necesita 'campo' y 'base'")
+        self.field = field
+        self.base = base
+        self.maximum = Decimal(str(maximum))
+        self.tolerance = Decimal(str(tolerance)) if tolerance is not None else DEFAULT_TOLERANCE
+
+    @property
+    def fields(self):
+        return [self.field, self.base]
+
+    def evaluate(self, amounts, doubtful=()):
+        value, base = amounts.get(self.field), amounts.get(self.base)
+        if value is None or base is None:
+            return Outcome("omitida", {}, [])
+        if value <= base * self.maximum + self.tolerance:
+            return Outcome("ok", {}, [])
+        suspects = [field for field in self.fields if field in doubtful]
+        return Outcome("fallida", {}, suspects or self.fields)
+
+
+def compile_invariants(specs):
+    """
+    Invariantes del bloque "invariantes" de un spec de campos (None = las de por
+    defecto, [] = ninguna). Cada una es un diccionario con "tipo":
+      {"tipo": "suma", "sumandos": [...], "total": "...", "modo": "igual" | "minimo",
+       "tolerancia": pesos, "tolerancia_relativa": fracción del total}
+      {"tipo": "proporcion", "campo": "...", "base": "...", "maximo": fracción}
+    """
+    invariants = []
+    for spec in DEFAULT_INVARIANTS if specs is None else specs:
+        kind = spec.get("tipo")
+        if kind == "suma":
+            invariants.append(SumInvariant(
+                spec.get("sumandos"), spec.get("total"), mode=spec.get("modo", "igual"),
+                tolerance=spec.get("tolerancia"), relative_tolerance=spec.get("tolerancia_relativa"),
+            ))
+        elif kind == "proporcion":
+            invariants.append(RatioInvariant(
+                spec.get("campo"), spec.get("base"), spec.get("maximo", float(MAX_IVA_RATE)),
+                tolerance=spec.get("tolerancia"),
+            ))
+        else:
+            raise ValueError(f"Tipo de invariante no válido: {kind!r} (use suma, proporcion)")
+    return invariants
+
+
+def validate(data, invariants, doubtful=(), missing=None):
+    """
+    Evalúa las invariantes sobre los montos de `data`, en orden: cada reparación
+    queda disponible para las siguientes. `doubtful` son los campos de baja
+    confianza OCR (ver field_confidence), los primeros sospechosos de una suma
+    que no cuadra. `missing` son los campos que los patrones no encontraron:
+    solo esos se deducen; un "0,00" leído se valida como cero. Sin `missing`
+    (origen desconocido) ningún monto se deduce. Las invariantes cuyos campos
+    el formato no extrae se omiten.
+    """
+    missing = set(missing or ())
+    amounts = {}
+    for invariant in invariants:
+        for field in invariant.fields:
+            if field not in amounts:
+                amounts[field] = None if field in missing else parse_amount(data.get(field))
+    repairs, affected = {}, []
+    failed = False
+    for invariant in invariants:
+        if not all(field in data for field in invariant.fields):
+            continue
+        outcome = invariant.evaluate(amounts, doubtful)
+        if outcome.status == "fallida":
+            failed = True
+        elif outcome.status == "reparable":
+            repairs.update(outcome.repairs)
+            amounts.update(outcome.repairs)
+        affected += [field for field in outcome.affected if field not in affected]
+    if failed:
+        return Validation(FALLIDA, repairs, affected)
+    return Validation(REPARABLE if repairs else CONSISTENTE, repairs, affected)
+
+
+def apply_repairs(data, validation):
+    """Escribe en `data` los montos reparados, en el formato de los extractores."""
+    for field, amount in validation.repairs.items():
+        data[field] = format_amount(amount)
+    return data
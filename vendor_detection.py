@@ -0,0 +1,120 @@
+import re
+
+
+# Confusiones típicas del OCR, usadas para generar variantes tolerantes de las palabras clave
+OCR_CONFUSABLES = {
+    "O": "0", "0": "O",
+    "I": "1", "1": "I",
+    "B": "8", "8": "B",
+    "S": "5", "5": "S",
+    "G": "6", "6": "G",
+}
+# Las variantes solo se generan para palabras largas (en las cortas, "D1" → "DI", hay falsos positivos)
+MIN_VARIANT_LENGTH = 6
+# Peso relativo de una variante OCR frente a la palabra original
+VARIANT_WEIGHT = 0.8
+
+
+def normalize_text(text):
+    """Normalización de la detección: mayúsculas, sin espacios ni saltos de línea."""
+    return re.sub(r"\s+", "", text.upper())
+
+
+def ocr_variants(keyword):
+    """Variantes con una sustitución de caracteres confundibles (BBICOLOMBIA → B8ICOLOMBIA, ...)."""
+    if len(keyword) < MIN_VARIANT_LENGTH or keyword.replace(".", "").replace("-", "").isdigit():
+        return []
+    variants = []
+    for i, ch in enumerate(keyword):
+        if ch in OCR_CONFUSABLES:
+            variants.append(keyword[:i] + OCR_CONFUSABLES[ch] + keyword[i + 1:])
+    return variants
+
+
+class KeywordMatcher:
+    """
+    Detector de proveedor en una sola pasada. Compila en una única expresión regular
+    las palabras clave (y sus variantes OCR) de todos los formatos registrados;
+    el texto se recorre una vez y cada formato acumula el peso de sus coincidencias.
+    El costo de la detección no crece con el número de palabras clave. Los patrones
+    (expresiones regulares) se buscan aparte, uno por uno: en la misma alternación
+    una coincidencia de patrón consumiría los literales que contiene.
+    """
+    def __init__(self, formats):
+        # formats: lista ordenada de (tipo, FormatSpec); el orden desempata puntajes iguales
+        self.priority = {}
+        # Cada alternativa de la regex: (tipo, clave, peso)
+        self.alternatives = []
+        literals = []
+        patterns = []
+        for order, (tipo, spec) in enumerate(formats):
+            self.priority[tipo] = order
+            for keyword, weight in spec.keywords.items():
+                keyword = normalize_text(keyword)
+                literals.append((tipo, keyword, weight))
+                for variant in ocr_variants(keyword):
+                    literals.append((tipo, variant, weight * VARIANT_WEIGHT))
+            for pattern, weight in spec.patterns.items():
+                patterns.append((tipo, pattern, weight))
+
+        # Los literales más largos primero: en una misma posición gana el más específico
+        literals.sort(key=lambda item: len(item[1]), reverse=True)
+        parts = []
+        for tipo, keyword, weight in literals:
+            parts.append(f"(?P<k{len(self.alternatives)}>{re.escape(keyword)})")
+            self.alternatives.append((tipo, keyword, weight))
+        self.patterns = []
+        for tipo, pattern, weight in patterns:
+            self.patterns.append((len(self.alternatives), re.compile(pattern)))
+            self.alternatives.append((tipo, pattern, weight))
+
+        # Un literal encontrado también cuenta los literales contenidos en él
+        # (BBICOLOMBIASAS ⊃ BBICOLOMBIA), porque la búsqueda no devuelve solapamientos
+        self.implied = {}
+        for i, (tipo, keyword, _) in enumerate(self.alternatives[:len(literals)]):
+            self.implied[i] = [
+                j for j, (_, other, _) in enumerate(self.alternatives[:len(literals)])
+                if j != i and other in keyword
+            ]
+        self.regex = re.compile("|".join(parts)) if parts else None
+
+    def scan(self, text):
+        """
+        Recorre el texto una vez. Retorna [(tipo, puntaje, [claves])] ordenado de
+        mayor a menor puntaje; cada clave cuenta una sola vez por documento.
+        """
+        if not self.alternatives or not text:
+            return []
+        clean = normalize_text(text)
+        hits = set()
+        if self.regex:
+            for m in self.regex.finditer(clean):
+                index = int(m.lastgroup[1:])
+                hits.add(index)
+                hits.update(self.implied.get(index, ()))
+        for index, regex in self.patterns:
+            if regex.search(clean):
+                hits.add(index)
+
+        scores = {}
+        keywords = {}
+        for index in hits:
+            tipo, keyword, weight = self.alternatives[index]
+            scores[tipo] = scores.get(tipo, 0.0) + weight
+            keywords.setdefault(tipo, []).append(keyword)
+        ranking = sorted(scores, key=lambda tipo: (-scores[tipo], self.priority[tipo]))
+        return [(tipo, round(scores[tipo], 2), keywords[tipo]) for tipo in ranking]
+
+
+_matcher = None
+_matcher_formats = None
+
+
+def get_matcher(formats):
+    """Matcher compartido; se recompila solo si cambia la lista de formatos registrados."""
+    global _matcher, _matcher_formats
+    formats = list(formats)
+    if _matcher is None or _matcher_formats != formats:
+        _matcher = KeywordMatcher(formats)
+        _matcher_formats = formats
+    return _matcher
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import threading
+
+
+# Pesos del dígito de verificación del NIT (DIAN), aplicados desde el dígito de la derecha
+DIAN_WEIGHTS = (3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71)
+
+# Caracteres que el OCR suele leer en lugar de dígitos
+OCR_DIGITS = str.maketrans({"O": "0", "o": "0", "D": "0", "I": "1", "l": "1", "|": "1", "S": "5", "s": "5", "B": "8"})
+_D = r"[0-9OoDIl|SsB]"
+# Token con forma de NIT: 7 a 10 dígitos (con o sin puntos) y dígito de verificación opcional
+NIT_TOKEN = re.compile(
+    rf"(?<![0-9A-Za-z])({_D}{{1,4}}(?:[.,]?{_D}{{3}}){{2}})(?:\s?-\s?({_D}))?(?![0-9A-Za-z])"
+)
+
+
+def check_digit(nit):
+    """Dígito de verificación DIAN de un NIT (solo dígitos, sin el DV)."""
+    total = sum(int(d) * DIAN_WEIGHTS[i] for i, d in enumerate(reversed(nit)))
+    remainder = total % 11
+    return remainder if remainder < 2 else 11 - remainder
+
+
+def nit_candidates(text):
+    """
+    Extrae en una sola pasada los NIT del texto: [(nit sin DV, dv o None)].
+    Corrige las confusiones típicas del OCR (O→0, I/l→1, S→5, B→8) y descarta
+    tokens que son sobre todo letras. Un token de 10 dígitos sin guion también
+    se prueba como NIT de 9 dígitos con el DV pegado, si el DV es válido.
+    """
+    candidates = []
+    if not isinstance(text, str):
+        return candidates
+    for m in NIT_TOKEN.finditer(text):
+        raw = re.sub(r"[.,]", "", m.group(1))
+        # Al menos la mitad de los caracteres deben ser dígitos reales
+        if sum(ch.isdigit() for ch in raw) * 2 < len(raw):
+            continue
+        nit = raw.translate(OCR_DIGITS)
+        if len(nit) < 7:
+            continue
+        dv = m.group(2).translate(OCR_DIGITS) if m.group(2) else None
+        candidates.append((nit, int(dv) if dv and dv.isdigit() else None))
+        if dv is None and len(nit) == 10 and check_digit(nit[:-1]) == int(nit[-1]):
+            candidates.append((nit[:-1], int(nit[-1])))
+    return candidates
+
+
+class VendorRegistry:
+    """
+    Registro de proveedores indexado por NIT del emisor. Se carga de un archivo
+    JSON ({"nit": {"format": "bbi", "name": "..."}}), así que se pueden añadir
+    proveedores sin cambiar código; el archivo se recarga si cambia en disco.
+    La búsqueda es un acceso a diccionario por cada NIT del texto.
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "vendors.json")
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        self.vendors = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error leyendo el registro de proveedores: {e}")
+                return
+            vendors = {}
+            for key, entry in raw.items():
+                nit, _, dv = re.sub(r"[.\s]", "", key).partition("-")
+                if not nit.isdigit() or "format" not in entry:
+                    print(f"Entrada inválida en el registro de proveedores: {key}")
+                    continue
+                if dv and int(dv) != check_digit(nit):
+                    print(f"Dígito de verificación incorrecto en el registro: {key}")
+                vendors[nit] = dict(entry, nit=nit, dv=check_digit(nit))
+            self.vendors = vendors
+            self._mtime = mtime
+            print(f"Registro de proveedores cargado: {len(vendors)} NIT")
+
+    def add(self, nit, format_key, name=""):
+        """Registra un proveedor en memoria (no modifica el archivo)."""
+        nit = re.sub(r"[.\s]", "", str(nit)).partition("-")[0]
+        self.vendors[nit] = {"format": format_key, "name": name, "nit": nit, "dv": check_digit(nit)}
+
+    def lookup(self, nit):
+        self._reload_if_changed()
+        return self.vendors.get(nit)
+
+    def resolve(self, text):
+        """
+        Devuelve la entrada del primer NIT registrado que aparece en el texto
+        (el emisor va en el encabezado, antes que el adquiriente), o None.
+        Si el DV leído no coincide con el del NIT, se descarta esa lectura.
+        """
+        self._reload_if_changed()
+        if not self.vendors:
+            return None
+        for nit, dv in nit_candidates(text):
+            entry = self.vendors.get(nit)
+            if entry is None:
+                continue
+            if dv is not None and dv != entry["dv"]:
+                continue
+            return entry
+        return None
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Registro compartido del proceso; VENDOR_REGISTRY_PATH permite usar otro archivo."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = VendorRegistry(os.environ.get("VENDOR_REGISTRY_PATH"))
+        return _default_registry
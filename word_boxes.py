@@ -0,0 +1,472 @@
+import os
+import re
+import html
+import json
+import tempfile
+import threading
+import unicodedata
+from collections import namedtuple
+
+# Palabra con su caja en unidades de la página (píxeles del OCR o puntos del PDF),
+# la confianza de Tesseract (100 para la capa de texto) y el número de línea
+Word = namedtuple("Word", "text x0 y0 x1 y1 conf line")
+
+# Tolerancia vertical para considerar dos palabras en la misma línea (fracción del alto)
+SAME_LINE_TOLERANCE = 0.5
+# Alcance por defecto de una búsqueda hacia abajo, en líneas debajo de la etiqueta
+BELOW_LINES = 3
+# Interlineado supuesto (en altos de la etiqueta) para convertir líneas en distancia
+LINE_SPACING = 2.0
+# Margen (fracción de la página) alrededor de la caja aprendida de un campo
+GEOMETRY_MARGIN = 0.01
+
+DIRECTIONS = ("right", "below")
+
+PDF_BBOX_TOKEN = re.compile(
+    r'<page width="([\d.]+)" height="([\d.]+)"'
+    r'|<line\b'
+    r'|<word xMin="([\d.]+)" yMin="([\d.]+)" xMax="([\d.]+)" yMax="([\d.]+)">(.*?)</word>',
+    re.DOTALL,
+)
+
+
+def normalize_token(text):
+    """Token comparable: sin tildes ni signos, en minúsculas ("Emisión:" → "emision")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if c.isalnum()).lower()
+
+
+def fold_label(text):
+    """Etiqueta con sus signos, sin tildes ni espacios y en mayúsculas ("Iva :" → "IVA:")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c) and not c.isspace()).upper()
+
+
+def parse_tsv(tsv):
+    """
+    PageWords a partir de la salida TSV de Tesseract (image_to_data). Se usan las
+    filas de nivel 5 (palabras) con texto; la fila de nivel 1 da el tamaño de la página.
+    """
+    width = height = 0
+    words = []
+    lines = {}
+    for row in tsv.splitlines():
+        cols = row.split("\t")
+        if len(cols) < 12 or not cols[0].isdigit():
+            continue
+        if cols[0] == "1":
+            width, height = int(cols[8]), int(cols[9])
+        elif cols[0] == "5":
+            text = cols[11].strip()
+            if not text:
+                continue
+            left, top, w, h = (int(v) for v in cols[6:10])
+            # (página, bloque, párrafo, línea) → número de línea consecutivo
+            line = lines.setdefault(tuple(cols[1:5]), len(lines))
+            words.append(Word(text, left, top, left + w, top + h, float(cols[10]), line))
+    return PageWords(words, width, height)
+
+
+def parse_pdf_bbox(xhtml):
+    """Lista de PageWords a partir de la salida de `pdftotext -bbox-layout` (una por página)."""
+    pages = []
+    words, width, height, line = None, 0, 0, -1
+    for m in PDF_BBOX_TOKEN.finditer(xhtml):
+        if m.group(1):
+            if words is not None:
+                pages.append(PageWords(words, width, height))
+            words, width, height, line = [], float(m.group(1)), float(m.group(2)), -1
+        elif m.group(7) is None:
+            line += 1
+        elif words is not None:
+            text = html.unescape(m.group(7)).strip()
+            if text:
+                x0, y0, x1, y1 = (float(m.group(i)) for i in range(3, 7))
+                words.append(Word(text, x0, y0, x1, y1, 100.0, max(line, 0)))
+    if words is not None:
+        pages.append(PageWords(words, width, height))
+    return pages
+
+
+class PageWords:
+    """
+    Palabras de una página indexadas por posición: franjas horizontales del alto
+    de una línea típica (cada búsqueda solo revisa las franjas que toca) y un
+    índice token → palabras para ubicar etiquetas sin recorrer la página.
+    """
+    def __init__(self, words, width=0, height=0):
+        self.words = list(words)
+        self.width = width or max((w.x1 for w in self.words), default=1)
+        self.height = height or max((w.y1 for w in self.words), default=1)
+        heights = sorted(w.y1 - w.y0 for w in self.words if w.y1 > w.y0)
+        self.band = max(1.0, float(heights[len(heights) // 2])) if heights else 1.0
+        self.bands = {}
+        self.by_token = {}
+        self.lines = {}
+        self.tokens = [normalize_token(w.text) for w in self.words]
+        for i, (word, token) in enumerate(zip(self.words, self.tokens)):
+            for band in range(int(word.y0 // self.band), int(word.y1 // self.band) + 1):
+                self.bands.setdefault(band, []).append(i)
+            if token:
+                self.by_token.setdefault(token, []).append(i)
+            self.lines.setdefault(word.line, []).append(i)
+        # Posición de cada palabra dentro de su línea, en orden de lectura
+        self.position = {}
+        for indices in self.lines.values():
+            indices.sort(key=lambda i: self.words[i].x0)
+            for pos, i in enumerate(indices):
+                self.position[i] = pos
+
+    def __len__(self):
+        return len(self.words)
+
+    def text(self):
+        """Texto de la página, una línea por renglón de Tesseract (o de pdftotext)."""
+        return "\n".join(" ".join(self.words[i].text for i in self.lines[line]) for line in sorted(self.lines))
+
+    def box(self, indices):
+        words = [self.words[i] for i in indices]
+        return (min(w.x0 for w in words), min(w.y0 for w in words),
+                max(w.x1 for w in words), max(w.y1 for w in words))
+
+    def find_runs(self, tokens):
+        """Índices de las palabras de cada aparición de los tokens normalizados, seguidos en una línea."""
+        runs = []
+        for i in self.by_token.get(tokens[0], ()):
+            line = self.lines[self.words[i].line]
+            pos = self.position[i]
+            run = line[pos:pos + len(tokens)]
+            if len(run) == len(tokens) and all(self.tokens[j] == t for j, t in zip(run, tokens)):
+                runs.append(run)
+        return runs
+
+    def find_labels(self, tokens, literal=None):
+        """
+        Cajas de las apariciones de la etiqueta (tokens normalizados seguidos en una línea), en orden de lectura.
+        Con `literal` (ver fold_label) las palabras deben además empezar con esos signos ("IVA:" y no
+        "IVA"); un signo suelto a continuación ("IVA" ":") cuenta como parte de la etiqueta.
+        """
+        boxes = []
+        for run in self.find_runs(tokens):
+            if literal:
+                text = fold_label("".join(self.words[i].text for i in run))
+                line = self.lines[self.words[run[-1]].line]
+                pos = self.position[run[-1]]
+                if not text.startswith(literal) and pos + 1 < len(line) and not self.tokens[line[pos + 1]]:
+                    run = run + [line[pos + 1]]
+                    text += fold_label(self.words[line[pos + 1]].text)
+                if not text.startswith(literal):
+                    continue
+            boxes.append(self.box(run))
+        return sorted(boxes, key=lambda b: (b[1], b[0]))
+
+    def in_band(self, y0, y1):
+        """Índices (sin repetir) de las palabras que tocan las franjas entre y0 y y1."""
+        seen = set()
+        for band in range(int(y0 // self.band), int(y1 // self.band) + 1):
+            seen.update(self.bands.get(band, ()))
+        return seen
+
+    def within(self, box):
+        """Palabras con el centro dentro de la caja, en orden de lectura."""
+        x0, y0, x1, y1 = box
+        found = [
+            i for i in self.in_band(y0, y1)
+            if x0 <= (self.words[i].x0 + self.words[i].x1) / 2 <= x1
+            and y0 <= (self.words[i].y0 + self.words[i].y1) / 2 <= y1
+        ]
+        return [i for row in self._rows(found) for i in row]
+
+    def right_of(self, label, reach=None):
+        """Palabras a la derecha de la etiqueta, en su misma línea visual, de la más cercana a la más lejana."""
+        x0, y0, x1, y1 = label
+        tolerance = (y1 - y0) * SAME_LINE_TOLERANCE
+        limit = x1 + reach * (y1 - y0) if reach else self.width
+        found = []
+        for i in self.in_band(y0 - tolerance, y1 + tolerance):
+            word = self.words[i]
+            center = (word.y0 + word.y1) / 2
+            if y0 - tolerance <= center <= y1 + tolerance and x1 - tolerance <= word.x0 <= limit:
+                found.append(i)
+        return sorted(found, key=lambda i: self.words[i].x0)
+
+    def below(self, label, lines=None):
+        """
+        Renglones debajo de la etiqueta (hasta `lines`), del más cercano al más lejano.
+        Cada renglón conserva solo las palabras que no terminan antes de la etiqueta.
+        """
+        x0, y0, x1, y1 = label
+        height = y1 - y0
+        bottom = y1 + (lines or BELOW_LINES) * height * LINE_SPACING
+        found = [
+            i for i in self.in_band(y1, bottom)
+            if self.words[i].y0 >= y1 - height * SAME_LINE_TOLERANCE
+            and self.words[i].y0 <= bottom
+            and self.words[i].x1 >= x0 - height
+        ]
+        return self._rows(found)[:lines or BELOW_LINES]
+
+    def _rows(self, indices):
+        """Agrupa palabras en renglones por su centro vertical; cada renglón ordenado por x."""
+        rows = []
+        center = None
+        for i in sorted(indices, key=lambda i: self.words[i].y0 + self.words[i].y1):
+            word = self.words[i]
+            middle = (word.y0 + word.y1) / 2
+            if center is None or middle - center > (word.y1 - word.y0) * SAME_LINE_TOLERANCE:
+                rows.append([])
+                center = middle
+            rows[-1].append(i)
+        for row in rows:
+            row.sort(key=lambda i: self.words[i].x0)
+        return rows
+
+    def match(self, indices, pattern):
+        """
+        Aplica el patrón del valor a las palabras unidas con espacios.
+        Retorna (match, caja de las palabras del valor) o None.
+        """
+        if not indices:
+            return None
+        parts, spans, offset = [], [], 0
+        for i in indices:
+            text = self.words[i].text
+            parts.append(text)
+            spans.append((offset, offset + len(text)))
+            offset += len(text) + 1
+        m = pattern.search(" ".join(parts))
+        if not m:
+            return None
+        start, end = m.span(1) if m.re.groups and m.group(1) is not None else m.span()
+        used = [i for i, (s, e) in zip(indices, spans) if s < end and e > start] or indices[:1]
+        return m, self.box(used)
+
+    def placed(self, left, top, width, height):
+        """Palabras de un recorte llevadas a la página completa (`left`, `top`: origen del recorte)."""
+        return PageWords(
+            [w._replace(x0=w.x0 + left, y0=w.y0 + top, x1=w.x1 + left, y1=w.y1 + top) for w in self.words],
+            width, height,
+        )
+
+    def to_dict(self):
+        return {"width": self.width, "height": self.height, "words": [list(w) for w in self.words]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([Word(*w) for w in data["words"]], data["width"], data["height"])
+
+
+def merge_pages(pages):
+    """Una PageWords con las palabras de varias de la misma página (zonas OCR); las líneas se renumeran."""
+    words, offset = [], 0
+    for page in pages:
+        words += [w._replace(line=w.line + offset) for w in page.words]
+        offset += max((w.line for w in page.words), default=-1) + 1
+    return PageWords(words, pages[0].width, pages[0].height)
+
+
+class DocumentWords:
+    """Palabras de todas las páginas; None en las páginas que no pasaron por OCR."""
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def page_numbers(self, page=None):
+        """Índices (desde 0) de las páginas disponibles: todas, o solo `page` (0 = primera, -1 = última)."""
+        if page is None:
+            candidates = range(len(self.pages))
+        else:
+            candidates = [page if page >= 0 else len(self.pages) + page]
+        return [p for p in candidates if 0 <= p < len(self.pages) and self.pages[p] is not None]
+
+    def to_dict(self):
+        return {"pages": [page.to_dict() if page is not None else None for page in self.pages]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(PageWords.from_dict(page) if page is not None else None for page in data["pages"])
+
+
+class SpatialRule:
+    """
+    Regla espacial de un campo: el valor es lo más cercano a la derecha de la
+    etiqueta, o en los renglones de abajo, que coincide con `pattern`.
+    La búsqueda queda acotada a las franjas de la etiqueta, sin recorrer el documento.
+
+    label: texto de la etiqueta; se compara por palabras completas, sin tildes
+        ("TOTAL" no coincide con "SUBTOTAL"); si trae signos ("IVA:"), deben estar.
+    direction: "right" o "below".
+    pattern: expresión del valor; si tiene grupos, el valor es el grupo 1.
+    page: 0 = primera, -1 = última; None = todas, en orden.
+    reach: alcance, en altos de la etiqueta ("right") o en renglones ("below").
+    """
+    def __init__(self, label, direction="right", pattern=r"\S+", flags=0, page=None, reach=None):
+        self.label = label
+        self.tokens = [token for token in (normalize_token(part) for part in label.split()) if token]
+        if not self.tokens:
+            raise ValueError(f"Etiqueta espacial vacía: {label!r}")
+        # Si la etiqueta trae signos ("IVA:"), también se exigen
+        self.literal = fold_label(label) if any(not c.isalnum() and not c.isspace() for c in label) else None
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Dirección espacial no válida: {direction!r} (use {', '.join(DIRECTIONS)})")
+        self.direction = direction
+        self.pattern = re.compile(pattern, flags)
+        self.page = page
+        self.reach = reach
+
+    @classmethod
+    def from_spec(cls, rule, flags=0):
+        return cls(
+            rule["label"],
+            direction=rule.get("direction", "right"),
+            pattern=rule.get("pattern", r"\S+"),
+            flags=flags,
+            page=rule.get("page"),
+            reach=rule.get("reach"),
+        )
+
+    def runs(self, page, label):
+        """Grupos de palabras donde puede estar el valor de una etiqueta: su renglón a la derecha o los de abajo."""
+        if self.direction == "right":
+            return [page.right_of(label, self.reach)]
+        return page.below(label, self.reach)
+
+    def anchored(self, page, box):
+        """True si las palabras de la caja están al alcance de alguna aparición de la etiqueta en la página."""
+        value = set(page.within(box))
+        if not value:
+            return False
+        for label in page.find_labels(self.tokens, self.literal):
+            reachable = {i for run in self.runs(page, label) for i in run}
+            if value <= reachable:
+                return True
+        return False
+
+    def find(self, words):
+        """(match, índice de página, caja del valor) para la primera etiqueta con valor, o None."""
+        for p in words.page_numbers(self.page):
+            page = words.pages[p]
+            for label in page.find_labels(self.tokens, self.literal):
+                for run in self.runs(page, label):
+                    hit = page.match(run, self.pattern)
+                    if hit:
+                        return hit[0], p, hit[1]
+        return None
+
+
+class FieldGeometry:
+    """
+    Posición aprendida del valor de cada campo, por proveedor (spec): página y
+    caja normalizada a [0, 1]. En los documentos siguientes del mismo proveedor
+    el valor se busca primero en esa caja, sin ubicar la etiqueta; si ahí no hay
+    nada que coincida con el patrón de la regla, se vuelve a la búsqueda por etiqueta.
+    Se guarda en JSON con escritura atómica, como el índice de plantillas.
+    Con `learning` en False solo se consulta (re-extracción del almacén OCR).
+    """
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "field_geometry.json")
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        # proveedor → campo → {"label", "page", "box"}
+        self.entries = {}
+        self.learning = True
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error leyendo la geometría de campos: {e}")
+                return
+            self._mtime = mtime
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Temporal único: varios procesos (workers de Flask) pueden guardar a la vez
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".field_geometry.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    def lookup(self, vendor, field, words, rule):
+        """
+        (match, índice de página, caja) del valor dentro de la caja aprendida, o None.
+        Solo vale si la etiqueta de la regla está junto al valor: en tiquetes de
+        largo variable la caja aprendida puede caer sobre otro monto.
+        """
+        self._reload_if_changed()
+        entry = self.entries.get(vendor, {}).get(field)
+        if not entry or entry.get("label") != rule.label:
+            return None
+        pages = words.page_numbers(entry["page"])
+        if not pages:
+            return None
+        page = words.pages[pages[0]]
+        x0, y0, x1, y1 = entry["box"]
+        # Más holgura horizontal: un monto más largo crece hacia un lado
+        margin = max(GEOMETRY_MARGIN, (x1 - x0) / 2)
+        box = (
+            (x0 - margin) * page.width, (y0 - GEOMETRY_MARGIN) * page.height,
+            (x1 + margin) * page.width, (y1 + GEOMETRY_MARGIN) * page.height,
+        )
+        hit = page.match(page.within(box), rule.pattern)
+        if not hit or not rule.anchored(page, hit[1]):
+            return None
+        return hit[0], pages[0], hit[1]
+
+    def learn(self, vendor, field, rule, words, page_index, box):
+        """Guarda la caja del valor encontrado por etiqueta, si cambió respecto a la aprendida."""
+        if not self.learning:
+            return
+        page = words.pages[page_index]
+        # Página relativa al final si la regla la declara así (p. ej. totales en la última)
+        if rule.page is not None and rule.page < 0:
+            page_index -= len(words.pages)
+        normalized = [
+            round(box[0] / page.width, 4), round(box[1] / page.height, 4),
+            round(box[2] / page.width, 4), round(box[3] / page.height, 4),
+        ]
+        with self._lock:
+            current = self.entries.get(vendor, {}).get(field)
+            if (current and current.get("label") == rule.label and current.get("page") == page_index
+                    and all(abs(a - b) <= GEOMETRY_MARGIN for a, b in zip(current["box"], normalized))):
+                return
+            self.entries.setdefault(vendor, {})[field] = {"label": rule.label, "page": page_index, "box": normalized}
+        try:
+            self.save()
+        except OSError as e:
+            print(f"No se pudo guardar la geometría de campos: {e}")
+
+
+_default_geometry = None
+_default_lock = threading.Lock()
+
+
+def get_default_geometry():
+    """Geometría compartida; FIELD_GEOMETRY_PATH cambia el archivo ("off" la desactiva)."""
+    global _default_geometry
+    path = os.environ.get("FIELD_GEOMETRY_PATH")
+    if path and path.lower() in ("off", "0", "false", "none"):
+        return None
+    with _default_lock:
+        if _default_geometry is None:
+            _default_geometry = FieldGeometry(path)
+        return _default_geometry